@@ -41,6 +41,7 @@ INSTALLED_APPS  = [
 ]
 
 MIDDLEWARE      = [
+    'ect_tool.ut_timing.server_timing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +83,57 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+# The 'survival' alias stores the ECT analysis results. The keys contain
+# the 'survival.csv' fingerprint, so the entries never expire. Use a
+# shared backend (file based, Redis, Memcached) to share the results
+# between workers and with the 'warm_survival_cache' command.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'survival': {
+        'BACKEND':  'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ect-survival',
+        'TIMEOUT':  None,
+    },
+}
+
+# Precompute all the survival analyses in a background thread when
+# the application starts.
+ECT_WARM_CACHE_ON_STARTUP = False
+
+# Time the stages of each request (sort, logrank, figure, serialization,
+# rendering...) and send them as a 'Server-Timing' header and as log
+# lines of the 'ect_tool.timing' logger. ECT_STAGE_METRICS also keeps
+# histograms of them, served at /ect_tool/metrics/.
+ECT_STAGE_TIMING    = False
+ECT_STAGE_METRICS   = False
+
+# Draw the survival and population figures in the browser: the EC Tool
+# page is loaded once, and its form gets the survival analyses from the
+# JSON API. Without JavaScript the form is still sent to the server.
+ECT_CLIENT_RENDERING = False
+
+# Serve the EC Tool form and the survival API with async views, for ASGI
+# servers like uvicorn. The missing analyses are computed by a pool of
+# ECT_ASYNC_WORKERS processes (None: one per CPU), and concurrent
+# requests for the same analysis share one computation. When
+# ECT_ASYNC_QUEUE_LIMIT different analyses are being computed, new ones
+# are answered with a 503 status.
+ECT_ASYNC_VIEWS         = False
+ECT_ASYNC_WORKERS       = None
+ECT_ASYNC_QUEUE_LIMIT   = 16
+
+# Directory with the survival analyses written by the
+# 'precompute_survival' command. The results missing from the cache are
+# read from it before being computed. None: not used.
+ECT_ARTIFACTS_DIR       = None
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
+import threading
 
 
 class EctToolConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ect_tool'
+
+    def ready(self):
+        # Precompute the survival analyses without delaying the startup:
+        if getattr(settings, 'ECT_WARM_CACHE_ON_STARTUP', False):
+            from . import ut_cache
+            threading.Thread(target=ut_cache.warm_cache, name='ect-cache-warmup', daemon=True).start()
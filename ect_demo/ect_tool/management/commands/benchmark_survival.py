@@ -0,0 +1,76 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    Command to benchmark the ECT (Demo) survival request path.
+#
+# - Usage:
+#
+#   python3 manage.py benchmark_survival [--size 10000] [--filter PATTERN]
+#                                        [--repeat 3] [--baseline FILE]
+#                                        [--threshold 0.25] [--save]
+#
+# - Without '--save' the results are compared to the baseline file, and
+#   the command fails when there is no baseline, a case is missing from
+#   it, or a case is slower than the threshold allows. With '--save' the
+#   results are written to it, keeping its other cases.
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    pathlib                     import  Path
+from    django.core.management.base import  BaseCommand, CommandError
+from    ect_tool                    import  ut_benchmark    as  bench
+
+
+class Command(BaseCommand):
+    help = "Benchmark every stage of the survival request path against a JSON baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size',       action='append', type=int,
+                            help=f"Patients of a scaled cohort. Can be repeated. Default: only the TCGA dataset. "
+                                 f"Registry sizes: {', '.join(str(size) for size in bench.SCALED_COHORT_SIZES)}.")
+        parser.add_argument('--filter',     default='*',
+                            help="Pattern of the case names, like 'at_risk_table/tcga/*'. Default: all.")
+        parser.add_argument('--repeat',     type=int, default=3,
+                            help='Number of calls of each case, the best time is kept. Default: 3.')
+        parser.add_argument('--baseline',   type=Path, default=bench.BASELINE_PATH,
+                            help=f"JSON baseline file. Default: {bench.BASELINE_PATH}")
+        parser.add_argument('--threshold',  type=float, default=bench.REGRESSION_THRESHOLD,
+                            help=f"Allowed slowdown fraction. Default: {bench.REGRESSION_THRESHOLD}.")
+        parser.add_argument('--save',       action='store_true',
+                            help='Write the results to the baseline file instead of comparing them.')
+
+    def handle(self, *args, **options):
+        def report(name: str, seconds: float):
+            self.stdout.write(f"{name:<60} {seconds * 1000:>10.2f} ms")
+
+        results: dict = bench.run_benchmarks(bench.benchmark_cases(options['size'], options['filter']),
+                                             options['repeat'], report)
+        if not results:
+            raise CommandError(f"No benchmark case matches '{options['filter']}'.")
+
+        if options['save']:
+            path: Path = bench.save_baseline(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline with {len(results)} cases written to {path}"))
+            return
+
+        # Nothing to compare with is a failure, not a pass:
+        if not options['baseline'].is_file():
+            raise CommandError(f"No baseline at {options['baseline']}, run with --save to create it.")
+
+        baseline: dict      = bench.load_baseline(options['baseline'])
+        missing: list       = bench.missing_from_baseline(results, baseline)
+        for name in missing:
+            self.stdout.write(self.style.ERROR(f"{name}: not in the baseline"))
+        if missing:
+            raise CommandError(f"{len(missing)} benchmark cases are not in {options['baseline']}, "
+                               f"run with --save to add them.")
+
+        regressions: list   = bench.compare_to_baseline(results, baseline, options['threshold'])
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(f"{regression['name']}: {regression['baseline'] * 1000:.2f} ms -> "
+                                               f"{regression['current'] * 1000:.2f} ms (x{regression['ratio']:.2f})"))
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmark cases are slower than the baseline.")
+
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} benchmark cases within the baseline threshold."))
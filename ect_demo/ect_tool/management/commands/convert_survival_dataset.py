@@ -0,0 +1,36 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    Command to convert the survival dataset to columnar files.
+#
+# - Usage:
+#
+#   python3 manage.py convert_survival_dataset [--output DIRECTORY]
+#
+# - Writes 'survival.csv' as one '.npy' file per column plus a
+#   'manifest.json' file. Run it again after changing 'survival.csv',
+#   until then the CSV file is read instead.
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    pathlib                     import  Path
+from    django.core.management.base import  BaseCommand
+from    ect_tool                    import  tcga_read_csv   as  tcga
+from    ect_tool                    import  ut_constants    as  cns
+
+
+class Command(BaseCommand):
+    help = "Convert 'survival.csv' to the memory-mapped columnar dataset format."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=Path, default=None,
+                            help=f"Destination folder. Default: {tcga.COLUMNAR_PATH}")
+
+    def handle(self, *args, **options):
+        # Taken before reading, so a file replaced meanwhile is not current:
+        fingerprint     = tcga.survival_file_fingerprint()
+        # Store the columns with the schema types, so loading needs no conversion:
+        df              = tcga.apply_survival_schema(tcga.read_survival_csv(), cns.SURVIVAL_SCHEMA)
+        directory: Path = tcga.write_columnar_survival(df, directory=options['output'], source_fingerprint=fingerprint)
+        self.stdout.write(self.style.SUCCESS(f"Columnar survival dataset written to {directory}"))
@@ -0,0 +1,56 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    Command to generate synthetic ECT (Demo) survival cohorts.
+#
+# - Usage:
+#
+#   python3 manage.py generate_synthetic_cohort --patients 1000000
+#                                               --output cohort.csv
+#                                               [--format csv|columnar]
+#                                               [--seed 0] [--config FILE]
+#
+# - '--config' is a JSON file with any 'ut_synthetic.SYNTHETIC_CONFIG'
+#   keys to change, like the 'hazard_ratios' of some categories.
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    pathlib                     import  Path
+from    django.core.management.base import  BaseCommand, CommandError
+from    ect_tool                    import  ut_synthetic    as  syn
+import  json
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic survival cohort with the 'survival.csv' columns, as CSV or columnar files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients',       type=int, required=True,
+                            help='Number of patients of the cohort.')
+        parser.add_argument('--output',         type=Path, required=True,
+                            help='CSV file, or folder of the columnar files.')
+        parser.add_argument('--format',         choices=['csv', 'columnar'], default='csv',
+                            help='Output format. Default: csv.')
+        parser.add_argument('--seed',           type=int, default=0,
+                            help='Random generator seed. Default: 0.')
+        parser.add_argument('--chunk-size',     type=int, default=syn.CHUNK_SIZE,
+                            help=f"Patients generated at once. Default: {syn.CHUNK_SIZE}.")
+        parser.add_argument('--censoring-rate', type=float, default=None,
+                            help=f"Probability of random censoring. Default: {syn.SYNTHETIC_CONFIG['censoring_rate']}.")
+        parser.add_argument('--config',         type=Path, default=None,
+                            help='JSON file with the generator parameters to change.')
+
+    def handle(self, *args, **options):
+        changes: dict = json.loads(options['config'].read_text()) if options['config'] else {}
+        if options['censoring_rate'] is not None:
+            changes['censoring_rate'] = options['censoring_rate']
+
+        try:
+            config: dict = syn.synthetic_config(**changes)
+        except (KeyError, ValueError) as error:
+            raise CommandError(error)
+
+        write = syn.write_cohort_csv if options['format'] == 'csv' else syn.write_cohort_columnar
+        path: Path = write(options['output'], options['patients'], options['seed'], config, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Synthetic cohort of {options['patients']} patients written to {path}"))
@@ -0,0 +1,67 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    Command to write the ECT (Demo) survival analyses to disk.
+#
+# - Usage:
+#
+#   python3 manage.py precompute_survival [--output artifacts]
+#                                     [--mode os] [--category grade]
+#                                     [--facets] [--kind context]
+#                                     [--processes 4]
+#
+# - The analyses are computed by a pool of processes and written to a
+#   content-addressed artifact directory with 'ut_artifacts'. Point the
+#   ECT_ARTIFACTS_DIR setting to it to serve them without computing.
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    concurrent.futures          import  ProcessPoolExecutor
+from    django.core.management.base import  BaseCommand, CommandError
+from    ect_tool                    import  ut_artifacts    as  artifacts
+from    ect_tool                    import  ut_cache        as  cache
+from    ect_tool                    import  ut_constants    as  cns
+
+
+class Command(BaseCommand):
+    help = "Write every (mode, clinical category) survival analysis to an artifact directory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output',     default=None,
+                            help='Artifact directory. Default: the ECT_ARTIFACTS_DIR setting.')
+        parser.add_argument('--mode',       action='append', choices=list(cns.SURVIVAL_MODES.keys()),
+                            help='Survival mode to precompute. Can be repeated. Default: all.')
+        parser.add_argument('--category',   action='append', choices=cns.CATEGORIES,
+                            help='Clinical category to precompute. Can be repeated. Default: all.')
+        parser.add_argument('--facets',     action='store_true',
+                            help='Also precompute each category split by every other category.')
+        parser.add_argument('--kind',       action='append', choices=list(cache.COMPUTE_FUNCTIONS.keys()),
+                            help='Result to precompute, the page context or the API payload. Default: both.')
+        parser.add_argument('--processes',  type=int, default=None,
+                            help='Number of processes to compute the analyses with. Default: one per CPU.')
+
+    def handle(self, *args, **options):
+        output  = options['output'] or artifacts.artifacts_dir()
+        if output is None:
+            raise CommandError("Give an --output directory or set ECT_ARTIFACTS_DIR.")
+
+        modes       = options['mode']       or list(cns.SURVIVAL_MODES.keys())
+        categories  = options['category']   or cns.CATEGORIES
+        kinds       = options['kind']       or list(cache.COMPUTE_FUNCTIONS.keys())
+        specs       = [(kind, mode, clinical_cat, facet)
+                       for kind in kinds
+                       for mode in modes
+                       for clinical_cat in categories
+                       for facet in [None] + (cns.CATEGORIES if options['facets'] else [])
+                       if cache.is_valid_analysis(mode, clinical_cat, facet)]
+
+        # Read before starting the pool, so the workers share the dataset:
+        cache.current_survival()
+
+        with ProcessPoolExecutor(max_workers = options['processes']) as executor:
+            results = list(executor.map(cache.compute_result, *zip(*specs)))
+
+        count: int  = artifacts.write_artifacts(output, results)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} survival analyses to {output} "
+                                             f"({count} new files)."))
@@ -0,0 +1,35 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    Command to precompute the ECT (Demo) survival analyses.
+#
+# - Usage:
+#
+#   python3 manage.py warm_survival_cache [--mode os] [--category grade]
+#                                     [--processes 4]
+#
+# - Only useful across processes when the 'survival' cache alias uses a
+#   shared backend (see CACHES in settings.py).
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    django.core.management.base import  BaseCommand
+from    ect_tool                    import  ut_cache        as  cache
+from    ect_tool                    import  ut_constants    as  cns
+
+
+class Command(BaseCommand):
+    help = "Precompute every (mode, clinical category) survival analysis into the 'survival' cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode',       action='append', choices=list(cns.SURVIVAL_MODES.keys()),
+                            help='Survival mode to precompute. Can be repeated. Default: all.')
+        parser.add_argument('--category',   action='append', choices=cns.CATEGORIES,
+                            help='Clinical category to precompute. Can be repeated. Default: all.')
+        parser.add_argument('--processes',  type=int, default=None,
+                            help='Number of processes to compute the analyses with. Default: this process.')
+
+    def handle(self, *args, **options):
+        count: int = cache.warm_cache(options['mode'], options['category'], options['processes'])
+        self.stdout.write(self.style.SUCCESS(f"Cached {count} survival analyses."))
@@ -7,44 +7,376 @@
 #               - Survival curve.
 #               - At risk by time table.
 #               - Population bar plot.
+#               - Hazard ratios forest plot and table.
 #
 #   - plotly_survival(): main function for survival curve analyisis.
-#   - kaplan_meier_fitter_generator(): survival analysis for all dataset entries.
+#   - km_survival_estimates(): Kaplan-Meier estimate and logrank test.
+#   - km_faceted_survival_estimates(): Kaplan-Meier estimates and
+#     logrank tests of each facet.
+#   - category_codes(): integer codes of a clinical category column.
+#   - category_counts(): patients of each clinical category value.
+#   - masked_codes(): group codes of a cohort.
+#   - kaplan_meier_fitter_generator(): lifelines survival analysis for all
+#     dataset entries (reference for 'ut_kaplan_meier').
+#   - register_figure_template(): 'plotly.io' template of the figures.
+#   - typed_array(): plotly.js typed array of trace values.
+#   - figure_div(): figure as an HTML 'div' tag.
+#   - figure_json(): figure as plotly.js JSON data.
+#   - client_figure_settings(): settings of the client side figures.
+#   - survival_axes(): layout axes of the facets subplots.
+#   - facet_subplots(): subplot axes of each facet.
+#   - survival_annotations(): facet titles and logrank p-values.
+#   - survival_traces(): Kaplan-Meier curves traces.
 #   - survival_figure_generator(): survival analysis by clinical category.
-#   - ceate_at_risk_values_list(): survival analysis by gene mRNA expression.
-#   - at_risk_table_generator(): filter patient ids from survival 
-#     dataframe.
+#   - ceate_at_risk_values_list(): at risk by time table row of a group.
+#   - at_risk_table_generator(): at risk by time table of a category.
 #   - create_counting_bar_plot(): population bar plot.
+#   - hazard_ratio_table_generator(): hazard ratios table of a Cox
+#     analysis.
+#   - create_forest_plot(): hazard ratios forest plot of a Cox analysis.
 #   - kme_dict_generator(): TEST function.
 #
 # - Other modules used are:
 #
 #   - ut_constants
+#   - ut_kaplan_meier
 #   - ut_stats
+#   - ut_timing
 #
 # =====================================================================
 # IMPORTS
 # =====================================================================
 
-from    lifelines                   import  KaplanMeierFitter
-from    sksurv.nonparametric        import  kaplan_meier_estimator
-from    plotly.graph_objs           import  Figure
-from    plotly.offline              import  plot
-import  plotly.express              as      px
+from    typing                      import  TYPE_CHECKING
+from    plotly.graph_objs           import  Bar, Figure, Scatter
+from    plotly.graph_objs.layout    import  Template
+import  plotly.io                   as      pio
+import  base64
+import  numpy                       as      np
 import  pandas                      as      pd
-from    pandas                      import  concat
-from    .                           import  ut_constants as cns
-from    .                           import  ut_stats     as stats
+from    .                           import  ut_constants    as cns
+from    .                           import  ut_kaplan_meier as km
+from    .                           import  ut_stats        as stats
+from    .                           import  ut_timing       as timing
+
+# lifelines and scikit-survival are only imported by the functions
+# using them, they are not needed to serve the survival plots:
+if TYPE_CHECKING:
+    from    lifelines               import  KaplanMeierFitter
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Position of the logrank p-value annotation, as fractions of the width
+# and height of its subplot:
+P_VALUE_POSITION:   tuple   = (0.05, 0.05)
+
+P_VALUE_FONT:       dict    = dict( family  = "sans serif",
+                                    size    = 15,
+                                    color   = "black")
+
+# Colors of the groups, in the legend order:
+CURVE_COLORS:       tuple   = ('blue', 'red', 'green', 'purple', 'darkorange')
+
+# Space between the facets subplots, and on the right of the facet rows
+# for their titles, as fractions of the figure:
+FACET_SPACING:      float   = 0.03
+FACET_TITLE_SPACE:  float   = 0.02
+
+# Trace values sent to plotly.js as typed arrays, and their type. Single
+# precision keeps 7 significant digits, more than the figures show:
+TYPED_ARRAY_KEYS:   tuple   = ('x', 'y')
+FIGURE_ARRAY_DTYPE: str     = 'f4'
+
+# Layout keys of the 'plotly' template used by the 2D figures, the
+# polar, geo, 3D and colorscale defaults are left out:
+CARTESIAN_TEMPLATE_KEYS: tuple  = ('autotypenumbers', 'colorway', 'font', 'hoverlabel', 'paper_bgcolor', 'plot_bgcolor',
+                                   'xaxis', 'yaxis', 'shapedefaults', 'annotationdefaults', 'title')
+
+# Figures JSON is written by 'orjson', much faster with long arrays:
+pio.json.config.default_engine  = 'orjson'
+
+# =====================================================================
+# FIGURE TEMPLATES
+# =====================================================================
+
+# Register a figure template
+# ---------------------------------------------------------------------
+def register_figure_template(name:      str,
+                             layout:    dict,
+                             data:      dict[str:dict])->str:
+    '''
+    Register a 'plotly.io' template with the 2D part of the 'plotly'
+    template updated with the 'layout', and the 'data' defaults of each
+    trace type. Every axis of a figure, like the ones of each facet,
+    takes the 'xaxis' and 'yaxis' defaults of the template.
+
+    The template is checked once, here, instead of setting the same
+    layout properties on every figure.
+
+    ## Parameters:
+        - name (str): template name, to use as 'layout.template'.
+        - layout (dict): layout defaults.
+        - data (dict[str:dict]): trace type as key, and the trace
+        defaults as value.
+
+    ## Return:
+        - name (str): registered template name.
+    '''
+    base:       dict        = pio.templates['plotly'].to_plotly_json()
+    template:   Template    = Template(layout   = {key: base['layout'][key] for key in CARTESIAN_TEMPLATE_KEYS},
+                                       data     = {trace_type: [dict(base['data'][trace_type][0], **defaults)]
+                                                   for trace_type, defaults in data.items()})
+    template.layout.update(layout)
+    pio.templates[name]     = template
+
+    return name
+
+
+# Survival figures template: white background, framed axes and step
+# lines with a mark on each censored time:
+SURVIVAL_TEMPLATE:      str     = register_figure_template('ect_survival',
+                                    layout  = dict( hovermode       = "x unified",
+                                                    legend          = dict( title           = dict(text = 'Legend'),
+                                                                            orientation     = 'v',
+                                                                            tracegroupgap   = 0,
+                                                                            font            = dict(size= 15)),
+                                                    title           = dict( x       = 0.05,
+                                                                            font    = dict( family  = "Raleway, sans-serif",
+                                                                                            size    = 20)),
+                                                    margin          = dict(t = 60),
+                                                    paper_bgcolor   = 'rgb(255,255,255)',
+                                                    plot_bgcolor    = 'rgb(255, 255, 255)',
+                                                    xaxis           = dict( title       = "Months",
+                                                                            hoverformat = '.2~f',
+                                                                            showline    = True,
+                                                                            linewidth   = 2,
+                                                                            linecolor   = 'black',
+                                                                            mirror      = True),
+                                                    yaxis           = dict( range       = [0, 1.05],
+                                                                            showline    = True,
+                                                                            linewidth   = 2,
+                                                                            linecolor   = 'black',
+                                                                            mirror      = True)),
+                                    data    = {'scatter':   dict(   mode            = 'lines+markers',
+                                                                    line            = dict(width=1, shape='vh'),
+                                                                    marker          = dict(size=6, symbol="line-ns-open"),
+                                                                    hovertemplate   = "%{y:.3f}")})
+
+# Population figures template:
+POPULATION_TEMPLATE:    str     = register_figure_template('ect_population',
+                                    layout  = dict( showlegend      = True,
+                                                    legend          = dict( title           = dict(text = 'Legend'),
+                                                                            tracegroupgap   = 0),
+                                                    title           = dict( x       = 0.05,
+                                                                            font    = dict(family = "sans-serif")),
+                                                    barmode         = 'relative',
+                                                    bargap          = 0,
+                                                    font            = dict(size = 15),
+                                                    margin          = dict(t = 60),
+                                                    xaxis           = dict( showgrid    = False,
+                                                                            tickangle   = 30),
+                                                    yaxis           = dict( showgrid    = True,
+                                                                            title       = 'count')),
+                                    data    = {'bar':       dict(texttemplate = '%{y}')})
+
+# Forest plot template: hazard ratios on a framed logarithmic axis, with
+# the 'no effect' hazard ratio of 1 marked:
+FOREST_TEMPLATE:        str     = register_figure_template('ect_forest',
+                                    layout  = dict( legend          = dict(title = dict(text = 'Legend')),
+                                                    title           = dict( x       = 0.05,
+                                                                            font    = dict( family  = "Raleway, sans-serif",
+                                                                                            size    = 20)),
+                                                    margin          = dict(t = 60),
+                                                    paper_bgcolor   = 'rgb(255,255,255)',
+                                                    plot_bgcolor    = 'rgb(255, 255, 255)',
+                                                    xaxis           = dict( title       = 'Hazard ratio (95% CI)',
+                                                                            type        = 'log',
+                                                                            showline    = True,
+                                                                            linecolor   = 'black',
+                                                                            mirror      = True),
+                                                    yaxis           = dict( autorange   = 'reversed',
+                                                                            showline    = True,
+                                                                            linecolor   = 'black',
+                                                                            mirror      = True),
+                                                    shapes          = [dict(type    = 'line',
+                                                                            x0      = 1,
+                                                                            x1      = 1,
+                                                                            xref    = 'x',
+                                                                            y0      = 0,
+                                                                            y1      = 1,
+                                                                            yref    = 'paper',
+                                                                            line    = dict(color = 'grey', dash = 'dash'))]),
+                                    data    = {'scatter':   dict(   mode            = 'markers',
+                                                                    marker          = dict(size=10, symbol='square'),
+                                                                    hovertemplate   = "%{y}<br>Hazard ratio=%{x:.2f}<extra></extra>")})
+
+# =====================================================================
+# FIGURE OUTPUT
+# =====================================================================
+
+# Typed array of a trace
+# ---------------------------------------------------------------------
+def typed_array(values: np.ndarray)->dict:
+    '''
+    Encode numeric trace values as a plotly.js typed array: base64 bytes
+    of 'FIGURE_ARRAY_DTYPE' numbers, instead of a JSON list of decimal
+    numbers.
+
+    ## Parameters:
+        - values (np.ndarray): numeric values of a trace property.
+
+    ## Return:
+        - typed_array (dict): dictionary with the 'dtype' and 'bdata'
+        keys read by plotly.js.
+    '''
+    array:      np.ndarray  = np.ascontiguousarray(values, dtype=f"<{FIGURE_ARRAY_DTYPE}")
+
+    return {'dtype':    FIGURE_ARRAY_DTYPE,
+            'bdata':    base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+# Figure HTML 'div'
+# ---------------------------------------------------------------------
+def figure_div(figure:  Figure,
+               config:  dict    = cns.TOOLBAR_CONFIG)->str:
+    '''
+    Output a figure as an HTML 'div' tag, like
+    'plot(figure, output_type="div", include_plotlyjs=False)' but
+    faster and smaller: the figure is not checked again, the numeric
+    arrays of the traces are sent as typed arrays, and the JSON is
+    written by the 'orjson' engine.
+
+    ## Parameters:
+        - figure (Figure): plotly figure.
+        - config (dict): plotly.js figure configuration.
+
+    ## Return:
+        - div (str): figure embedded into an html 'div' tag. plotly.js is
+        served once as a static file by the 'base_ect.html' template.
+    '''
+    return pio.to_html(figure_json(figure), config=config, include_plotlyjs=False, full_html=False, validate=False)
+
+
+# Figure JSON data
+# ---------------------------------------------------------------------
+def figure_json(figure: Figure)->dict:
+    '''
+    Output a figure as its plotly.js JSON data, with the numeric arrays
+    of the traces as typed arrays.
+
+    ## Parameters:
+        - figure (Figure): plotly figure.
+
+    ## Return:
+        - figure_dict (dict): 'data' and 'layout' of the figure, JSON
+        serializable.
+    '''
+    figure_dict:    dict    = figure.to_plotly_json()
+
+    for trace in figure_dict['data']:
+        for key in TYPED_ARRAY_KEYS:
+            values          = trace.get(key)
+            if isinstance(values, np.ndarray) and values.dtype.kind in 'fiu':
+                trace[key]  = typed_array(values)
+
+    return figure_dict
+
+
+# Client side rendering settings
+# ---------------------------------------------------------------------
+def client_figure_settings()->dict:
+    '''
+    Return the settings 'static/ect_tool/js/survival_plots.js' needs to
+    draw the same figures as this module from the survival API data: the
+    figure templates, colors, facets spacing, p-value annotation, toolbar
+    configuration and titles.
+
+    ## Return:
+        - settings (dict): JSON serializable settings.
+    '''
+    settings:   dict    = { 'templates':        {   'survival':     pio.templates[SURVIVAL_TEMPLATE].to_plotly_json(),
+                                                    'population':   pio.templates[POPULATION_TEMPLATE].to_plotly_json()},
+                            'curve_colors':     list(CURVE_COLORS),
+                            'facet_spacing':    FACET_SPACING,
+                            'p_value_position': list(P_VALUE_POSITION),
+                            'p_value_font':     P_VALUE_FONT,
+                            'toolbar_config':   cns.TOOLBAR_CONFIG,
+                            'modes':            cns.SURVIVAL_MODES,
+                            'categories':       cns.CATEGORIES_DICT}
+
+    return settings
+
 
 # =====================================================================
 # REUSABLE FUNCTIONS FOR KAPLAN-MEIER ANALYSIS
 # =====================================================================
 
+# Integer codes of a category column
+# ---------------------------------------------------------------------
+def category_codes(entry_column: pd.Series)->tuple[np.ndarray, list]:
+    '''
+    Return the integer codes and the labels of a clinical category
+    column. 'pd.Categorical' columns from the 'SURVIVAL_SCHEMA' already
+    have them, other columns are factorized.
+
+    ## Parameters:
+        - entry_column (pd.Series): clinical category column.
+
+    ## Returns a tuple of:
+        - codes (np.ndarray): label position of each row, -1 if missing.
+        - labels (list): category labels.
+    '''
+    if isinstance(entry_column.dtype, pd.CategoricalDtype):
+        return (entry_column.cat.codes.to_numpy(), list(entry_column.cat.categories))
+
+    codes, labels = pd.factorize(entry_column, sort=True)
+
+    return (codes, list(labels))
+
+
+# Patients of each value of a category column
+# ---------------------------------------------------------------------
+def category_counts(entry_column:   pd.Series,
+                    rows:           np.ndarray|None = None)->pd.Series:
+    '''
+    Count the patients of each clinical category value, like
+    'value_counts(sort=False)', only of the 'rows' cohort if given.
+
+    ## Parameters:
+        - entry_column (pd.Series): clinical category column.
+        - rows (np.ndarray|None): Optional parameter. True for the rows
+        of the cohort, see 'ut_cohort.cohort_mask()'.
+
+    ## Return:
+        - counts (pd.Series): patients by category label.
+    '''
+    codes, labels   = category_codes(entry_column)
+    codes           = masked_codes(codes, rows)
+
+    return pd.Series(np.bincount(codes[codes >= 0], minlength=len(labels)), index=labels)
+
+
+# Group codes of a cohort
+# ---------------------------------------------------------------------
+def masked_codes(codes: np.ndarray,
+                 rows:  np.ndarray|None)->np.ndarray:
+    '''
+    Return the category 'codes' with -1, the missing value code skipped
+    by 'ut_kaplan_meier', for the rows out of the 'rows' cohort.
+    '''
+    if rows is None:
+        return codes
+
+    return np.where(rows, codes, -1)
+
+
 # Generator of KaplanMeierFitter object
 # ---------------------------------------------------------------------
 def kaplan_meier_fitter_generator(entry_df:     pd.DataFrame,
                                   entry_label:  str,
-                                  mode:         str)->KaplanMeierFitter:
+                                  mode:         str)->'KaplanMeierFitter':
     '''
     Generates a new 'KaplanMeierFitter' object for the 'entry_df', labeled
     with the value from 'entry_label' parameter. Fits the model with the
@@ -61,6 +393,8 @@ def kaplan_meier_fitter_generator(entry_df:     pd.DataFrame,
         object.
     '''
 
+    from lifelines import KaplanMeierFitter
+
     months_column_name: str = f"{mode}_months"
     status_column_name: str = f"{mode}_status"
 
@@ -74,21 +408,192 @@ def kaplan_meier_fitter_generator(entry_df:     pd.DataFrame,
     return new_kmf_object
 
 
+# Subplot axes of the facets
+# ---------------------------------------------------------------------
+def survival_axes(facets_amount:    int,
+                  by_row:           bool    = False)->dict:
+    '''
+    Create the layout axes of a survival figure with 'facets_amount'
+    subplots side by side, or one above the other. The first facet uses
+    the 'xaxis' and 'yaxis', the next ones 'xaxis2' and 'yaxis2'... and
+    they all share the range of the first facet. Their style comes from
+    the 'ect_survival' template.
+
+    ## Parameters:
+        - facets_amount (int): number of subplots, 1 without facets.
+        - by_row (bool): True if the facets are rows, False if columns.
+
+    ## Return:
+        - axes (dict): layout axes, with the axis name as key.
+    '''
+    # A cohort without patients has no facets, but keeps the empty axes:
+    facets_amount           = max(facets_amount, 1)
+    size:           float   = (1 - FACET_SPACING * (facets_amount - 1)) / facets_amount
+    axes:           dict    = {}
+
+    for index in range(facets_amount):
+        suffix:     str     = str(index + 1) if index else ""
+        start:      float   = index * (size + FACET_SPACING)
+        xaxis:      dict    = dict(anchor = f"y{suffix}")
+        yaxis:      dict    = dict(anchor = f"x{suffix}")
+
+        if by_row:
+            # Rows go from top to bottom, the facet titles on their right:
+            xaxis['domain']     = [0, 1 - FACET_TITLE_SPACE]
+            yaxis['domain']     = [1 - start - size, 1 - start]
+            xaxis['showticklabels'] = index == facets_amount - 1
+        else:
+            xaxis['domain']     = [start, start + size]
+            yaxis['domain']     = [0, 1]
+            yaxis['showticklabels'] = index == 0
+
+        if index:
+            xaxis['matches']    = 'x'
+            yaxis['matches']    = 'y'
+        else:
+            yaxis['title']      = "Survival probability"
+        axes[f"xaxis{suffix}"]  = xaxis
+        axes[f"yaxis{suffix}"]  = yaxis
+
+    return axes
+
+
+# Subplot axes of each facet
+# ---------------------------------------------------------------------
+def facet_subplots(survival_fig:   Figure,
+                   facets_amount:  int)->list[tuple]:
+    '''
+    Return the layout axes of each facet of a 'survival_fig' made by
+    'survival_figure_generator()', in the facets order.
+
+    ## Parameters:
+        - survival_fig (Figure): faceted survival figure.
+        - facets_amount (int): number of facets.
+
+    ## Return:
+        - subplots (list[tuple]): one (xaxis, yaxis) pair of layout
+        objects for each facet.
+    '''
+    suffixes:   list[str]   = [str(index + 1) if index else "" for index in range(facets_amount)]
+
+    return [(survival_fig.layout[f"xaxis{suffix}"], survival_fig.layout[f"yaxis{suffix}"]) for suffix in suffixes]
+
+
+# Logrank p-value annotations
+# ---------------------------------------------------------------------
+def survival_annotations(survival_fig:      Figure,
+                         logrank_p_value:   str|dict,
+                         facet_col_groups:  list|None   = None,
+                         facet_row_groups:  list|None   = None)->list[dict]:
+    '''
+    Create the annotations of a survival figure: the title of each facet
+    and a logrank p-value annotation placed at the same position inside
+    each subplot. The positions come from the axes domains of the figure
+    layout, so they fit any number of facets.
+
+    ## Parameters:
+        - survival_fig (Figure): survival figure.
+        - logrank_p_value (str|dict): logrank p-value, or a dictionary
+        with the p-value of each facet.
+        - facet_col_groups (list|None):  Optional parameter. Subcategories
+        of the facet columns.
+        - facet_row_groups (list|None):  Optional parameter. Subcategories
+        of the facet rows.
+
+    ## Return:
+        - annotations (list[dict]): all the annotations of the figure.
+    '''
+    facets:         list        = facet_col_groups if facet_col_groups != None else facet_row_groups
+    annotations:    list[dict]  = []
+
+    if facets != None:
+        positions:  list        = [(facet, xaxis.domain, yaxis.domain)
+                                   for facet, (xaxis, yaxis) in zip(facets, facet_subplots(survival_fig, len(facets)))]
+        p_values:   dict        = logrank_p_value
+
+        # Facet titles, over the columns or on the right of the rows:
+        for facet, x_domain, y_domain in positions:
+            if facet_col_groups != None:
+                title:  dict    = dict(x = (x_domain[0] + x_domain[1]) / 2, y = y_domain[1],
+                                       xanchor = "center", yanchor = "bottom")
+            else:
+                title:  dict    = dict(x = x_domain[1], y = (y_domain[0] + y_domain[1]) / 2,
+                                       xanchor = "left", yanchor = "middle", textangle = 90)
+            annotations.append(dict(title, xref = "paper", yref = "paper", text = facet, showarrow = False))
+    else:
+        positions:  list        = [(None, (0, 1), (0, 1))]
+        p_values:   dict        = {None: logrank_p_value}
+
+    for facet, x_domain, y_domain in positions:
+        annotations.append(dict(xref        = "paper",
+                                yref        = "paper",
+                                x           = x_domain[0] + P_VALUE_POSITION[0] * (x_domain[1] - x_domain[0]),
+                                y           = y_domain[0] + P_VALUE_POSITION[1] * (y_domain[1] - y_domain[0]),
+                                borderpad   = 0,
+                                text        = f"logrank pValue: {p_values[facet]}",
+                                showarrow   = False,
+                                font        = P_VALUE_FONT))
+
+    return annotations
+
+
+# Survival curves traces
+# ---------------------------------------------------------------------
+def survival_traces(facets_km_dict: dict[str:dict],
+                    legend_groups:  list)->list[Scatter]:
+    '''
+    Create a step line trace for the Kaplan-Meier curve of each group
+    and facet, straight from the estimate arrays. Each group has the
+    same color and a single legend entry in all the facets.
+
+    ## Parameters:
+        - facets_km_dict (dict[str:dict]): the 'groups_km_dict' of each
+        facet, in the facets order.
+        - legend_groups (list): groups in the legend order.
+
+    ## Return:
+        - traces (list[Scatter]): survival curves traces.
+    '''
+    traces:         list[Scatter]   = []
+
+    for position, group in enumerate(legend_groups):
+        color:      str             = CURVE_COLORS[position % len(CURVE_COLORS)]
+        show:       bool            = True
+        for index, groups_km_dict in enumerate(facets_km_dict.values()):
+            if group not in groups_km_dict:
+                continue
+            suffix: str             = str(index + 1) if index else ""
+            traces.append(Scatter(  x               = groups_km_dict[group]['timeline'],
+                                    y               = groups_km_dict[group]['survival'],
+                                    name            = group,
+                                    legendgroup     = group,
+                                    showlegend      = show,
+                                    line_color      = color,
+                                    xaxis           = f"x{suffix}",
+                                    yaxis           = f"y{suffix}"))
+            show                    = False
+
+    return traces
+
+
 # Survival Plot generator
 # ---------------------------------------------------------------------
-def survival_figure_generator(survival_df:      pd.DataFrame,
+def survival_figure_generator(survival_curves:  dict[str:dict],
                               plot_title:       str,
                               logrank_p_value:  str|dict,
                               facet_col_name:   str|None    = None,
-                              entry_orders:     dict|None   = None,
                               facet_col_groups: list|None   = None,
                               facet_row_name:   str|None    = None,
-                              facet_row_groups: list|None   = None)->Figure:
+                              facet_row_groups: list|None   = None,
+                              legend_groups:    list|None   = None)->Figure:
     '''
     Generate a Survival Figure using Plotly library.
 
     ## Parameters:
-        - survival_df (pd.Dataframe): The Survival Dataframe to be analyzed.
+        - survival_curves (dict[str:dict]): the 'groups_km_dict' made by
+        'km_survival_estimates()', with the Kaplan-Meier estimate of each
+        group. With a facet, a dictionary with the 'groups_km_dict' of
+        each facet in 'facet_col_groups' or 'facet_row_groups'.
         - plot_title (str): title for the plot.
         - logrank_p_value (str|dict): value of statistical test used in  
         survival analysis to compare the distribution of time to event in  
@@ -98,198 +603,66 @@ def survival_figure_generator(survival_df:      pd.DataFrame,
         the logrank pvalue as its value.
         - facet_col_name (str|None):  Optional parameter. Category name.
         To create a facet column for each subcategory in it.
-        - entry_orders (dict): Optional parameter. The order to follow for 
-        the subcategories when plotting the data.
         - facet_col_groups (list|None):  Optional parameter. All the
         sucbategories in 'facet_col_name'.
         - facet_row_name (str|None):  Optional parameter. Category name.
         To create a facet row for each subcategory in it.
         - facet_row_groups (list|None):  Optional parameter. All the
         sucbategories in 'facet_row_name'.
+        - legend_groups (list|None): Optional parameter. The order of the
+        groups in the legend. By default, the order of 'survival_curves'.
 
     ## Return:
         - survival_fig (Figure): Survival plot as plotly Figure object.
     '''
-    # print("Error in 1")
-    text_colors_list:       list    = ['blue', 'red', 'green', 'purple', 'darkorange']
-    groups:                 list    = list(set(survival_df['Legend']))
-    current_colors_list:    list    = text_colors_list[:len(groups)]
-    # print("Error in 2")
-
-    # Create the plot figure:
-    if (facet_col_groups != None):
-        survival_fig: Figure  = px.line(data_frame              = survival_df,
-                                        width                   = 1000,
-                                        x                       = "timeline",
-                                        y                       = "Survival probability",
-                                        color                   = "Legend",
-                                        facet_col               = facet_col_name,
-                                        facet_row               = facet_row_name,
-                                        color_discrete_sequence = current_colors_list,
-                                        category_orders         = entry_orders,
-                                        markers                 = True,
-                                        line_shape              = 'vh',
-                                        title                   = plot_title)
-    else:
-        survival_fig: Figure  = px.line(data_frame              = survival_df,
-                                        x                       = "timeline",
-                                        y                       = "Survival probability",
-                                        color                   = "Legend",
-                                        facet_col               = facet_col_name,
-                                        facet_row               = facet_row_name,
-                                        color_discrete_sequence = current_colors_list,
-                                        category_orders         = entry_orders,
-                                        markers                 = True,
-                                        line_shape              = 'vh',
-                                        title                   = plot_title)
-    # print("Error in 3")
-
-    # Add annotations
-    if (facet_col_groups != None) and not (facet_row_groups != None):
-        count: int = 1
-        x_range_anottation_move = 0.01
-        anot_facet_extra_sapce: float           = 0.25
-
-        if facet_col_name == 'bmi_status':
-            x_range_anottation_move = x_range_anottation_move + (1/len(facet_col_groups))
-
-        for facet in facet_col_groups:
-
-        # Add Figure p-value annotation:
-            # print("Error in row", row)
-            survival_fig.add_annotation(    xref="paper", 
-                                            yref="paper",
-                                            x               = x_range_anottation_move,
-                                            y               = 0.05, 
-                                            borderpad               = 0,
-                                            text                    = f"logrank pValue: {logrank_p_value[facet]}",
-                                            showarrow               = False,
-                                            font                    = dict( family  = "sans serif",
-                                                                            size    = 15,
-                                                                            color   = "black"))
-
-            if facet_col_name == 'bmi_status':
-                                                        
-                x_range_anottation_move = x_range_anottation_move
-                count = count + 1
-                if count == 2:
-                        x_range_anottation_move = x_range_anottation_move + (1.02/len(facet_col_groups))
-                if count == 3:
-                        x_range_anottation_move = x_range_anottation_move + (0.75/len(facet_col_groups))
-                # if count == 4:
-                #         x_range_anottation_move = x_range_anottation_move - (1/len(facet_col_groups))*3
-            else:
-                if len(facet_col_groups) < 4:
-                        x_range_anottation_move = x_range_anottation_move + ((1+anot_facet_extra_sapce)/len(facet_col_groups)) + 0.2
-                        count = count + 1
-                        anot_facet_extra_sapce = anot_facet_extra_sapce + 0.015
-                elif len(facet_col_groups) == 4:   
-                        if count < 3:
-                                x_range_anottation_move = x_range_anottation_move + (1/len(facet_col_groups))                                                            
-                        count = count + 1
-                        if count == 3:
-                                x_range_anottation_move = x_range_anottation_move + (0.7/len(facet_col_groups))
-                        if count == 4:
-                                x_range_anottation_move = x_range_anottation_move + (1/len(facet_col_groups))
-                elif len(facet_col_groups) == 5:
-                        x_range_anottation_move = x_range_anottation_move + (1/len(facet_col_groups)) + 0.005                                                    
-                        count = count + 1
-                        if count == 3:
-                                x_range_anottation_move = x_range_anottation_move + 0.075   
-                        if count == 4:
-                                x_range_anottation_move = x_range_anottation_move + 0.08    
-                                                
-
-
-    elif (facet_row_groups != None) and not (facet_col_groups != None):
-        row: int = 1
-        for facet in facet_row_groups:
-
-        # Add Figure p-value annotation:
-            survival_fig.add_annotation(    row=row,col=1,
-                                            x                       = 50,
-                                            y                       = 1.01,
-                                            borderpad               = 0,
-                                            text                    = f"logrank pValue: {logrank_p_value[facet]}",
-                                            showarrow               = False,
-                                            font                    = dict( family  = "sans serif",
-                                                                            size    = 15,
-                                                                            color   = "black"))
-            row = row+1
-    elif (facet_row_groups != None) and (facet_col_groups != None):
-        pass
-    else:
-        survival_fig.add_annotation(    xref="paper", 
-                                        yref="paper",
-                                        x               = 0.05,
-                                        y               = 0.05,
-                                        borderpad           = 0,
-                                        text                = f"logrank pValue: {logrank_p_value}",
-                                        showarrow           = False,
-                                        font                = dict( family  = "sans serif",
-                                                                    size    = 15,
-                                                                    color   = "black"))
-    
-    survival_fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]) if "=" in a.text else a.update(text=a.text))
-    
-    # Update traces size and symbol:
-    survival_fig.update_traces(     marker                  = dict(size=6, symbol="line-ns-open"),
-                                    line                    = dict(width=1))  
-    
-    # Update layout like axis, titles, legend:
-    survival_fig.update_layout(     hovermode               = "x unified",
-                                    yaxis_title             = "Survival probability",
-                                    barmode                 = 'stack',
-                                    yaxis_range             = [0,1.05],
-                                    legend                  = dict( orientation = 'v',
-                                                                    font        = dict(size= 15)),
-                                    title_x                 = 0.05,
-                                    title_font_family       = "Raleway, sans-serif",
-                                    title                   = dict(font=dict(size=20)),
-                                    bargap                  = 0.1,
-                                    paper_bgcolor           = 'rgb(255,255,255)',
-                                    plot_bgcolor            = 'rgb(255, 255, 255)')
-    
-    # Update x and y axes
-    survival_fig.update_xaxes(  title               = "Months",
-                                showline            = True,
-                                linewidth           = 2,
-                                linecolor           = 'black',
-                                mirror              = True)
-    survival_fig.update_yaxes(  showline            = True,
-                                linewidth           = 2,
-                                linecolor           = 'black',
-                                mirror              = True)
+    if (facet_col_groups != None) and (facet_row_groups != None):
+        raise ValueError("The survival plot can be split by a facet column or a facet row, not both.")
+
+    facets:             list|None       = facet_col_groups if facet_col_groups != None else facet_row_groups
+    facets_km_dict:     dict[str:dict]  = {facet: survival_curves[facet] for facet in facets} if facets != None else {None: survival_curves}
+
+    if legend_groups is None:
+        legend_groups                   = list(dict.fromkeys(group for groups_km_dict in facets_km_dict.values()
+                                                             for group in groups_km_dict))
+
+    # Create the plot figure, from the survival template and the subplot
+    # axes:
+    with timing.stage('traces'):
+        layout:         dict            = dict(template = SURVIVAL_TEMPLATE,
+                                               title    = plot_title,
+                                               **survival_axes(len(facets_km_dict), by_row = facet_row_groups != None))
+        if facet_col_groups != None:
+            layout['width']             = 1000
+        survival_fig:   Figure          = Figure(data = survival_traces(facets_km_dict, legend_groups), layout = layout)
+
+    # Set all the annotations at once, validated in a single assignment
+    # instead of once per 'add_annotation' call:
+    with timing.stage('annotations'):
+        survival_fig.layout.annotations = survival_annotations(survival_fig, logrank_p_value,
+                                                               facet_col_groups, facet_row_groups)
     
     return survival_fig
 
 
 # At risk by time values generator
 # ---------------------------------------------------------------------
-def ceate_at_risk_values_list(entry_group:          str,
-                              at_risk_event_table:  pd.DataFrame)->list:
+def ceate_at_risk_values_list(entry_group:  str,
+                              at_risk:      np.ndarray)->list:
     '''
     Create a list with the patients amount at risk by time table
-    for the 'at_risk_event_table' dataframe.
+    for the 'entry_group'.
 
     ## Parameters:
         - entry_group (str): all the prefiltered groups that are
         in the category to anayze.
-        - at_risk_event_table (pd.DataFrame): dataframe containing all the 
-        patients at risk by time data.
+        - at_risk (np.ndarray): patients at risk at each time of the
+        table grid.
         
     ## Return:
         - at_risk_list (list): list of the population amount at risk by
         time.
     '''
-    at_risk_list: list = [  entry_group, 
-                            at_risk_event_table['at_risk'].max(), 
-                            at_risk_event_table.loc[at_risk_event_table.index <= 10]['at_risk'].min(), 
-                            at_risk_event_table.loc[(at_risk_event_table.index <= 20)]['at_risk'].min(), 
-                            at_risk_event_table.loc[(at_risk_event_table.index <= 30)]['at_risk'].min(), 
-                            at_risk_event_table.loc[(at_risk_event_table.index <= 40)]['at_risk'].min(), 
-                            at_risk_event_table.loc[(at_risk_event_table.index <= 50)]['at_risk'].min(), 
-                            at_risk_event_table['at_risk'].min()]
+    at_risk_list: list = [entry_group] + [int(count) for count in at_risk]
     
     return at_risk_list
 
@@ -297,33 +670,39 @@ def ceate_at_risk_values_list(entry_group:          str,
 # At risk by time table generator
 # ---------------------------------------------------------------------
 def at_risk_table_generator(survival_groups: list, 
-                            entry_kmf_dict:  dict[str:KaplanMeierFitter],
-                            entry_title:     str)->list:
+                            event_table:     dict,
+                            entry_title:     str,
+                            time_grid:       list|None   = None)->list:
     '''
-    Create a table with the patients at risk by time for each entry in 
-    the 'entry_kmf_dict'.
+    Create a table with the patients at risk by time for each group of
+    'survival_groups' found in the 'event_table'. The patients at risk
+    at a time are the ones with a duration equal or greater than it.
 
     ## Parameters:
         - survival_groups (list): all the prefiltered groups that are
         in the category to anayze.
-        - entry_kmf_dict (dict[str:KaplanMeierFitter]): dictionary
-        containing the subcategories as key, and its related and fitted
-        KaplanMeierFitter object as value.
+        - event_table (dict): table created by
+        'ut_kaplan_meier.build_event_table()'.
         - entry_title (str): Can be Overall (os) or Progression-Free Survival
         (pfs).
+        - time_grid (list|None): Optional parameter. Months of the table
+        columns. By default, 'ut_constants.AT_RISK_TIME_GRID'.
         
     ## Return:
-        - survival_table (Figure): At risk by time table plot as plotly Figure object.
+        - at_risk_values_list (list): headers row and one row for each
+        group with its patients at risk by time.
     '''
-    # Create a dictionary with the at risk event tables:
-    at_risk_tables_dict:    dict    = {group:entry_kmf_dict[group].event_table 
-                                       for group in survival_groups if group in list(entry_kmf_dict.keys())}
-    
-    # Create a list with the values from the at risk event tables:
-    at_risk_values_list:    list    = [ceate_at_risk_values_list(group, at_risk_tables_dict[group]) 
-                                       for group in survival_groups if group in list(entry_kmf_dict.keys())]
+    time_grid                       = cns.AT_RISK_TIME_GRID if time_grid is None else time_grid
+
+    # Patients at risk of all the groups in one pass:
+    at_risk:                np.ndarray  = km.at_risk_at_times(event_table, time_grid)
+    columns:                dict        = {str(group): index for index, group in enumerate(event_table['groups'])}
+
+    # Create a list with the values from the at risk event table:
+    at_risk_values_list:    list    = [ceate_at_risk_values_list(group, at_risk[:, columns[group]])
+                                       for group in survival_groups if group in columns]
     # Set the headers for the table:
-    table_headers:          list    = ['Months', '0', '10', '20', '30', '40', '50', '60']
+    table_headers:          list    = ['Months'] + [f"{time:g}" for time in time_grid]
 
     # Insert headers in the beginning of the event values list:
     at_risk_values_list.insert(0,table_headers)
@@ -331,6 +710,151 @@ def at_risk_table_generator(survival_groups: list,
     return at_risk_values_list
 
 
+# Kaplan-Meier estimate and logrank test of a category
+# ---------------------------------------------------------------------
+def km_survival_estimates(entry_df:             pd.DataFrame,
+                          mode:                 str,
+                          groups_column_name:   str,
+                          survival_groups:      list[str],
+                          time_index:           tuple|None  = None,
+                          rows:                 np.ndarray|None = None)->dict:
+    '''
+    Tabulate the 'entry_df' deaths and patients at risk by time and group
+    once, and calculate from it the multivariate logrank test and the
+    Kaplan-Meier estimate of each group.
+
+    ## Parameters:
+        - entry_df (pd.Dataframe): The Survival Dataframe to be analyzed.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - groups_column_name (str): category to be analyzed.
+        - survival_groups (list[str]): all the prefiltered groups that are
+        in the category to anayze (groups_column_name).
+        - time_index (tuple|None): Optional parameter. Sorted distinct
+        months and the position of each row in them, shared by all the
+        categories of a mode (see 'ut_kaplan_meier.build_event_table()').
+        - rows (np.ndarray|None): Optional parameter. True for the
+        'entry_df' rows of the analyzed cohort, all of them by default.
+
+    ## Return:
+        - survival_estimates (dict): dictionary with the next keys:
+            - 'logrank' (dict): multivariate logrank test result of all
+            the groups in the category.
+            - 'groups_km_dict' (dict[str:dict]): Kaplan-Meier estimate of
+            the 'survival_groups' with more than 2 patients, in the
+            'survival_groups' order.
+            - 'event_table' (dict): deaths and patients at risk by time
+            and group.
+    '''
+    months_column_name:     str                 = f"{mode}_months"
+    status_column_name:     str                 = f"{mode}_status"
+
+    # Tabulate deaths and patients at risk for all the groups in one pass:
+    with timing.stage('event_table'):
+        group_codes, group_labels               = category_codes(entry_df[groups_column_name])
+        group_codes                             = masked_codes(group_codes, rows)
+        event_table:        dict                = km.build_event_table( entry_df[months_column_name].to_numpy(),
+                                                                        entry_df[status_column_name].to_numpy(),
+                                                                        group_codes,
+                                                                        labels      = group_labels,
+                                                                        time_index  = time_index)
+
+    # Multivariate logrank test from the same event table:
+    with timing.stage('logrank'):
+        logrank:            dict                = stats.multi_logrank_test_from_table(event_table)
+    with timing.stage('km_fit'):
+        all_groups_km_dict: dict[str:dict]      = km.kaplan_meier_groups(event_table)
+
+    # Create a dictionary with the 'survival_groups' as keys and its Kaplan-Meier estimate:
+    groups_km_dict:         dict[str:dict]      = { group:all_groups_km_dict[group]
+                                                    for group in survival_groups 
+                                                    if group in all_groups_km_dict and all_groups_km_dict[group]['size']>2}
+
+    survival_estimates:     dict                = { 'logrank':          logrank,
+                                                    'groups_km_dict':   groups_km_dict,
+                                                    'event_table':      event_table}
+
+    return survival_estimates
+
+
+# Kaplan-Meier estimates and logrank tests of each facet
+# ---------------------------------------------------------------------
+def km_faceted_survival_estimates(entry_df:             pd.DataFrame,
+                                  mode:                 str,
+                                  groups_column_name:   str,
+                                  survival_groups:      list[str],
+                                  facet_name:           str,
+                                  facet_groups:         list[str],
+                                  time_index:           tuple|None  = None,
+                                  rows:                 np.ndarray|None = None)->dict[str:dict]:
+    '''
+    Calculate 'km_survival_estimates()' for the 'entry_df' patients of
+    each subcategory (facet) of 'facet_name'. All the facets are
+    tabulated together in one pass, and their logrank tests are
+    calculated at once.
+
+    ## Parameters:
+        - entry_df (pd.Dataframe): The Survival Dataframe to be analyzed.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - groups_column_name (str): category to be analyzed.
+        - survival_groups (list[str]): all the prefiltered groups that are
+        in the category to anayze (groups_column_name).
+        - facet_name (str): category splitting the analysis.
+        - facet_groups (list[str]): subcategories of 'facet_name', in the
+        plot order.
+        - time_index (tuple|None): Optional parameter. Sorted distinct
+        months shared by all the categories of a mode.
+        - rows (np.ndarray|None): Optional parameter. True for the
+        'entry_df' rows of the analyzed cohort, all of them by default.
+
+    ## Return:
+        - facets_estimates (dict[str:dict]): dictionary with the facets
+        with patients as keys, in the 'facet_groups' order, and the
+        'km_survival_estimates()' dictionary of each facet as value.
+    '''
+    months_column_name:     str                 = f"{mode}_months"
+    status_column_name:     str                 = f"{mode}_status"
+
+    # Tabulate deaths and patients at risk for all the facets in one pass:
+    with timing.stage('event_table'):
+        group_codes, group_labels               = category_codes(entry_df[groups_column_name])
+        group_codes                             = masked_codes(group_codes, rows)
+        facet_codes, facet_labels               = category_codes(entry_df[facet_name])
+        faceted_table:      dict                = km.build_faceted_event_table( entry_df[months_column_name].to_numpy(),
+                                                                                entry_df[status_column_name].to_numpy(),
+                                                                                group_codes,
+                                                                                facet_codes,
+                                                                                group_labels,
+                                                                                facet_labels,
+                                                                                time_index = time_index)
+
+    # Multivariate logrank test of every facet from the same table:
+    with timing.stage('logrank'):
+        logrank_list:       list[dict]          = stats.faceted_logrank_tests(faceted_table)
+
+    facets_estimates:       dict[str:dict]      = {}
+    facet_positions:        dict[str:int]       = {str(facet): index for index, facet in enumerate(facet_labels)}
+
+    with timing.stage('km_fit'):
+        for facet in facet_groups:
+            index:          int|None            = facet_positions.get(facet)
+            if index is None:
+                continue
+            event_table:    dict                = km.facet_event_table(faceted_table, index)
+            if len(event_table['groups']) == 0:
+                continue
+            all_groups_km_dict: dict[str:dict]  = km.kaplan_meier_groups(event_table)
+            facets_estimates[facet]             = { 'logrank':          logrank_list[index],
+                                                    'groups_km_dict':   {group: all_groups_km_dict[group]
+                                                                         for group in survival_groups
+                                                                         if group in all_groups_km_dict
+                                                                         and all_groups_km_dict[group]['size'] > 2},
+                                                    'event_table':      event_table}
+
+    return facets_estimates
+
+
 # Kaplan-Meier Survival curve manager
 # ---------------------------------------------------------------------
 def plotly_survival(entry_df:           pd.DataFrame,
@@ -341,7 +865,9 @@ def plotly_survival(entry_df:           pd.DataFrame,
                     facet_col_name:     str|None    = None,
                     facet_col_groups:   list|None   = None,
                     facet_row_name:     str|None    = None,
-                    facet_row_groups:   list|None   = None)->tuple[str,str]:
+                    facet_row_groups:   list|None   = None,
+                    time_index:         tuple|None  = None,
+                    rows:               np.ndarray|None = None)->tuple[str,str]:
     '''
     This function generate a survival curve for the category in 
     'groups_column_name' using the Kaplan-Meier method and a risk by time 
@@ -369,6 +895,15 @@ def plotly_survival(entry_df:           pd.DataFrame,
         To create a facet row for each subcategory in it.
         - facet_row_groups (list|None):  Optional parameter. All the
         sucbategories in 'facet_row_name'.
+        - time_index (tuple|None): Optional parameter. Sorted distinct
+        months shared by all the categories of a mode, see
+        'km_survival_estimates()'.
+        - rows (np.ndarray|None): Optional parameter. True for the
+        'entry_df' rows of the analyzed cohort, all of them by default.
+
+    With a facet column or row (not both), each facet has its own
+    Kaplan-Meier curves, logrank pvalue and at risk table rows, from
+    'km_faceted_survival_estimates()'.
 
     ## Returns a tuple of:
         - survuval_div (str): survival curve plot embedded into an html 
@@ -377,54 +912,64 @@ def plotly_survival(entry_df:           pd.DataFrame,
         into an html 'div' tag.
     '''
 
-    # Creating the names where the moths are status data are dependig on the 'mode':
-    months_column_name:     str                 = f"{mode}_months"
-    status_column_name:     str                 = f"{mode}_status"  
-    
+    # KM ESTIMATOR AND LOGRANK TEST ==================================================================================================================
 
-    # Calculate StatisticalResult object with properties 'p_value', 'summary', 'test_statistic', 'print_summary':
-    logrank_p_value:        str                 = stats.calculate_formatted_multi_logrank_p(entry_df[months_column_name],                                                            
-                                                                                            entry_df[groups_column_name],
-                                                                                            entry_df[status_column_name])
-    # Create a dictionary with the 'survival_groups' as keys and its relate DataFrame:
-    groups_df_dict:         dict                = { group:entry_df.loc[entry_df[groups_column_name] == group] 
-                                                    for group in survival_groups if group in list(entry_df[groups_column_name])}
-
-    # KM FITTER =====================================================================================================================================
-
-    # Create a dictionary with the 'survival_groups' as keys and its relate and fitted KaplanMeierFitter object:
-    groups_kmf_dict:        dict[str:KaplanMeierFitter]  = {group:kaplan_meier_fitter_generator(groups_df_dict[group],group,mode) 
-                                                            for group in survival_groups if len(groups_df_dict[group])>2}
-
-    # Create a list of Dataframes with the survival data in each dataframe:
-    plot_groups_list:       list[pd.DataFrame]  = [ pd.DataFrame(data = {   'timeline':             groups_kmf_dict[group].survival_function_.index,
-                                                                            'Survival probability': groups_kmf_dict[group].survival_function_[group],
-                                                                            'Legend':               group})
-                                                    for group in survival_groups if len(groups_df_dict[group])>2]
-        
-    # if groups_column_name == 'tumor_type':
-    #     print("SEROUS:", set(list(groups_df_dict['Serous']['tumor_type'])), len(groups_df_dict['Serous']['tumor_type']))
-    cat_orders:             dict                = {'Legend':list(groups_kmf_dict.keys())}
-        
-        
-    # Concat survival DataFrames. 'objs' value has to a list of DataFrames.
-    plot_groups_df:         pd.DataFrame        = concat(objs=plot_groups_list, ignore_index=True)
-    # print("Creating Survival Figure.................")
+    facet_name:             str|None            = facet_col_name or facet_row_name
+
+    if facet_col_name and facet_row_name:
+        raise ValueError("The survival plot can be split by a facet column or a facet row, not both.")
+
+    if facet_name is None:
+        survival_estimates: dict                = km_survival_estimates(entry_df, mode, groups_column_name, survival_groups, time_index, rows)
+        logrank_p_value:    str                 = stats.format_p_value(survival_estimates['logrank']['p_value'])
+        groups_km_dict:     dict[str:dict]      = survival_estimates['groups_km_dict']
+        event_table:        dict                = survival_estimates['event_table']
+
+        survival_curves:    dict[str:dict]      = groups_km_dict
+        legend_groups:      list                = list(groups_km_dict)
+
+        with timing.stage('at_risk_table'):
+            at_risk_table:  list                = at_risk_table_generator(list(groups_km_dict), event_table, plot_title)
+    else:
+        # One survival analysis for each facet, computed together:
+        facets_estimates:   dict[str:dict]      = km_faceted_survival_estimates(entry_df, mode, groups_column_name, survival_groups,
+                                                                                facet_name, facet_col_groups or facet_row_groups,
+                                                                                time_index, rows)
+        logrank_p_value:    dict[str:str]       = { facet: stats.format_p_value(estimates['logrank']['p_value'])
+                                                    for facet, estimates in facets_estimates.items()}
+        survival_curves:    dict[str:dict]      = { facet: estimates['groups_km_dict']
+                                                    for facet, estimates in facets_estimates.items()}
+        legend_groups:      list                = [ group for group in survival_groups
+                                                    if any(group in groups_km_dict for groups_km_dict in survival_curves.values())]
+
+        # Only the facets with patients are plotted:
+        if facet_col_name:
+            facet_col_groups                    = list(facets_estimates)
+        else:
+            facet_row_groups                    = list(facets_estimates)
+
+        # At risk table rows of every facet, labeled 'facet | group':
+        with timing.stage('at_risk_table'):
+            at_risk_table:  list                = [['Months'] + [f"{time:g}" for time in cns.AT_RISK_TIME_GRID]]
+            for facet, estimates in facets_estimates.items():
+                facet_table: list               = at_risk_table_generator(list(estimates['groups_km_dict']),
+                                                                          estimates['event_table'], plot_title)
+                at_risk_table                  += [[f"{facet} | {row[0]}"] + row[1:] for row in facet_table[1:]]
 
     # Create the plot figures:
-    survival_fig:           Figure              = survival_figure_generator(plot_groups_df, 
+    survival_fig:           Figure              = survival_figure_generator(survival_curves, 
                                                                             plot_title, 
                                                                             logrank_p_value,                                                                                 
                                                                             facet_col_name   = facet_col_name,
-                                                                            entry_orders     = cat_orders,
                                                                             facet_col_groups = facet_col_groups,
                                                                             facet_row_name   = facet_row_name,
-                                                                            facet_row_groups = facet_row_groups)
-    at_risk_table:          list              = at_risk_table_generator(survival_groups, groups_kmf_dict, plot_title)
-    
-    # Output created plots as a HTML 'div' tag:
+                                                                            facet_row_groups = facet_row_groups,
+                                                                            legend_groups    = legend_groups)
+    # Output created plots as a HTML 'div' tag. plotly.js is served once
+    # as a static file by the 'base_ect.html' template:
     # at_risk_table_div:      str                 = plot(at_risk_table, output_type="div", config=cns.TOOLBAR_CONFIG)
-    survuval_div:           str                 = plot(survival_fig, output_type="div", config=cns.TOOLBAR_CONFIG)
+    with timing.stage('serialize'):
+        survuval_div:       str                 = figure_div(survival_fig)
     
     return (survuval_div, at_risk_table)
 
@@ -434,8 +979,9 @@ def plotly_survival(entry_df:           pd.DataFrame,
 def create_counting_bar_plot(entry_df:      pd.DataFrame,
                              x_column_name: str,
                              plot_title:    str,
-                             entry_orders:  dict,
-                             entry_x_title: str)->str:
+                             entry_orders:  dict|None,
+                             entry_x_title: str,
+                             rows:          np.ndarray|None = None)->str:
     '''
     Create a bar plot for the subcategories population in te 
     'x_column_name' name.
@@ -444,9 +990,11 @@ def create_counting_bar_plot(entry_df:      pd.DataFrame,
         - entry_df (pd.Dataframe): The Dataframe to be analyzed.
         - x_column_name (str): Category name from the 'entry_df'.
         - plot_title (str): title for the plot.
-        - entry_orders (dict): The order to follow for the subcategories 
-        when plotting the data.
+        - entry_orders (dict|None): The order to follow for the subcategories 
+        when plotting the data. If None, the order of the categorical column.
         - entry_x_title (str): x axis title.
+        - rows (np.ndarray|None): Optional parameter. True for the
+        'entry_df' rows of the cohort to count, all of them by default.
 
     ## Return:
         - bar_plot_div (str): population bar plot embedded into an html 
@@ -459,41 +1007,128 @@ def create_counting_bar_plot(entry_df:      pd.DataFrame,
     else:
         my_size: int = 18
 
-    # Color orders.
-    text_colors_list:       list    = ['blue', 'red', 'green', 'purple', 'darkorange']
-
-    # Setted groups.
-    groups:                 list    = list(set(entry_df[x_column_name]))
-
-    # Filter colors depending on the 'groups' length.
-    current_colors_list:    list    = text_colors_list[:len(groups)]
-
-    # Histogram figure
-    bar_fig:                Figure  = px.histogram( data_frame              = entry_df,
-                                                    x                       = x_column_name,
-                                                    color                   = x_column_name,
-                                                    color_discrete_sequence = current_colors_list,
-                                                    title                   = plot_title,
-                                                    category_orders         = entry_orders,
-                                                    text_auto               = True)
-    # Updating x axis and plot layout.
-    bar_fig.update_xaxes(   tickangle           = 30)
-    bar_fig.update_layout(  showlegend          = True,
-                            legend_title_text   = 'Legend',
-                            title               = dict(font=dict(size=my_size)),
-                            title_font_family   = "sans-serif",
-                            title_x             = 0.05,
-                            xaxis_title         = entry_x_title,
-                            bargap              = 0,
-                            font                = dict(size = 15),
-                            yaxis               = dict(showgrid = True),
-                            xaxis               = dict(showgrid = False))
-
-    bar_plot_div:           str     = plot(bar_fig, output_type="div", config=cns.TOOLBAR_CONFIG)
+    # Subcategories order from the categorical column type:
+    if entry_orders is None:
+        entry_orders                = {x_column_name: category_codes(entry_df[x_column_name])[1]}
+
+    # Patients of each subcategory, counted once on the server:
+    counts:                 pd.Series   = category_counts(entry_df[x_column_name], rows)
+    groups:                 list        = [group for group in entry_orders[x_column_name] if counts.get(group, 0) > 0]
+
+    # One bar trace for each subcategory, with its own legend entry:
+    bar_traces:             list[Bar]   = [ Bar(x               = [group],
+                                                y               = [int(counts[group])],
+                                                name            = group,
+                                                legendgroup     = group,
+                                                marker_color    = CURVE_COLORS[position % len(CURVE_COLORS)],
+                                                hovertemplate   = f"{entry_x_title}=%{{x}}<br>count=%{{y}}<extra></extra>")
+                                            for position, group in enumerate(groups)]
+
+    # Bar figure, from the population template:
+    bar_fig:                Figure      = Figure(data   = bar_traces,
+                                                 layout = dict( template    = POPULATION_TEMPLATE,
+                                                                title       = dict(text = plot_title, font = dict(size = my_size)),
+                                                                xaxis       = dict( title           = entry_x_title,
+                                                                                    categoryorder   = 'array',
+                                                                                    categoryarray   = groups)))
+
+    bar_plot_div:           str         = figure_div(bar_fig)
 
     return bar_plot_div
 
 
+# Hazard ratios table generator
+# ---------------------------------------------------------------------
+def hazard_ratio_table_generator(cox_analysis: dict)->list:
+    '''
+    Create a table with the hazard ratio, 95% confidence interval and
+    pvalue of each group of a Cox analysis.
+
+    ## Parameters:
+        - cox_analysis (dict): analysis made by
+        'ut_cox.cox_analysis()'.
+
+    ## Return:
+        - hazard_ratio_table (list): headers row and one row for each
+        group of the analyzed categories.
+    '''
+    hazard_ratio_table:     list        = [['Category', 'Group', 'Patients', 'Events', 'Hazard ratio (95% CI)', 'p-value']]
+
+    for model in cox_analysis['models']:
+        for coefficient in model['coefficients']:
+            if coefficient['reference']:
+                hazard_ratio:   str     = 'Reference'
+            elif coefficient['events'] == 0:
+                hazard_ratio:   str     = 'No events'
+            elif not coefficient['estimable']:
+                hazard_ratio:   str     = 'Not estimable'
+            else:
+                hazard_ratio:   str     = (f"{coefficient['hazard_ratio']:.2f} "
+                                           f"({coefficient['ci_lower']:.2f}-{coefficient['ci_upper']:.2f})")
+
+            hazard_ratio_table.append([ cns.CATEGORIES_DICT[coefficient['category']],
+                                        coefficient['group'],
+                                        coefficient['patients'],
+                                        coefficient['events'],
+                                        hazard_ratio,
+                                        '' if coefficient['p_value'] is None else stats.format_p_value(coefficient['p_value'])])
+
+    return hazard_ratio_table
+
+
+# Hazard ratios forest plot
+# ---------------------------------------------------------------------
+def create_forest_plot(cox_analysis:    dict,
+                       plot_title:      str)->Figure:
+    '''
+    Create a forest plot with the hazard ratio and 95% confidence
+    interval of each group of a Cox analysis, one row per group and a
+    color per category, on a logarithmic axis. The groups without events
+    are left out.
+
+    ## Parameters:
+        - cox_analysis (dict): analysis made by
+        'ut_cox.cox_analysis()'.
+        - plot_title (str): title for the plot.
+
+    ## Return:
+        - forest_fig (Figure): forest plot figure.
+    '''
+    coefficients:           list[dict]  = [coefficient for model in cox_analysis['models']
+                                           for coefficient in model['coefficients']
+                                           if coefficient['hazard_ratio'] is not None]
+    labels:                 list[str]   = [f"{cns.CATEGORIES_DICT[coefficient['category']]}: {coefficient['group']}"
+                                           for coefficient in coefficients]
+    forest_traces:          list        = []
+
+    # One trace for each category, with its own legend entry:
+    for position, category in enumerate(dict.fromkeys(coefficient['category'] for coefficient in coefficients)):
+        rows:               list[int]   = [row for row, coefficient in enumerate(coefficients)
+                                           if coefficient['category'] == category]
+        hazard_ratios:      list[float] = [coefficients[row]['hazard_ratio'] for row in rows]
+
+        forest_traces.append(Scatter(x              = hazard_ratios,
+                                     y              = [labels[row] for row in rows],
+                                     name           = cns.CATEGORIES_DICT[category],
+                                     marker_color   = CURVE_COLORS[position % len(CURVE_COLORS)],
+                                     error_x        = dict( type        = 'data',
+                                                            symmetric   = False,
+                                                            array       = [(coefficients[row]['ci_upper'] or hazard_ratio) - hazard_ratio
+                                                                           for row, hazard_ratio in zip(rows, hazard_ratios)],
+                                                            arrayminus  = [hazard_ratio - (coefficients[row]['ci_lower'] or hazard_ratio)
+                                                                           for row, hazard_ratio in zip(rows, hazard_ratios)])))
+
+    # Forest figure, from the forest template:
+    forest_fig:             Figure      = Figure(data   = forest_traces,
+                                                 layout = dict( template    = FOREST_TEMPLATE,
+                                                                title       = dict(text = plot_title),
+                                                                height      = 160 + 30 * len(labels),
+                                                                yaxis       = dict( categoryorder   = 'array',
+                                                                                    categoryarray   = labels)))
+
+    return forest_fig
+
+
 # GENERATOR OF SCIKIT-SURVIVAL KAPLAN-MEIER ESTIMATOR DICT
 # ---------------------------------------------------------------------
 def kme_dict_generator( entry_df:     pd.DataFrame,
@@ -504,6 +1139,7 @@ def kme_dict_generator( entry_df:     pd.DataFrame,
     the months and status data from the 'entry_df' depending on
     the entry 'mode'.
     '''
+    from sksurv.nonparametric import kaplan_meier_estimator
 
     months_column_name: str = f"{mode}_months"
     status_column_name: str = f"{mode}_status"
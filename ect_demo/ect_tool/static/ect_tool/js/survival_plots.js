@@ -0,0 +1,220 @@
+//  App Name:   Endometrial Cancer Tool (Demo).
+//  Author:     Xavier Llobet Navàs.
+//  Content:    ECT (Demo) survival figures drawn in the browser.
+//
+// - When the ECT_CLIENT_RENDERING setting is True, the EC Tool page is
+//   loaded once and this module sends its form to the survival JSON API
+//   ('views.api_survival'). The Kaplan-Meier curves, logrank pvalues,
+//   at risk table and population of the answer are drawn here, like
+//   'plotly_survival_plots.py' does on the server:
+//
+//   - formatPValue(): pvalue in scientific notation.
+//   - survivalFigure(): survival curves figure of an analysis.
+//   - populationFigure(): population bar figure of an analysis.
+//   - atRiskTable(): at risk by time table of an analysis.
+//   - showAnalysis(): get an analysis from the API and draw it.
+//
+// - The figure templates, colors and titles come from the
+//   'ect_figure_settings' JSON script of the page, made by
+//   'plotly_survival_plots.client_figure_settings()'.
+//
+// =====================================================================
+// SETTINGS
+// =====================================================================
+
+const SETTINGS = JSON.parse(document.getElementById('ect_figure_settings').textContent);
+
+// =====================================================================
+// FUNCTIONS
+// =====================================================================
+
+// Pvalue in scientific notation, like Python's "{:e}".format(p_value):
+// ---------------------------------------------------------------------
+export function formatPValue(pValue) {
+    if (pValue === null) {
+        return 'nan';
+    }
+    const [mantissa, exponent] = pValue.toExponential(6).split('e');
+    const sign = exponent.startsWith('-') ? '-' : '+';
+
+    return `${mantissa}e${sign}${exponent.replace(/^[-+]/, '').padStart(2, '0')}`;
+}
+
+// Survival curves figure of an analysis
+// ---------------------------------------------------------------------
+export function survivalFigure(payload) {
+    const facets = payload.facets || [{name: null, ...payload}];
+    const size = (1 - SETTINGS.facet_spacing * (facets.length - 1)) / facets.length;
+    const legendGroups = [...new Set(facets.flatMap(facet => facet.groups.map(group => group.name)))];
+    const [xPosition, yPosition] = SETTINGS.p_value_position;
+
+    const layout = {
+        template: SETTINGS.templates.survival,
+        title: {text: survivalTitle(payload)},
+        annotations: [],
+    };
+    const data = [];
+
+    facets.forEach((facet, index) => {
+        const suffix = index ? String(index + 1) : '';
+        const domain = [index * (size + SETTINGS.facet_spacing), index * (size + SETTINGS.facet_spacing) + size];
+
+        layout[`xaxis${suffix}`] = {anchor: `y${suffix}`, domain: domain, ...(index ? {matches: 'x'} : {})};
+        layout[`yaxis${suffix}`] = index
+            ? {anchor: `x${suffix}`, domain: [0, 1], matches: 'y', showticklabels: false}
+            : {anchor: 'x', domain: [0, 1], title: {text: 'Survival probability'}};
+
+        for (const group of facet.groups) {
+            const position = legendGroups.indexOf(group.name);
+            data.push({
+                type: 'scatter',
+                x: group.timeline,
+                y: group.survival,
+                name: group.name,
+                legendgroup: group.name,
+                // Each group has a single legend entry in all the facets:
+                showlegend: !data.some(trace => trace.name === group.name),
+                line: {color: SETTINGS.curve_colors[position % SETTINGS.curve_colors.length]},
+                xaxis: `x${suffix}`,
+                yaxis: `y${suffix}`,
+            });
+        }
+
+        if (facet.name !== null) {
+            layout.annotations.push({
+                xref: 'paper', yref: 'paper', x: (domain[0] + domain[1]) / 2, y: 1,
+                xanchor: 'center', yanchor: 'bottom', text: facet.name, showarrow: false,
+            });
+        }
+        layout.annotations.push({
+            xref: 'paper', yref: 'paper', borderpad: 0, showarrow: false,
+            x: domain[0] + xPosition * (domain[1] - domain[0]),
+            y: yPosition,
+            text: `logrank pValue: ${formatPValue(facet.logrank.p_value)}`,
+            font: SETTINGS.p_value_font,
+        });
+    });
+
+    if (payload.facets) {
+        layout.width = 1000;
+    }
+
+    return {data: data, layout: layout};
+}
+
+// Population bar figure of an analysis
+// ---------------------------------------------------------------------
+export function populationFigure(payload) {
+    const category = SETTINGS.categories[payload.category];
+    const groups = Object.keys(payload.population);
+
+    const data = groups.map((group, position) => ({
+        type: 'bar',
+        x: [group],
+        y: [payload.population[group]],
+        name: group,
+        legendgroup: group,
+        marker: {color: SETTINGS.curve_colors[position % SETTINGS.curve_colors.length]},
+        hovertemplate: `${category}=%{x}<br>count=%{y}<extra></extra>`,
+    }));
+    const layout = {
+        template: SETTINGS.templates.population,
+        title: {text: `<b>EC Population</b><br><sup>by <b style='color: green;'>${category}</b>`, font: {size: 25}},
+        xaxis: {title: {text: category}, categoryorder: 'array', categoryarray: groups},
+    };
+
+    return {data: data, layout: layout};
+}
+
+// At risk by time table of an analysis
+// ---------------------------------------------------------------------
+export function atRiskTable(payload) {
+    const rows = payload.facets
+        ? [payload.facets[0].at_risk_table[0]].concat(...payload.facets.map(
+            facet => facet.at_risk_table.slice(1).map(row => [`${facet.name} | ${row[0]}`, ...row.slice(1)])))
+        : payload.at_risk_table;
+
+    const container = document.createElement('div');
+    container.className = 'row m-0 p-0 ps-2 pb-4 pe-0 me-0 border-bottom';
+    container.innerHTML = '<p class="ms-3 mb-0 pb-0 fs-5 fw-bold text-dark text-opacity-75"><small>Population at risk by time</small></p>';
+
+    const table = document.createElement('table');
+    table.className = 'table table-light pe-0 ms-4 me-0';
+    table.style.width = '85%';
+
+    rows.forEach((row, rowIndex) => {
+        const tableRow = table.insertRow();
+        if (rowIndex === 0) {
+            tableRow.style.color = 'cadetblue';
+        }
+        row.forEach((item, itemIndex) => {
+            const cell = document.createElement(rowIndex === 0 ? 'th' : 'td');
+            cell.className = `${itemIndex === 0 ? 'text-start' : 'text-center'} align-middle${rowIndex && !itemIndex ? ' fw-bold' : ''}`;
+            if (rowIndex === 0 && itemIndex === 0) {
+                cell.style.width = '16%';
+            }
+            if (rowIndex) {
+                cell.style.fontSize = '0.9em';
+            }
+            const text = document.createElement('small');
+            text.textContent = item;
+            cell.appendChild(text);
+            tableRow.appendChild(cell);
+        });
+    });
+    container.appendChild(table);
+
+    return container;
+}
+
+// Get an analysis from the API and draw it
+// ---------------------------------------------------------------------
+export async function showAnalysis(form) {
+    const parameters = new URLSearchParams({
+        mode: form.elements.survival_type.value,
+        category: form.elements.clinical_category.value,
+    });
+    const facet = form.elements.facet_category.value;
+    if (facet && facet !== parameters.get('category')) {
+        parameters.set('facet', facet);
+    }
+    const cohort = form.elements.cohort.value.trim();
+    if (cohort) {
+        parameters.set('cohort', cohort);
+    }
+
+    const response = await fetch(`${form.dataset.apiUrl}?${parameters}`, {headers: {Accept: 'application/json'}});
+    const payload = await response.json();
+    if (!response.ok) {
+        throw new Error(payload.error);
+    }
+
+    const survival = survivalFigure(payload);
+    const population = populationFigure(payload);
+    await Plotly.react('survival_plot', survival.data, survival.layout, SETTINGS.toolbar_config);
+    await Plotly.react('bar_plot', population.data, population.layout, SETTINGS.toolbar_config);
+    document.getElementById('at_risk_table').replaceChildren(atRiskTable(payload));
+    document.getElementById('cohort_description').textContent = payload.cohort ? `Cohort: ${payload.cohort}` : '';
+}
+
+// Title of the survival figure
+// ---------------------------------------------------------------------
+function survivalTitle(payload) {
+    const facet = payload.facet ? ` and <b style='color: green;'>${SETTINGS.categories[payload.facet]}</b>` : '';
+
+    return `<b>EC ${SETTINGS.modes[payload.mode]}</b><br>`
+         + `<sup>by <b style='color: green;'>${SETTINGS.categories[payload.category]}</b>${facet}</sup>`;
+}
+
+// =====================================================================
+// FORM
+// =====================================================================
+
+const form = document.getElementById('overview_form');
+
+form.addEventListener('submit', event => {
+    event.preventDefault();
+    showAnalysis(form).catch(error => {
+        document.getElementById('survival_plot').textContent = `The survival analysis failed: ${error.message}`;
+    });
+});
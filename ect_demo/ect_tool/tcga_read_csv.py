@@ -1,12 +1,28 @@
 #   App Name:   Endometrial Cancer Tool (Demo)).
 #   Author:     Xavier Llobet Navàs.
 #   Content:    ECT (Demo) dataset reading.
+#
+# - The 'survival.csv' file is the source of the dataset. It can be
+#   converted to a columnar binary format, one '.npy' file per column
+#   plus a 'manifest.json' file, with 'write_columnar_survival()' or the
+#   'convert_survival_dataset' command. Text columns are stored as
+#   integer codes and their dictionary of values, and generated
+#   identifiers as numbers and their format. When the columnar
+#   copy matches the CSV file, 'read_survival_file()' memory-maps it,
+#   so all the workers share the same pages of the dataset.
+#
+# - 'apply_survival_schema()' converts the clinical columns to ordered
+#   'pd.Categorical' types and downcasts the numeric columns following
+#   the schema defined in 'ut_constants.SURVIVAL_SCHEMA'.
 
 # IMPORTS
 # =====================================================================
 
 from    pathlib import  Path
+import  numpy   as      np
 import  pandas  as      pd
+import  hashlib
+import  json
 import  os
 
 # Global variables
@@ -14,13 +30,18 @@ import  os
 
 # Get current directory:
 cwd:            str     = os.getcwd()
-print('CWD:', cwd)
 
 dataset_path:   str     =  cwd.replace("DLN5", "Datasets")
 
 # Constant variable for the dataset path
 CSV_FILES_PATH: Path    = Path(dataset_path)
 
+# Folder of the columnar copy of 'survival.csv':
+COLUMNAR_PATH:  Path    = CSV_FILES_PATH/"survival_columns"
+
+# Last computed fingerprint, reused while the file 'stat' is unchanged:
+_fingerprint_memo:  dict    = {}
+
 
 # FUNCTIONS
 # =====================================================================
@@ -28,7 +49,7 @@ CSV_FILES_PATH: Path    = Path(dataset_path)
 # Read 'survival.csv' file and convert to pandas DataFrame:
 # ---------------------------------------------------------------------
 
-def read_survival_file() -> pd.DataFrame:
+def read_survival_csv() -> pd.DataFrame:
     '''
     Create a pandas DataFrame for 'survival' CSV file.
 
@@ -38,5 +59,230 @@ def read_survival_file() -> pd.DataFrame:
 
     filepath:   Path            = Path(CSV_FILES_PATH/"survival.csv")
     df:         pd.DataFrame    = pd.read_csv(filepath, sep=",")
-    
-    return df
\ No newline at end of file
+
+    return df
+
+
+# Read the survival dataset:
+# ---------------------------------------------------------------------
+
+def read_survival_file(schema: dict|None = None) -> pd.DataFrame:
+    '''
+    Create a pandas DataFrame for the survival dataset. The columnar
+    copy is memory-mapped when it was written from the current
+    'survival.csv' file, otherwise the CSV file is read.
+
+    ## Parameters:
+        - schema (dict|None): Optional parameter. Schema to apply with
+        'apply_survival_schema()'.
+
+    ## Return:
+        - df (pd.Dataframe): created dataframe.
+    '''
+
+    if columnar_survival_is_current():
+        df:     pd.DataFrame    = read_columnar_survival()
+    else:
+        df:     pd.DataFrame    = read_survival_csv()
+
+    if schema is not None:
+        df                      = apply_survival_schema(df, schema)
+
+    return df
+
+
+# Apply the column types of the survival dataset:
+# ---------------------------------------------------------------------
+
+def apply_survival_schema(df:       pd.DataFrame,
+                          schema:   dict) -> pd.DataFrame:
+    '''
+    Convert the survival DataFrame columns to the types of 'schema'.
+    Columns that already have the right type are not copied, so a
+    memory-mapped columnar dataset written with the schema keeps
+    sharing its pages.
+
+    ## Parameters:
+        - df (pd.DataFrame): survival DataFrame.
+        - schema (dict): dictionary with the next keys:
+            - 'categories' (dict): column name as key and the ordered
+            list of its values as value. Values found in the data but
+            not in the list are added at the end, sorted.
+            - 'dtypes' (dict): column name as key and the numeric type
+            as value.
+
+    ## Return:
+        - df (pd.Dataframe): DataFrame with the schema applied.
+    '''
+
+    df                          = df.copy(deep=False)
+
+    for name, order in schema.get('categories', {}).items():
+        if name not in df.columns:
+            continue
+        found:  list                = [str(value) for value in pd.unique(df[name].dropna())]
+        extra:  list                = sorted(set(found) - set(order))
+        dtype:  pd.CategoricalDtype = pd.CategoricalDtype(list(order) + extra, ordered=True)
+        if df[name].dtype != dtype:
+            df[name]                = df[name].astype(dtype)
+
+    for name, dtype in schema.get('dtypes', {}).items():
+        if name in df.columns:
+            df[name]            = df[name].astype(dtype, copy=False)
+
+    return df
+
+
+# Write the columnar copy of the dataset:
+# ---------------------------------------------------------------------
+
+def write_columnar_survival(df:                 pd.DataFrame|None   = None,
+                            directory:          Path|None           = None,
+                            source_fingerprint: str|None            = None) -> Path:
+    '''
+    Write the survival DataFrame as one '.npy' file per column and a
+    'manifest.json' file with the column types, the dictionary of
+    values of the text columns and the fingerprint of the CSV source.
+
+    ## Parameters:
+        - df (pd.DataFrame|None): DataFrame to write. By default, the
+        'survival.csv' file content.
+        - directory (Path|None): destination folder. By default,
+        'COLUMNAR_PATH'.
+        - source_fingerprint (str|None): 'survival_file_fingerprint()'
+        of the file 'df' was read from, taken before reading it. When
+        'df' is None, the one of the file read here.
+
+    ## Return:
+        - directory (Path): folder containing the columnar dataset.
+
+    A 'df' without 'source_fingerprint' is written without one, so
+    'columnar_survival_is_current()' is False for it.
+    '''
+
+    if df is None:
+        # Before reading, a file replaced meanwhile is not current:
+        source_fingerprint      = survival_file_fingerprint()
+        df                      = read_survival_csv()
+    directory                   = Path(directory or COLUMNAR_PATH)
+    directory.mkdir(parents=True, exist_ok=True)
+    columns:        list        = []
+
+    for position, name in enumerate(df.columns):
+        column:     pd.Series   = df[name]
+        filename:   str         = f"{position:03d}.npy"
+
+        if pd.api.types.is_numeric_dtype(column.dtype) and not isinstance(column.dtype, pd.CategoricalDtype):
+            np.save(directory/filename, column.to_numpy(), allow_pickle=False)
+            columns.append({'name': name, 'file': filename, 'kind': 'numeric'})
+        else:
+            # Dictionary encoding, -1 is a missing value:
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                codes, values   = column.cat.codes.to_numpy(), column.cat.categories
+                ordered: bool   = bool(column.cat.ordered)
+            else:
+                codes, values   = pd.factorize(column, sort=True)
+                ordered: bool   = False
+            values: list        = [str(value) for value in values]
+            codes               = codes.astype(np.min_scalar_type(-len(values)))
+            np.save(directory/filename, codes, allow_pickle=False)
+            columns.append({'name': name, 'file': filename, 'kind': 'dictionary', 'values': values,
+                            'ordered': ordered})
+
+    manifest:       dict        = { 'source_fingerprint':   source_fingerprint,
+                                    'rows':                 len(df),
+                                    'columns':              columns}
+    (directory/"manifest.json").write_text(json.dumps(manifest, indent=1))
+
+    return directory
+
+
+# Read the columnar copy of the dataset:
+# ---------------------------------------------------------------------
+
+def read_columnar_survival(directory: Path|None = None) -> pd.DataFrame:
+    '''
+    Create a pandas DataFrame from the columnar dataset. The '.npy'
+    files are memory-mapped read-only and used without copies: numeric
+    columns as they are, and text columns as 'pd.Categorical' built on
+    the stored codes. The 'pattern' columns, generated identifiers, are
+    the stored numbers with their 'format'.
+
+    ## Parameters:
+        - directory (Path|None): folder of the columnar dataset. By
+        default, 'COLUMNAR_PATH'.
+
+    ## Return:
+        - df (pd.Dataframe): created dataframe.
+    '''
+
+    directory                   = Path(directory or COLUMNAR_PATH)
+    manifest:       dict        = json.loads((directory/"manifest.json").read_text())
+    data:           dict        = {}
+
+    for column in manifest['columns']:
+        values:     np.ndarray  = np.load(directory/column['file'], mmap_mode='r')
+
+        if column['kind'] == 'dictionary':
+            values              = pd.Categorical.from_codes(values,
+                                                            categories  = column['values'],
+                                                            ordered     = column.get('ordered', False))
+        elif column['kind'] == 'pattern':
+            values              = np.array([column['format'].format(number) for number in values.tolist()],
+                                           dtype=object)
+        data[column['name']]    = values
+
+    df:             pd.DataFrame    = pd.DataFrame(data, copy=False)
+
+    return df
+
+
+# Check the columnar copy of the dataset:
+# ---------------------------------------------------------------------
+
+def columnar_survival_is_current(directory: Path|None = None) -> bool:
+    '''
+    Return True if the columnar dataset exists and was written from
+    the current 'survival.csv' file.
+
+    ## Parameters:
+        - directory (Path|None): folder of the columnar dataset. By
+        default, 'COLUMNAR_PATH'.
+
+    ## Return:
+        - is_current (bool): the columnar dataset can be used.
+    '''
+
+    manifest_path:  Path        = Path(directory or COLUMNAR_PATH)/"manifest.json"
+
+    if not manifest_path.is_file():
+        return False
+
+    manifest:       dict        = json.loads(manifest_path.read_text())
+
+    return manifest.get('source_fingerprint') == survival_file_fingerprint()
+
+
+# Fingerprint of the 'survival.csv' file:
+# ---------------------------------------------------------------------
+
+def survival_file_fingerprint() -> str:
+    '''
+    Return a short SHA-256 digest of the 'survival' CSV file content.
+    The file is only hashed again when its size or modification time
+    change, so calling this function on every request is a 'stat' call.
+
+    ## Return:
+        - fingerprint (str): hexadecimal digest identifying the dataset
+        version.
+    '''
+
+    filepath:   Path            = Path(CSV_FILES_PATH/"survival.csv")
+    file_stat:  os.stat_result  = filepath.stat()
+    stat_key:   tuple           = (str(filepath), file_stat.st_size, file_stat.st_mtime_ns)
+
+    if _fingerprint_memo.get('stat_key') != stat_key:
+        digest: str             = hashlib.sha256(filepath.read_bytes()).hexdigest()[:16]
+        _fingerprint_memo.update(stat_key = stat_key, fingerprint = digest)
+
+    return _fingerprint_memo['fingerprint']
@@ -1,3 +1,1049 @@
 from django.test import TestCase
+from unittest import mock
+
+from . import ut_cache
+from . import ut_constants as cns
 
 # Create your tests here.
+
+
+class SurvivalCacheTests(TestCase):
+
+    def setUp(self):
+        ut_cache.caches[ut_cache.CACHE_ALIAS].clear()
+
+    def test_context_is_computed_once_per_fingerprint(self):
+        with mock.patch.object(ut_cache, 'compute_category_context',
+                               wraps=ut_cache.compute_category_context) as compute:
+            first   = ut_cache.get_category_context('os', 'grade')
+            second  = ut_cache.get_category_context('os', 'grade')
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
+    def test_fingerprint_change_invalidates(self):
+        ut_cache.get_category_context('pfs', 'stage')
+        with mock.patch.object(ut_cache.tcga, 'survival_file_fingerprint', return_value='changed'), \
+             mock.patch.object(ut_cache, 'compute_category_context',
+                               wraps=ut_cache.compute_category_context) as compute:
+            ut_cache.get_category_context('pfs', 'stage')
+        self.assertEqual(compute.call_count, 1)
+        # Restore the dataset state for the other tests:
+        ut_cache._dataset.clear()
+
+    def test_unknown_category(self):
+        with self.assertRaises(KeyError):
+            ut_cache.get_category_context('os', 'unknown')
+
+    def test_ect_view_uses_cached_context(self):
+        response = self.client.post('/ect_tool/ect/', {'survival_type': 'os', 'clinical_category': 'grade'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['category_title'], cns.CATEGORIES_DICT['grade'])
+
+
+class PlotlyStaticTests(TestCase):
+
+    def test_vendored_plotlyjs_matches_installed_plotly(self):
+        from django.contrib.staticfiles import finders
+        from plotly.offline import get_plotlyjs_version
+        self.assertIsNotNone(finders.find(f"ect_tool/vendor/plotly/plotly-{get_plotlyjs_version()}.min.js"))
+
+    def test_ect_response_does_not_inline_plotlyjs(self):
+        response = self.client.post('/ect_tool/ect/', {'survival_type': 'pfs', 'clinical_category': 'stage'})
+        self.assertContains(response, 'ect_tool/vendor/plotly/plotly-')
+        self.assertLess(len(response.content), 500_000)
+
+    def test_client_rendering_page(self):
+        import json
+        from django.contrib.staticfiles import finders
+        from django.test import override_settings
+        self.assertNotContains(self.client.get('/ect_tool/ect/'), 'ect_figure_settings')
+        with override_settings(ECT_CLIENT_RENDERING=True):
+            response    = self.client.get('/ect_tool/ect/')
+        self.assertContains(response, 'ect_tool/js/survival_plots.js')
+        self.assertContains(response, 'data-api-url="/ect_tool/api/survival/"')
+        self.assertIsNotNone(finders.find('ect_tool/js/survival_plots.js'))
+        client_settings = json.loads(response.content.decode().split('id="ect_figure_settings" type="application/json">')[1]
+                                     .split('</script>')[0])
+        self.assertEqual(client_settings['templates']['survival']['data']['scatter'][0]['line']['shape'], 'vh')
+        self.assertEqual(client_settings['categories'], cns.CATEGORIES_DICT)
+
+    def test_figure_div_sends_typed_arrays(self):
+        import base64
+        import json
+        import re
+        import numpy as np
+        from plotly.offline import plot
+        from . import plotly_survival_plots as sp
+        from . import ut_benchmark as bench
+        cohort      = bench.scaled_cohort(20_000)
+        estimates   = sp.km_survival_estimates(cohort, 'os', 'stage', cns.SURVIVAL_GROUPS['stage'])
+        figure      = sp.survival_figure_generator(estimates['groups_km_dict'], 'title', '0.001')
+        div         = sp.figure_div(figure)
+        # The JSON of the 'div' escapes the '/' characters:
+        arrays      = [np.frombuffer(base64.b64decode(json.loads(f'"{data}"')), dtype='<f4')
+                       for data in re.findall(r'"bdata":"([^"]+)"', div)]
+        expected    = [np.asarray(values, dtype='f4') for trace in figure.data for values in (trace.x, trace.y)]
+        self.assertEqual(len(arrays), len(expected))
+        for array, values in zip(arrays, expected):
+            np.testing.assert_array_equal(array, values)
+        self.assertLess(len(div), len(plot(figure, output_type="div", include_plotlyjs=False)) / 2)
+
+
+class KaplanMeierEngineTests(TestCase):
+
+    def test_matches_lifelines_for_every_category(self):
+        import numpy as np
+        from . import plotly_survival_plots as sp
+        from . import ut_kaplan_meier as km
+
+        for mode in cns.SURVIVAL_MODES:
+            for category in cns.CATEGORIES:
+                event_table     = km.build_event_table(cns.SURVIVAL[f"{mode}_months"].to_numpy(),
+                                                       cns.SURVIVAL[f"{mode}_status"].to_numpy(),
+                                                       cns.SURVIVAL[category].to_numpy())
+                for group, group_km in km.kaplan_meier_groups(event_table).items():
+                    kmf = sp.kaplan_meier_fitter_generator(cns.SURVIVAL.loc[cns.SURVIVAL[category] == group], group, mode)
+                    with self.subTest(mode=mode, category=category, group=group):
+                        np.testing.assert_allclose(group_km['timeline'], kmf.survival_function_.index)
+                        np.testing.assert_allclose(group_km['survival'], kmf.survival_function_[group])
+                        np.testing.assert_allclose(group_km['ci_lower'], kmf.confidence_interval_.iloc[:, 0])
+                        np.testing.assert_allclose(group_km['ci_upper'], kmf.confidence_interval_.iloc[:, 1])
+                        np.testing.assert_allclose(group_km['at_risk'], kmf.event_table['at_risk'])
+                        np.testing.assert_allclose(group_km['observed'], kmf.event_table['observed'])
+                        np.testing.assert_allclose(group_km['censored'], kmf.event_table['censored'])
+
+    def test_aggregated_counts_match_raw_rows(self):
+        import numpy as np
+        from . import ut_kaplan_meier as km
+
+        raw         = km.build_event_table(np.array([1., 1., 2., 3., 3.]), np.array([1, 0, 1, 1, 1]),
+                                           np.array(['a', 'a', 'b', 'a', 'b']))
+        aggregated  = km.build_event_table(np.array([1., 2., 3., 3.]), np.array([1, 1, 1, 1]),
+                                           np.array(['a', 'b', 'a', 'b']), counts = np.array([2, 1, 1, 1]))
+        for key in ('observed', 'removed', 'at_risk'):
+            np.testing.assert_array_equal(raw[key], aggregated[key])
+
+    def test_at_risk_at_times_counts_durations_from_the_time(self):
+        import numpy as np
+        from . import ut_kaplan_meier as km
+
+        months      = cns.SURVIVAL['os_months'].to_numpy(dtype=float)
+        groups      = cns.SURVIVAL['grade'].astype(str).to_numpy()
+        event_table = km.build_event_table(months, cns.SURVIVAL['os_status'].to_numpy(), groups)
+        times       = np.arange(0, 241, 1.0)
+        at_risk     = km.at_risk_at_times(event_table, times)
+        expected    = np.array([[np.sum((months >= time) & (groups == group)) for group in event_table['groups']]
+                                for time in times])
+        np.testing.assert_array_equal(at_risk, expected)
+
+    def test_at_risk_table_grid(self):
+        from . import ut_survival as surv
+        payload     = surv.km_category_survival_data(cns.SURVIVAL, 'os', 'grade', cns.SURVIVAL_GROUPS['grade'],
+                                                     time_grid = [0, 12.5])
+        self.assertEqual(payload['at_risk_table'][0], ['Months', '0', '12.5'])
+        self.assertEqual([row[1] for row in payload['at_risk_table'][1:]],
+                         [group['size'] for group in payload['groups']])
+
+
+class LogrankTests(TestCase):
+
+    def test_matches_lifelines_multivariate_logrank(self):
+        from lifelines.statistics import multivariate_logrank_test
+        from . import ut_kaplan_meier as km
+        from . import ut_stats as stats
+
+        for mode in cns.SURVIVAL_MODES:
+            for category in cns.CATEGORIES:
+                months, status, groups = (cns.SURVIVAL[f"{mode}_months"], cns.SURVIVAL[f"{mode}_status"],
+                                          cns.SURVIVAL[category])
+                event_table = km.build_event_table(months.to_numpy(), status.to_numpy(), groups.to_numpy())
+                for kwargs in ({}, {'weightings': 'fleming-harrington', 'p': 1.0, 'q': 0.5}):
+                    with self.subTest(mode=mode, category=category, **kwargs):
+                        expected    = multivariate_logrank_test(months, groups, status, **kwargs)
+                        result      = stats.multi_logrank_test_from_table(event_table, **kwargs)
+                        self.assertAlmostEqual(result['test_statistic'], expected.test_statistic, places=8)
+                        self.assertAlmostEqual(result['p_value'], expected.p_value, places=12)
+                        self.assertEqual(result['degrees_of_freedom'], expected.degrees_of_freedom)
+
+    def test_formatted_p_value(self):
+        from lifelines.statistics import multivariate_logrank_test
+        from . import ut_stats as stats
+
+        df          = cns.SURVIVAL
+        expected    = multivariate_logrank_test(df['os_months'], df['grade'], df['os_status'])
+        self.assertEqual(stats.calculate_formatted_multi_logrank_p(df['os_months'], df['grade'], df['os_status']),
+                         "{:e}".format(expected.p_value))
+
+    def test_stratified_sums_strata_components(self):
+        import numpy as np
+        from . import ut_kaplan_meier as km
+        from . import ut_stats as stats
+
+        df          = cns.SURVIVAL
+        result      = stats.stratified_logrank_test(df['os_months'], df['grade'], df['os_status'], df['radiotherapy'])
+
+        o_minus_e, covariance = 0, 0
+        for _, stratum in df.groupby('radiotherapy'):
+            table   = km.build_event_table(stratum['os_months'].to_numpy(), stratum['os_status'].to_numpy(),
+                                           stratum['grade'].to_numpy())
+            z, v, _ = stats.logrank_components(table['observed'], table['at_risk'], np.ones(len(table['timeline'])))
+            o_minus_e, covariance = o_minus_e + z, covariance + v
+        statistic, degrees, p_value = stats.logrank_chi_squared(o_minus_e, covariance)
+        self.assertAlmostEqual(result['test_statistic'], float(statistic))
+        self.assertAlmostEqual(result['p_value'], float(p_value))
+        self.assertEqual(result['degrees_of_freedom'], degrees)
+
+        # A single stratum is the plain logrank test:
+        single      = stats.stratified_logrank_test(df['os_months'], df['grade'], df['os_status'], ['all'] * len(df))
+        plain       = stats.multi_logrank_test_from_table(km.build_event_table(df['os_months'], df['os_status'], df['grade']))
+        self.assertAlmostEqual(single['test_statistic'], plain['test_statistic'])
+
+
+class FacetedSurvivalTests(TestCase):
+
+    def faceted_table(self, mode, category, facet):
+        from . import plotly_survival_plots as sp
+        from . import ut_kaplan_meier as km
+        codes, labels               = sp.category_codes(cns.SURVIVAL[category])
+        facet_codes, facet_labels   = sp.category_codes(cns.SURVIVAL[facet])
+        return km.build_faceted_event_table(cns.SURVIVAL[f"{mode}_months"].to_numpy(),
+                                            cns.SURVIVAL[f"{mode}_status"].to_numpy(),
+                                            codes, facet_codes, labels, facet_labels)
+
+    def test_logrank_matches_lifelines_on_each_facet(self):
+        from lifelines.statistics import multivariate_logrank_test
+        from . import ut_stats as stats
+        for category, facet in (('mol_subtype', 'grade'), ('grade', 'stage'), ('age_group', 'radiotherapy')):
+            results     = stats.faceted_logrank_tests(self.faceted_table('os', category, facet))
+            for result in results:
+                subset  = cns.SURVIVAL.loc[(cns.SURVIVAL[facet] == result['facet']) & cns.SURVIVAL[category].notna()]
+                if subset[category].nunique() < 2:
+                    continue
+                with self.subTest(category=category, facet=result['facet']):
+                    expected    = multivariate_logrank_test(subset['os_months'], subset[category], subset['os_status'])
+                    self.assertAlmostEqual(result['test_statistic'], expected.test_statistic, places=8)
+                    self.assertAlmostEqual(result['p_value'], expected.p_value, places=12)
+                    self.assertEqual(result['degrees_of_freedom'], expected.degrees_of_freedom)
+
+    def test_facet_tables_match_filtered_tables(self):
+        import numpy as np
+        from . import ut_kaplan_meier as km
+        table       = self.faceted_table('pfs', 'tumor_type', 'stage')
+        for index, facet in enumerate(table['facets']):
+            subset      = cns.SURVIVAL.loc[(cns.SURVIVAL['stage'] == facet) & cns.SURVIVAL['tumor_type'].notna()]
+            if subset.empty:
+                continue
+            expected    = km.build_event_table(subset['pfs_months'].to_numpy(), subset['pfs_status'].to_numpy(),
+                                               subset['tumor_type'].cat.codes.to_numpy(), labels = list(table['groups']))
+            result      = km.facet_event_table(table, index)
+            rows        = result['removed'].sum(axis=1) > 0
+            with self.subTest(facet=facet):
+                self.assertEqual(list(result['groups']), list(expected['groups']))
+                np.testing.assert_array_equal(result['timeline'][rows], expected['timeline'])
+                for key in ('observed', 'removed', 'at_risk'):
+                    np.testing.assert_array_equal(result[key][rows], expected[key])
+
+    def test_p_value_annotations_follow_the_subplot_domains(self):
+        from . import plotly_survival_plots as sp
+        for facets_amount in (2, 3, 4, 5, 7):
+            facets      = [f"F{index}" for index in range(facets_amount)]
+            curves      = {facet: {'G1': {'timeline': [0, 10], 'survival': [1.0, 0.5]}} for facet in facets}
+            p_values    = {facet: f"0.{index}" for index, facet in enumerate(facets)}
+            for by_row in (False, True):
+                facet_kwargs    = ({'facet_row_name': 'facet', 'facet_row_groups': facets} if by_row else
+                                   {'facet_col_name': 'facet', 'facet_col_groups': facets})
+                figure          = sp.survival_figure_generator(curves, 'title', p_values, **facet_kwargs)
+                titles          = [annotation.text for annotation in figure.layout.annotations
+                                   if not annotation.text.startswith('logrank')]
+                annotations     = [annotation for annotation in figure.layout.annotations
+                                   if annotation.text.startswith('logrank')]
+                self.assertEqual(titles, facets)
+                self.assertEqual(len(annotations), facets_amount)
+                self.assertEqual([trace.showlegend for trace in figure.data], [True] + [False] * (facets_amount - 1))
+                subplots        = sp.facet_subplots(figure, facets_amount)
+                for facet, annotation, trace, (xaxis, yaxis) in zip(facets, annotations, figure.data, subplots):
+                    with self.subTest(facets_amount=facets_amount, by_row=by_row, facet=facet):
+                        self.assertEqual(annotation.text, f"logrank pValue: {p_values[facet]}")
+                        self.assertTrue(xaxis.domain[0] < annotation.x < xaxis.domain[1])
+                        self.assertTrue(yaxis.domain[0] < annotation.y < yaxis.domain[1])
+                        self.assertEqual(xaxis.plotly_name.replace('axis', ''), trace.xaxis)
+                # Subplots don't overlap:
+                domains         = sorted(axis.domain for xaxis, yaxis in subplots for axis in [yaxis if by_row else xaxis])
+                for previous, current in zip(domains, domains[1:]):
+                    self.assertLess(previous[1], current[0])
+
+    def test_figures_are_built_from_the_estimates(self):
+        from . import plotly_survival_plots as sp
+        estimates   = sp.km_survival_estimates(cns.SURVIVAL, 'os', 'mol_subtype', cns.SURVIVAL_GROUPS['mol_subtype'])
+        figure      = sp.survival_figure_generator(estimates['groups_km_dict'], 'title', '0.001')
+        self.assertEqual([trace.name for trace in figure.data], cns.SURVIVAL_GROUPS['mol_subtype'])
+        for trace in figure.data:
+            self.assertEqual(list(trace.x), list(estimates['groups_km_dict'][trace.name]['timeline']))
+            self.assertEqual(list(trace.y), list(estimates['groups_km_dict'][trace.name]['survival']))
+        bar_div     = sp.create_counting_bar_plot(cns.SURVIVAL, 'mol_subtype', 'title', None, 'Molecular Subtype')
+        # The style comes from the registered template, not the figure:
+        import plotly.io as pio
+        self.assertEqual(figure.layout.template, pio.templates[sp.SURVIVAL_TEMPLATE])
+        self.assertIsNone(figure.layout.plot_bgcolor)
+        self.assertIsNone(figure.layout.xaxis.showline)
+        self.assertTrue(figure.layout.template.layout.xaxis.showline)
+        self.assertEqual(figure.layout.template.data.scatter[0].line.shape, 'vh')
+        for group, count in cns.SURVIVAL['mol_subtype'].value_counts().items():
+            self.assertIn(f'"name":"{group}"', bar_div.replace(' ', ''))
+            self.assertIn(f'"y":[{count}]', bar_div.replace(' ', ''))
+
+    def test_ect_view_with_facet(self):
+        response    = self.client.post('/ect_tool/ect/', {'survival_type': 'os', 'clinical_category': 'grade',
+                                                          'facet_category': 'mol_subtype'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['facet_title'], cns.CATEGORIES_DICT['mol_subtype'])
+        self.assertContains(response, 'POLE | ')
+        same        = self.client.post('/ect_tool/ect/', {'survival_type': 'os', 'clinical_category': 'grade',
+                                                          'facet_category': 'grade'})
+        self.assertIsNone(same.context['facet_title'])
+
+class ColumnarDatasetTests(TestCase):
+
+    def test_round_trip_is_memory_mapped(self):
+        import tempfile
+        import numpy as np
+        import pandas as pd
+        from pathlib import Path
+        from . import tcga_read_csv as tcga
+
+        csv_df = tcga.read_survival_csv()
+        with tempfile.TemporaryDirectory() as directory:
+            tcga.write_columnar_survival(csv_df, Path(directory))
+            self.assertFalse(tcga.columnar_survival_is_current(Path(directory)))
+            tcga.write_columnar_survival(csv_df, Path(directory), tcga.survival_file_fingerprint())
+            self.assertTrue(tcga.columnar_survival_is_current(Path(directory)))
+            df = tcga.read_columnar_survival(Path(directory))
+
+            pd.testing.assert_frame_equal(df.astype(object), csv_df.astype(object))
+            self.assertIsInstance(df['grade'].dtype, pd.CategoricalDtype)
+            self.assertIsInstance(np.load(Path(directory)/"001.npy", mmap_mode='r'), np.memmap)
+            self.assertFalse(df['os_months'].to_numpy().flags.writeable)
+
+            with mock.patch.object(tcga, 'survival_file_fingerprint', return_value='changed'):
+                self.assertFalse(tcga.columnar_survival_is_current(Path(directory)))
+
+    def test_fingerprint_taken_before_reading(self):
+        import json
+        import tempfile
+        from pathlib import Path
+        from . import tcga_read_csv as tcga
+
+        csv_df = tcga.read_survival_csv()
+        with tempfile.TemporaryDirectory() as directory, \
+             mock.patch.object(tcga, 'survival_file_fingerprint', side_effect=['read', 'replaced']), \
+             mock.patch.object(tcga, 'read_survival_csv', return_value=csv_df):
+            tcga.write_columnar_survival(directory=Path(directory))
+            manifest = json.loads((Path(directory)/"manifest.json").read_text())
+        self.assertEqual(manifest['source_fingerprint'], 'read')
+
+
+class SurvivalSchemaTests(TestCase):
+
+    def test_categories_follow_survival_groups(self):
+        import pandas as pd
+        for category, groups in cns.SURVIVAL_GROUPS.items():
+            dtype = cns.SURVIVAL[category].dtype
+            self.assertIsInstance(dtype, pd.CategoricalDtype)
+            self.assertTrue(dtype.ordered)
+            self.assertEqual(list(dtype.categories[:len(groups)]), groups)
+        # Values out of 'SURVIVAL_GROUPS' are kept at the end:
+        self.assertEqual(list(cns.SURVIVAL['bmi_status'].cat.categories)[-1], 'Underweight')
+        self.assertEqual(cns.SURVIVAL['os_status'].dtype, 'int8')
+
+    def test_group_codes_skip_empty_labels(self):
+        from . import ut_kaplan_meier as km
+        from . import ut_stats as stats
+
+        df          = cns.SURVIVAL.loc[cns.SURVIVAL['grade'] != 'G1']
+        table       = km.build_event_table(df['os_months'], df['os_status'], df['grade'].cat.codes.to_numpy(),
+                                           labels = list(df['grade'].cat.categories))
+        self.assertEqual(list(table['groups']), ['G2', 'G3'])
+        self.assertEqual(stats.multi_logrank_test_from_table(table)['degrees_of_freedom'], 1)
+
+
+class StartupImportTests(TestCase):
+
+    SCRIPT = '''
+import json, os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ect_demo.settings')
+import django
+django.setup()
+import ect_demo.urls
+at_startup = sorted(m for m in ('pandas', 'numpy', 'plotly', 'scipy', 'lifelines', 'sksurv') if m in sys.modules)
+from ect_tool import ut_cache
+ut_cache.get_category_context('os', 'grade')
+after_request = sorted(m for m in ('lifelines', 'sksurv', 'sklearn') if m in sys.modules)
+print(json.dumps({'at_startup': at_startup, 'after_request': after_request}))
+'''
+
+    def test_urlconf_imports_no_scientific_libraries(self):
+        import json
+        import subprocess
+        import sys
+        from django.conf import settings
+
+        output = subprocess.run([sys.executable, '-c', self.SCRIPT], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+
+        self.assertEqual(result['at_startup'], [])
+        self.assertEqual(result['after_request'], [])
+
+
+class SurvivalApiTests(TestCase):
+
+    URL = '/ect_tool/api/survival/'
+
+    def test_returns_survival_json(self):
+        response    = self.client.get(self.URL, {'mode': 'os', 'category': 'mol_subtype'})
+        self.assertEqual(response.status_code, 200)
+        payload     = response.json()
+        self.assertEqual([group['name'] for group in payload['groups']], cns.SURVIVAL_GROUPS['mol_subtype'])
+        self.assertEqual(payload['logrank']['degrees_of_freedom'], 3)
+        self.assertEqual(payload['at_risk_table'][0][0], 'Months')
+        self.assertEqual(sum(payload['population'].values()), len(cns.SURVIVAL))
+        for group in payload['groups']:
+            self.assertEqual(len(group['timeline']), len(group['survival']))
+            self.assertEqual(len(group['ci_lower']), len(group['ci_upper']))
+
+    def test_etag_not_modified(self):
+        response    = self.client.get(self.URL, {'mode': 'pfs', 'category': 'grade'})
+        cached      = self.client.get(self.URL, {'mode': 'pfs', 'category': 'grade'},
+                                      HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_gzip(self):
+        import gzip
+        import json
+        response    = self.client.get(self.URL, {'mode': 'os', 'category': 'stage'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['category'], 'stage')
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.URL, {'mode': 'dfs', 'category': 'grade'}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'mode': 'os'}).status_code, 400)
+        self.assertEqual(self.client.post(self.URL, {'mode': 'os', 'category': 'grade'}).status_code, 405)
+
+
+    def test_facet(self):
+        response    = self.client.get(self.URL, {'mode': 'os', 'category': 'mol_subtype', 'facet': 'grade'})
+        self.assertEqual(response.status_code, 200)
+        payload     = response.json()
+        self.assertEqual(payload['facet'], 'grade')
+        self.assertEqual([facet['name'] for facet in payload['facets']],
+                         [group for group in cns.SURVIVAL_GROUPS['grade'] if (cns.SURVIVAL['grade'] == group).any()])
+        self.assertNotEqual(response['ETag'], self.client.get(self.URL, {'mode': 'os', 'category': 'mol_subtype'})['ETag'])
+        for params in ({'facet': 'unknown'}, {'facet': 'mol_subtype'}):
+            self.assertEqual(self.client.get(self.URL, {'mode': 'os', 'category': 'mol_subtype', **params}).status_code, 400)
+
+class SurvivalBatchTests(TestCase):
+
+    URL = '/ect_tool/api/survival/batch/'
+
+    def setUp(self):
+        ut_cache.caches[ut_cache.CACHE_ALIAS].clear()
+
+    def test_batch_matches_single_analyses(self):
+        from . import ut_survival as surv
+        specs       = [('os', 'grade'), ('pfs', 'stage'), ('os', 'mol_subtype')]
+        results     = surv.km_batch_survival_helper(cns.SURVIVAL, specs, 'data')
+        for (mode, clinical_cat), result in zip(specs, results):
+            self.assertEqual(result, ut_cache.compute_category_payload(cns.SURVIVAL, mode, clinical_cat))
+
+    def test_process_pool_matches_serial(self):
+        from . import ut_survival as surv
+        specs       = [('os', 'grade'), ('pfs', 'grade')]
+        self.assertEqual(surv.km_batch_survival_helper(cns.SURVIVAL, specs, 'data', processes=2),
+                         surv.km_batch_survival_helper(cns.SURVIVAL, specs, 'data'))
+
+    def test_batch_fills_the_cache(self):
+        ut_cache.get_batch([('os', 'grade'), ('os', 'grade')], 'context')
+        with mock.patch.object(ut_cache, 'compute_category_context') as compute:
+            ut_cache.get_category_context('os', 'grade')
+        compute.assert_not_called()
+
+    def test_batch_api(self):
+        response    = self.client.get(self.URL, {'analysis': ['os:grade', 'pfs:stage']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(result['mode'], result['category']) for result in response.json()],
+                         [('os', 'grade'), ('pfs', 'stage')])
+        cached      = self.client.get(self.URL, {'analysis': ['os:grade', 'pfs:stage']},
+                                      HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_batch_api_defaults_to_every_analysis(self):
+        response    = self.client.get(self.URL)
+        self.assertEqual(len(response.json()), len(cns.SURVIVAL_MODES) * len(cns.CATEGORIES))
+
+    def test_batch_api_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.URL, {'analysis': 'os'}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'analysis': 'dfs:grade'}).status_code, 400)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_cases_cover_every_stage_and_analysis(self):
+        from . import ut_benchmark as bench
+        names       = [name for name, _ in bench.benchmark_cases(pattern='at_risk_table/*')]
+        self.assertEqual(len(names), len(cns.SURVIVAL_MODES) * len(cns.CATEGORIES))
+        results     = bench.run_benchmarks(bench.benchmark_cases([1000], '*/n1000/os/grade'), repeat=1)
+        self.assertEqual(set(results), {f"{stage}/n1000/os/grade" for stage in bench.STAGES if not stage.startswith('ect_view')})
+
+
+    def test_baseline_regressions(self):
+        import tempfile
+        from pathlib import Path
+        from . import ut_benchmark as bench
+        with tempfile.TemporaryDirectory() as directory:
+            path        = bench.save_baseline({'fast': 0.010, 'slow': 0.010}, Path(directory)/'baseline.json')
+            baseline    = bench.load_baseline(path)
+        regressions = bench.compare_to_baseline({'fast': 0.011, 'slow': 0.020, 'new': 1.0}, baseline, threshold=0.25)
+        self.assertEqual([regression['name'] for regression in regressions], ['slow'])
+        self.assertEqual(bench.missing_from_baseline({'fast': 0.011, 'new': 1.0}, baseline), ['new'])
+
+    def test_cold_view_keeps_other_results(self):
+        from . import ut_benchmark as bench
+        ut_cache.get_category_payload('os', 'stage')
+        ut_cache.get_category_context('os', 'grade')
+        cold_post   = dict(bench.benchmark_cases(pattern='ect_view/tcga/os/grade'))['ect_view/tcga/os/grade']
+        with self.settings(ALLOWED_HOSTS=['localhost']), \
+             mock.patch.object(ut_cache, 'compute_category_context', wraps=ut_cache.compute_category_context) as compute:
+            self.assertEqual(cold_post().status_code, 200)
+        compute.assert_called_once()
+        self.assertIsNotNone(ut_cache.cached_result('payload', 'os', 'stage')[1])
+
+    def test_missing_baseline_fails(self):
+        import io
+        import tempfile
+        from pathlib import Path
+        from django.core.management import CommandError, call_command
+        from . import ut_benchmark as bench
+        with tempfile.TemporaryDirectory() as directory, self.assertRaises(CommandError):
+            call_command('benchmark_survival', filter='at_risk_table/tcga/os/grade', repeat=1,
+                         baseline=Path(directory)/'missing.json', stdout=io.StringIO())
+        # A baseline without the measured cases:
+        with tempfile.TemporaryDirectory() as directory, self.assertRaisesMessage(CommandError, 'not in'):
+            path    = bench.save_baseline({'at_risk_table/tcga/os/stage': 0.01}, Path(directory)/'baseline.json')
+            call_command('benchmark_survival', filter='at_risk_table/tcga/os/grade', repeat=1,
+                         baseline=path, stdout=io.StringIO())
+
+
+class SyntheticCohortTests(TestCase):
+
+    def test_schema_and_vocabularies(self):
+        from . import ut_synthetic as syn
+        df          = syn.synthetic_cohort(5000, seed=1)
+        self.assertEqual(list(df.columns), list(cns.SURVIVAL.columns))
+        for clinical_cat, groups in cns.SURVIVAL_GROUPS.items():
+            self.assertEqual(list(df[clinical_cat].cat.categories), groups)
+        self.assertTrue(df['id'].is_unique)
+        self.assertTrue((df['pfs_months'] <= df['os_months']).all())
+        self.assertLessEqual(df['os_months'].max(), syn.SYNTHETIC_CONFIG['follow_up'])
+
+    def test_deterministic_by_seed(self):
+        from . import ut_synthetic as syn
+        first       = syn.synthetic_cohort(3000, seed=7, chunk_size=1000)
+        self.assertTrue(first.equals(syn.synthetic_cohort(3000, seed=7, chunk_size=1000)))
+        self.assertFalse(first.equals(syn.synthetic_cohort(3000, seed=8, chunk_size=1000)))
+
+    def test_hazard_ratios_and_censoring(self):
+        from . import ut_stats as stats
+        from . import ut_synthetic as syn
+        config      = syn.synthetic_config(hazard_ratios={'grade': [1.0, 1.0, 4.0]}, censoring_rate=0.0,
+                                           follow_up=float('inf'))
+        df          = syn.synthetic_cohort(20000, seed=2, config=config)
+        self.assertTrue((df['os_status'] == 1).all())
+        grade_means = df.groupby('grade', observed=True)['os_months'].mean()
+        self.assertAlmostEqual(grade_means['G1'] / grade_means['G3'], 4.0, delta=0.4)
+        self.assertLess(stats.stratified_logrank_test(df['os_months'], df['grade'], df['os_status'],
+                                                      df['radiotherapy'])['p_value'], 1e-10)
+
+    def test_streamed_files_match_the_cohort(self):
+        import json
+        import tempfile
+        import pandas as pd
+        from pathlib import Path
+        from . import tcga_read_csv as tcga
+        from . import ut_synthetic as syn
+        df          = syn.synthetic_cohort(2500, seed=4, chunk_size=1000)
+        with tempfile.TemporaryDirectory() as directory:
+            columnar    = tcga.read_columnar_survival(syn.write_cohort_columnar(Path(directory)/'columns', 2500,
+                                                                                seed=4, chunk_size=1000))
+            pd.testing.assert_frame_equal(columnar, df)
+            manifest    = json.loads((Path(directory)/'columns'/'manifest.json').read_text())
+            self.assertEqual(manifest['columns'][0], {'name': 'id', 'file': '000.npy', 'kind': 'pattern',
+                                                      'format': syn.ID_FORMAT})
+            csv         = pd.read_csv(syn.write_cohort_csv(Path(directory)/'cohort.csv', 2500, seed=4, chunk_size=1000))
+            self.assertEqual(csv['id'].tolist(), df['id'].tolist())
+            self.assertEqual(csv['stage'].tolist(), df['stage'].astype(str).tolist())
+
+
+class StageTimingTests(TestCase):
+
+    def setUp(self):
+        from . import ut_timing
+        ut_cache.caches[ut_cache.CACHE_ALIAS].clear()
+        ut_timing.reset_metrics()
+
+    def test_disabled_by_default(self):
+        from . import ut_timing
+        response    = self.client.get('/ect_tool/')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertIs(ut_timing.stage('sort'), ut_timing.stage('render'))
+        self.assertEqual(self.client.get('/ect_tool/metrics/').status_code, 404)
+
+    def test_server_timing_log_and_metrics(self):
+        import json
+        from django.test import override_settings
+        from django.test import Client
+        with override_settings(ECT_STAGE_TIMING=True, ECT_STAGE_METRICS=True):
+            client      = Client()
+            with self.assertLogs('ect_tool.timing', level='INFO') as logs:
+                response    = client.post('/ect_tool/ect/', {'survival_type': 'os', 'clinical_category': 'grade'})
+            metrics     = client.get('/ect_tool/metrics/')
+        stages      = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        for name in ('sort', 'event_table', 'logrank', 'km_fit', 'traces', 'annotations', 'serialize',
+                     'at_risk_table', 'bar_plot', 'cache', 'render', 'total'):
+            self.assertIn(name, stages)
+        line        = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['path'], '/ect_tool/ect/')
+        self.assertEqual(set(line['stages']), set(stages))
+        self.assertEqual(metrics.status_code, 200)
+        self.assertIn('ect_stage_duration_seconds_count{stage="traces"} 1', metrics.content.decode())
+        self.assertIn('ect_stage_duration_seconds_bucket{stage="total",le="+Inf"} 1', metrics.content.decode())
+
+
+class AsyncViewsTests(TestCase):
+
+    def setUp(self):
+        from django.test import RequestFactory
+        ut_cache.caches[ut_cache.CACHE_ALIAS].clear()
+        self.factory    = RequestFactory()
+
+    def tearDown(self):
+        from . import ut_async
+        ut_async.shutdown()
+
+    def test_matches_sync_views(self):
+        import asyncio
+        import json
+        from . import views
+        request     = self.factory.get('/ect_tool/api/survival/', {'mode': 'os', 'category': 'grade'})
+        response    = asyncio.run(views.api_survival_async(request))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), ut_cache.compute_category_payload(cns.SURVIVAL, 'os', 'grade'))
+        self.assertEqual(response['ETag'], ut_cache.category_etag('os', 'grade'))
+        # Stored in the cache of the server process:
+        self.assertIsNotNone(ut_cache.cached_result('payload', 'os', 'grade')[1])
+        cached      = self.factory.get('/ect_tool/api/survival/', {'mode': 'os', 'category': 'grade'},
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(asyncio.run(views.api_survival_async(cached)).status_code, 304)
+        invalid     = self.factory.get('/ect_tool/api/survival/', {'mode': 'dfs', 'category': 'grade'})
+        self.assertEqual(asyncio.run(views.api_survival_async(invalid)).status_code, 400)
+        page        = self.factory.post('/ect_tool/ect/', {'survival_type': 'pfs', 'clinical_category': 'stage'})
+        response    = asyncio.run(views.ect_async(page))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'plotly-graph-div', response.content)
+
+    def test_spawned_workers(self):
+        from concurrent.futures import ProcessPoolExecutor
+        from django.contrib.auth import get_user_model
+        from multiprocessing import get_context
+        from . import ut_async
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn'),
+                                 initializer=ut_async._init_worker) as executor:
+            # Raises 'AppRegistryNotReady' in a worker without Django set up:
+            executor.submit(get_user_model).result()
+            _, payload  = executor.submit(ut_cache.compute_result, 'payload', 'os', 'grade', None, None).result()
+        self.assertEqual(payload, ut_cache.compute_category_payload(cns.SURVIVAL, 'os', 'grade'))
+
+    def test_single_flight(self):
+        import asyncio
+        from . import ut_async
+
+        async def concurrent_requests():
+            requests    = [asyncio.create_task(ut_async.get_result('payload', 'os', 'mol_subtype')) for _ in range(3)]
+            await asyncio.sleep(0)
+            in_flight   = len(ut_async._in_flight)
+            return in_flight, await asyncio.gather(*requests)
+
+        in_flight, results  = asyncio.run(concurrent_requests())
+        self.assertEqual(in_flight, 1)
+        self.assertTrue(results[0] is results[1] is results[2])
+        self.assertEqual(ut_async._in_flight, {})
+
+    def test_broken_pool_is_replaced(self):
+        import asyncio
+        import os
+        from concurrent.futures.process import BrokenProcessPool
+        from . import ut_async
+        broken      = ut_async.executor()
+        with self.assertRaises(BrokenProcessPool):
+            # A worker dying, like an out of memory kill:
+            broken.submit(os._exit, 1).result()
+        result      = asyncio.run(ut_async.get_result('payload', 'os', 'grade'))
+        self.assertEqual(result, ut_cache.compute_category_payload(cns.SURVIVAL, 'os', 'grade'))
+        self.assertIsNot(ut_async.executor(), broken)
+
+    def test_failed_store_is_not_left_in_flight(self):
+        import asyncio
+        from . import ut_async
+        with mock.patch.object(ut_cache, 'store_result', side_effect=RuntimeError('cache down')), \
+             self.assertLogs('concurrent.futures', 'ERROR'):
+            asyncio.run(ut_async.get_result('payload', 'os', 'grade'))
+        self.assertEqual(ut_async._in_flight, {})
+
+    def test_queue_limit(self):
+        import asyncio
+        from django.test import override_settings
+        from . import views
+        request     = self.factory.get('/ect_tool/api/survival/', {'mode': 'os', 'category': 'grade'})
+        with override_settings(ECT_ASYNC_QUEUE_LIMIT=0):
+            response    = asyncio.run(views.api_survival_async(request))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        # Cached analyses are still served:
+        ut_cache.get_category_payload('os', 'grade')
+        with override_settings(ECT_ASYNC_QUEUE_LIMIT=0):
+            self.assertEqual(asyncio.run(views.api_survival_async(request)).status_code, 200)
+
+
+class PrecomputedArtifactsTests(TestCase):
+
+    def setUp(self):
+        import tempfile
+        ut_cache.caches[ut_cache.CACHE_ALIAS].clear()
+        self.directory  = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_command_writes_served_artifacts(self):
+        from django.core.management import call_command
+        from django.test import override_settings
+        from io import StringIO
+        call_command('precompute_survival', output=self.directory.name, mode=['os'], category=['grade'],
+                     facets=True, processes=1, stdout=StringIO())
+        expected    = ut_cache.compute_category_payload(cns.SURVIVAL, 'os', 'grade', 'stage')
+        with override_settings(ECT_ARTIFACTS_DIR=self.directory.name), \
+                mock.patch.object(ut_cache, 'current_survival') as current_survival:
+            payload     = ut_cache.get_category_payload('os', 'grade', 'stage')
+            response    = self.client.post('/ect_tool/ect/', {'survival_type': 'os', 'clinical_category': 'grade'})
+        current_survival.assert_not_called()
+        self.assertEqual(payload, expected)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'plotly-graph-div', response.content)
+
+    def test_content_addressed(self):
+        from pathlib import Path
+        from . import ut_artifacts
+        result      = {'mode': 'os', 'groups': []}
+        self.assertEqual(ut_artifacts.write_artifacts(self.directory.name, [('a', result), ('b', result)]), 1)
+        self.assertEqual(ut_artifacts.write_artifacts(self.directory.name, [('c', result)]), 0)
+        manifest    = ut_artifacts._read_manifest(Path(self.directory.name))
+        self.assertEqual(set(manifest), {'a', 'b', 'c'})
+        self.assertEqual(len(set(manifest.values())), 1)
+        # Unknown keys, like the ones of another dataset version, are computed:
+        from django.test import override_settings
+        with override_settings(ECT_ARTIFACTS_DIR=self.directory.name):
+            self.assertEqual(ut_artifacts.read_artifact('b'), result)
+            self.assertIsNone(ut_artifacts.read_artifact('d'))
+
+
+class CohortFilterTests(TestCase):
+
+    COHORT = 'stage:Stage IV|stage:Stage III, grade:G3,!radiotherapy:Yes'
+
+    def setUp(self):
+        ut_cache.caches[ut_cache.CACHE_ALIAS].clear()
+
+    def test_parse_is_canonical(self):
+        from . import ut_cohort
+        clauses     = ut_cohort.parse_cohort(self.COHORT)
+        self.assertEqual(ut_cohort.cohort_text(clauses), 'grade:G3,stage:Stage III|stage:Stage IV,!radiotherapy:Yes')
+        self.assertEqual(ut_cohort.parse_cohort(ut_cohort.cohort_text(clauses)), clauses)
+        for text in ('grade:G4', 'size:big', 'grade'):
+            with self.assertRaises(ValueError):
+                ut_cohort.parse_cohort(text)
+
+    def test_mask_matches_pandas(self):
+        from . import ut_cohort
+        df          = cns.SURVIVAL
+        expected    = (df['stage'].isin(['Stage III', 'Stage IV']) & (df['grade'] == 'G3')
+                       & (df['radiotherapy'] != 'Yes')).to_numpy()
+        self.assertTrue((ut_cohort.cohort_mask(df, self.COHORT) == expected).all())
+        self.assertFalse(ut_cohort.cohort_mask(df, 'grade:G1,grade:G2').any())
+
+    def test_analysis_matches_filtered_dataset(self):
+        import numpy as np
+        from . import ut_cohort
+        df          = cns.SURVIVAL
+        filtered    = df[ut_cohort.cohort_mask(df, self.COHORT)]
+        for facet in (None, 'age_group'):
+            payload     = ut_cache.compute_category_payload(df, 'os', 'mol_subtype', facet, self.COHORT)
+            expected    = ut_cache.compute_category_payload(filtered, 'os', 'mol_subtype', facet)
+            self.assertEqual(payload.pop('cohort'), self.COHORT)
+            self.assertEqual(payload['population'], expected['population'])
+            # The same numbers, summed in another order:
+            for analysis, expected_analysis in zip(payload.get('facets', [payload]), expected.get('facets', [expected])):
+                self.assertEqual(analysis['at_risk_table'], expected_analysis['at_risk_table'])
+                self.assertAlmostEqual(analysis['logrank']['p_value'], expected_analysis['logrank']['p_value'])
+                for group, expected_group in zip(analysis['groups'], expected_analysis['groups'], strict=True):
+                    self.assertEqual(group['name'], expected_group['name'])
+                    self.assertTrue(np.allclose(group['survival'], expected_group['survival'], atol=1e-5))
+        context     = ut_cache.compute_category_context(df, 'pfs', 'mol_subtype', None, self.COHORT)
+        self.assertEqual(context['table_plot'],
+                         ut_cache.compute_category_context(filtered, 'pfs', 'mol_subtype')['table_plot'])
+
+    def test_api_and_form(self):
+        URL         = '/ect_tool/api/survival/'
+        response    = self.client.get(URL, {'mode': 'os', 'category': 'grade', 'cohort': 'stage:Stage I'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['cohort'], 'stage:Stage I')
+        self.assertEqual(sum(response.json()['population'].values()), (cns.SURVIVAL['stage'] == 'Stage I').sum())
+        self.assertNotEqual(response['ETag'], self.client.get(URL, {'mode': 'os', 'category': 'grade'})['ETag'])
+        self.assertEqual(self.client.get(URL, {'mode': 'os', 'category': 'grade', 'cohort': 'stage:V'}).status_code, 400)
+        page        = self.client.post('/ect_tool/ect/', {'survival_type': 'os', 'clinical_category': 'grade',
+                                                          'cohort': 'grade:G1,grade:G2'})
+        self.assertEqual(page.status_code, 200)
+        invalid     = self.client.post('/ect_tool/ect/', {'survival_type': 'os', 'clinical_category': 'grade',
+                                                          'cohort': 'stage:V'})
+        self.assertEqual(invalid.status_code, 400)
+        self.assertContains(invalid, 'Unknown cohort filter term', status_code=400)
+
+    def test_empty_cohort(self):
+        import json
+        import numpy as np
+        from . import ut_stats
+        def no_constants(constant):
+            raise ValueError(constant)
+        for category in ('grade', 'stage'):
+            response    = self.client.get('/ect_tool/api/survival/', {'mode': 'os', 'category': category,
+                                                                      'cohort': 'grade:G1,grade:G2'})
+            self.assertEqual(response.status_code, 200)
+            payload     = json.loads(response.content, parse_constant=no_constants)
+            self.assertEqual(sum(payload['population'].values()), 0)
+            self.assertEqual(payload['logrank'], {'test_statistic': None, 'degrees_of_freedom': 0, 'p_value': None})
+        one_group   = ut_stats.multi_logrank_test_from_table(ut_stats.km.build_event_table(np.array([1.0, 2.0]),
+                                                                                            np.array([1, 0]),
+                                                                                            np.array([0, 0])))
+        self.assertEqual(one_group['degrees_of_freedom'], 0)
+        self.assertTrue(np.isnan(one_group['p_value']))
+
+
+class CoxModelTests(TestCase):
+
+    URL = '/ect_tool/api/cox/'
+
+    def setUp(self):
+        ut_cache.caches[ut_cache.CACHE_ALIAS].clear()
+
+    def test_matches_lifelines(self):
+        import numpy as np
+        import pandas as pd
+        from lifelines import CoxPHFitter
+        from . import ut_cox
+        df          = cns.SURVIVAL
+        for mode, categories in (('os', ['grade']), ('pfs', ['stage', 'grade', 'mol_subtype'])):
+            model       = ut_cox.cox_model(df, mode, categories)
+            fitted      = [coefficient for coefficient in model['coefficients'] if coefficient['coef'] is not None]
+            data        = pd.DataFrame({'T': df[f'{mode}_months'], 'E': df[f'{mode}_status'].astype(float)})
+            for coefficient in fitted:
+                data[coefficient['group']] = (df[coefficient['category']] == coefficient['group']).astype(float)
+            expected    = CoxPHFitter().fit(data, 'T', 'E')
+            self.assertTrue(model['converged'])
+            self.assertEqual(model['patients'], len(df))
+            self.assertTrue(np.allclose([c['coef'] for c in fitted], expected.params_, atol=1e-4))
+            self.assertTrue(np.allclose([c['se'] for c in fitted], expected.standard_errors_, atol=1e-4))
+            self.assertAlmostEqual(model['likelihood_ratio']['test_statistic'],
+                                   expected.log_likelihood_ratio_test().test_statistic, places=4)
+
+    def test_design_built_once(self):
+        from . import ut_cox
+        ut_cox._designs.clear()
+        with mock.patch.object(ut_cox, 'build_design', wraps=ut_cox.build_design) as build_design:
+            ut_cache.get_cox_payload('os', ['grade'])
+            ut_cache.get_cox_payload('os', ['stage', 'grade'], 'multivariable')
+            ut_cache.get_cox_payload('os', ['stage'], cohort='grade:G3')
+            ut_cache.get_cox_payload('pfs', ['stage'])
+        self.assertEqual([call.args[1] for call in build_design.call_args_list], ['os', 'pfs'])
+
+    def test_groups_without_events(self):
+        from . import ut_cox
+        rows        = ut_cache.coh.cohort_mask(cns.SURVIVAL, 'stage:Stage III')
+        model       = ut_cox.cox_model(cns.SURVIVAL, 'os', ['grade'], rows)
+        by_group    = {coefficient['group']: coefficient for coefficient in model['coefficients']}
+        self.assertEqual(by_group['G1']['events'], 0)
+        self.assertIsNone(by_group['G1']['hazard_ratio'])
+        self.assertTrue(by_group['G2']['reference'])
+        self.assertEqual(model['patients'], rows.sum() - (cns.SURVIVAL['grade'][rows] == 'G1').sum())
+        self.assertEqual(model['likelihood_ratio']['degrees_of_freedom'], 1)
+
+    def test_counts_after_pruning(self):
+        from . import ut_cox
+        rows        = ut_cache.coh.cohort_mask(cns.SURVIVAL, 'mol_subtype:POLE')
+        model       = ut_cox.cox_model(cns.SURVIVAL, 'pfs', cns.CATEGORIES, rows)
+        for category in cns.CATEGORIES:
+            coefficients    = [c for c in model['coefficients'] if c['category'] == category]
+            self.assertEqual(sum(c['patients'] for c in coefficients), model['patients'])
+            self.assertEqual(sum(c['events'] for c in coefficients), model['events'])
+            self.assertTrue(all(c['events'] > 0 for c in coefficients if c['patients'] > 0))
+
+    def test_degenerate_cohort(self):
+        import json
+        import numpy as np
+        from . import ut_cox
+        def no_constants(constant):
+            raise ValueError(constant)
+        response    = self.client.get(self.URL, {'mode': 'pfs', 'model': 'multivariable', 'cohort': 'mol_subtype:POLE'})
+        self.assertEqual(response.status_code, 200)
+        model       = json.loads(response.content, parse_constant=no_constants)['models'][0]
+        self.assertFalse(model['estimable'])
+        self.assertIsNone(model['likelihood_ratio']['p_value'])
+        self.assertTrue(all(c['hazard_ratio'] is None for c in model['coefficients'] if not c['reference']))
+        self.assertIn('Not estimable', [row[-2] for row in json.loads(response.content)['hazard_ratio_table']])
+        # Collinear groups:
+        with mock.patch.object(ut_cox, 'cox_fit', side_effect=np.linalg.LinAlgError):
+            model   = ut_cox.cox_model(cns.SURVIVAL, 'os', ['grade'])
+        self.assertFalse(model['converged'])
+        self.assertFalse(model['estimable'])
+
+    def test_api(self):
+        response    = self.client.get(self.URL, {'mode': 'os', 'category': ['stage', 'grade'], 'model': 'multivariable'})
+        self.assertEqual(response.status_code, 200)
+        payload     = response.json()
+        self.assertEqual(len(payload['models']), 1)
+        self.assertEqual(payload['hazard_ratio_table'][0][-2], 'Hazard ratio (95% CI)')
+        self.assertEqual(len(payload['hazard_ratio_table']),
+                         1 + len(cns.SURVIVAL_GROUPS['stage']) + len(cns.SURVIVAL_GROUPS['grade']))
+        self.assertEqual(len(payload['figure']['data']), 2)
+        cached      = self.client.get(self.URL, {'mode': 'os', 'category': ['stage', 'grade'], 'model': 'multivariable'},
+                                      HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(len(self.client.get(self.URL, {'mode': 'pfs'}).json()['models']), len(cns.CATEGORIES))
+        for params in ({'mode': 'dfs'}, {'mode': 'os', 'model': 'lasso'}, {'mode': 'os', 'category': ['grade', 'grade']},
+                       {'mode': 'os', 'cohort': 'stage:V'}):
+            self.assertEqual(self.client.get(self.URL, params).status_code, 400)
+
+
+class ResamplingTests(TestCase):
+
+    def test_permutation_statistics(self):
+        import numpy as np
+        from . import ut_kaplan_meier as km
+        from . import ut_resampling as resampling
+        from . import ut_stats as stats
+
+        df          = cns.SURVIVAL
+        rows        = resampling._resampling_rows(df['os_months'], df['grade'], df['os_status'])
+        seed        = np.random.SeedSequence(7)
+        statistics  = resampling._permutation_shard(rows, seed, 5)
+        permuted    = np.random.default_rng(seed).permuted(np.broadcast_to(rows['codes'], (5, len(rows['codes']))), axis=1)
+        for statistic, codes in zip(statistics, permuted):
+            table   = km.build_event_table(rows['timeline'][rows['time_codes']], rows['events'], codes)
+            self.assertAlmostEqual(statistic, stats.multi_logrank_test_from_table(table)['test_statistic'])
+
+    def test_permutation_p_value(self):
+        from . import ut_resampling as resampling
+        from . import ut_stats as stats
+
+        df          = cns.SURVIVAL
+        arguments   = (df['pfs_months'], df['bmi_status'].astype(str), df['pfs_status'])
+        result      = resampling.permutation_logrank_test(*arguments, permutations=2000)
+        self.assertEqual(result['permutations'], 2000)
+        self.assertAlmostEqual(result['p_value'], result['asymptotic_p_value'], delta=0.05)
+        # The same seed gives the same pvalue with a process pool:
+        self.assertEqual(resampling.permutation_logrank_test(*arguments, permutations=2000, processes=2)['p_value'],
+                         result['p_value'])
+        self.assertEqual(stats.calculate_formatted_permutation_logrank_p(*arguments, permutations=2000),
+                         stats.format_p_value(result['p_value']))
+
+    def test_permutation_single_group(self):
+        import numpy as np
+        from . import ut_resampling as resampling
+        from . import ut_stats as stats
+
+        df          = cns.SURVIVAL
+        arguments   = (df['os_months'], np.full(len(df), 'All'), df['os_status'])
+        with mock.patch.object(resampling, '_run_shards') as run_shards:
+            result  = resampling.permutation_logrank_test(*arguments, permutations=200)
+        run_shards.assert_not_called()
+        self.assertEqual(result['degrees_of_freedom'], 0)
+        self.assertTrue(np.isnan(result['p_value']))
+        self.assertEqual(stats.calculate_formatted_permutation_logrank_p(*arguments, permutations=200),
+                         stats.calculate_formatted_multi_logrank_p(*arguments))
+        # No permutation is as extreme as very different groups:
+        strong      = resampling.permutation_logrank_test(df['os_months'], df['mol_subtype'], df['os_status'], 500)
+        self.assertEqual(strong['p_value'], 1 / 501)
+
+    def test_bootstrap_bands(self):
+        import numpy as np
+        from . import ut_kaplan_meier as km
+        from . import ut_resampling as resampling
+
+        df          = cns.SURVIVAL
+        arguments   = (df['os_months'], df['tumor_type'], df['os_status'])
+        bands       = resampling.bootstrap_survival_bands(*arguments, resamples=400)
+        table       = km.build_event_table(df['os_months'], df['os_status'], df['tumor_type'].astype(str))
+        curves      = km.kaplan_meier_curves(table)
+        self.assertEqual(list(bands['groups']), list(table['groups']))
+        self.assertTrue(np.allclose(bands['survival'], curves['survival']))
+        self.assertTrue((bands['ci_lower'] <= bands['survival'] + 1e-12).all())
+        self.assertTrue((bands['ci_upper'] >= bands['survival'] - 1e-12).all())
+        # Close to the Greenwood intervals for these group sizes:
+        self.assertLess(np.abs(bands['ci_lower'] - curves['ci_lower']).max(), 0.06)
+        grid        = resampling.bootstrap_survival_bands(*arguments, resamples=400, processes=2, times=[0, 60])
+        self.assertTrue((grid['ci_lower'][0] == 1).all())
+        self.assertTrue(np.array_equal(grid['ci_upper'][1],
+                                       bands['ci_upper'][np.searchsorted(bands['timeline'], 60, side='right') - 1]))
+
+
+class StreamingIngestionTests(TestCase):
+
+    def test_aggregate_matches_dataset(self):
+        import numpy as np
+        from . import plotly_survival_plots as sp
+        from . import ut_ingest
+
+        aggregate   = ut_ingest.ingest_survival(chunk_rows=50)
+        self.assertEqual(aggregate['rows'], len(cns.SURVIVAL))
+        self.assertEqual(aggregate['invalid'], {'os': 0, 'pfs': 0})
+        self.assertEqual(aggregate['unknown']['bmi_status'], {'Underweight': 1})
+        for mode in cns.SURVIVAL_MODES:
+            for category in cns.CATEGORIES:
+                with self.subTest(mode=mode, category=category):
+                    result      = ut_ingest.aggregate_survival_estimates(aggregate, mode, category)
+                    expected    = sp.km_survival_estimates(cns.SURVIVAL, mode, category, cns.SURVIVAL_GROUPS[category])
+                    self.assertEqual(list(result['event_table']['groups']), list(expected['event_table']['groups']))
+                    for key in ('timeline', 'observed', 'removed', 'at_risk'):
+                        self.assertTrue(np.array_equal(result['event_table'][key], expected['event_table'][key]))
+                    self.assertAlmostEqual(result['logrank']['p_value'], expected['logrank']['p_value'], places=12)
+                    self.assertEqual(list(result['groups_km_dict']), list(expected['groups_km_dict']))
+
+    def test_invalid_rows_and_columns(self):
+        import os
+        import tempfile
+        import pandas as pd
+        from . import ut_ingest
+
+        columns     = ut_ingest.survival_columns(['os'], ['grade'])
+        rows        = pd.DataFrame([[10.0, 1, 'G1'], [12.0, 0, 'G2'], [-1.0, 1, 'G1'], [None, 0, 'G2'],
+                                    [5.0, 2, 'G3'], [7.0, 1, 'G4'], [7.0, 0, None], [10.0, 0, 'G1']], columns=columns)
+        with tempfile.TemporaryDirectory() as directory:
+            path    = os.path.join(directory, 'registry.csv')
+            rows.to_csv(path, index=False)
+            aggregate   = ut_ingest.ingest_survival(path, ['os'], ['grade'], chunk_rows=3)
+            with self.assertRaises(ValueError):
+                ut_ingest.ingest_survival(path, ['pfs'], ['grade'])
+        self.assertEqual(aggregate['rows'], 8)
+        self.assertEqual(aggregate['invalid'], {'os': 3})
+        self.assertEqual(aggregate['unknown'], {'grade': {'G4': 1}})
+        table       = ut_ingest.aggregate_event_table(aggregate, 'os', 'grade')
+        self.assertEqual(list(table['groups']), ['G1', 'G2', 'G4'])
+        self.assertEqual(table['timeline'].tolist(), [7.0, 10.0, 12.0])
+        self.assertEqual(table['removed'].tolist(), [[0, 0, 1], [2, 0, 0], [0, 1, 0]])
+        self.assertEqual(table['observed'].tolist(), [[0, 0, 1], [1, 0, 0], [0, 0, 0]])
@@ -5,6 +5,9 @@
 # - This file contains all the paths for Endometrial Cancer Tool (Demo)
 #   will use to serve the views:
 #
+# - With ECT_ASYNC_VIEWS the EC Tool and the survival API are served by
+#   their async views, for ASGI servers.
+#
 # =====================================================================
 # IMPORTS
 # =====================================================================
@@ -18,6 +21,8 @@ from .                          import views
 # PATHS
 # =====================================================================
 
+ASYNC_VIEWS     = getattr(settings, 'ECT_ASYNC_VIEWS', False)
+
 app_name        = 'ect'
 urlpatterns     = [
     
@@ -33,7 +38,7 @@ urlpatterns     = [
 
         # /ect_tool/ect/
         path(   'ect_tool/ect/',                    
-                views.ect,                     
+                views.ect_async if ASYNC_VIEWS else views.ect,
                 name='ect'),
 
         # /ect_tool/cite_us/
@@ -41,5 +46,25 @@ urlpatterns     = [
                 views.cite_us,                     
                 name='cite_us'),
 
+        # /ect_tool/api/survival/?mode=os&category=grade
+        path(   'ect_tool/api/survival/',
+                views.api_survival_async if ASYNC_VIEWS else views.api_survival,
+                name='api_survival'),
+
+        # /ect_tool/api/survival/batch/?analysis=os:grade&analysis=pfs:stage
+        path(   'ect_tool/api/survival/batch/',
+                views.api_survival_batch,
+                name='api_survival_batch'),
+
+        # /ect_tool/api/cox/?mode=os&category=stage&category=grade&model=multivariable
+        path(   'ect_tool/api/cox/',
+                views.api_cox,
+                name='api_cox'),
+
+        # /ect_tool/metrics/
+        path(   'ect_tool/metrics/',
+                views.metrics,
+                name='metrics'),
+
 
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
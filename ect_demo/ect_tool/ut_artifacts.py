@@ -0,0 +1,163 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) precomputed survival analyses on disk.
+#
+# - The 'precompute_survival' command writes every survival analysis to
+#   an artifact directory, which can be baked into the deployment image.
+#   When the ECT_ARTIFACTS_DIR setting points to it, the results missing
+#   from the 'survival' cache are read from it instead of computed. This
+#   file contains the functions to write and read the artifacts:
+#
+#   - artifacts_dir(): artifact directory of the settings.
+#   - write_artifacts(): store many results in an artifact directory.
+#   - read_artifact(): stored result of a cache key.
+#
+# - The directory is content-addressed: each result is a JSON file named
+#   by the SHA-256 digest of its content, under 'objects/', and
+#   'manifest.json' maps the 'ut_cache' keys to the digests. The keys
+#   contain the 'survival.csv' fingerprint, so the artifacts of another
+#   dataset version are never read.
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    django.conf         import  settings
+from    pathlib             import  Path
+import  hashlib
+import  json
+import  os
+import  tempfile
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Files of an artifact directory:
+MANIFEST_NAME:      str     = 'manifest.json'
+OBJECTS_DIR:        str     = 'objects'
+
+# Manifest read last, reloaded when its file changes:
+_manifest:          dict    = {}
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Artifact directory of the settings
+# ---------------------------------------------------------------------
+def artifacts_dir()->Path|None:
+    '''
+    Return the ECT_ARTIFACTS_DIR directory, or None when the artifacts
+    are not used.
+    '''
+    directory:  str|None    = getattr(settings, 'ECT_ARTIFACTS_DIR', None)
+
+    return Path(directory) if directory else None
+
+
+# Store results in an artifact directory
+# ---------------------------------------------------------------------
+def write_artifacts(directory:  Path,
+                    results:    list[tuple[str, dict]])->int:
+    '''
+    Write each result to the 'directory' objects, and add their keys to
+    its manifest, keeping the entries of other analyses.
+
+    ## Parameters:
+        - directory (Path): artifact directory, created if needed.
+        - results (list[tuple[str, dict]]): (cache key, JSON serializable
+        result) pairs, like the ones of 'ut_cache.compute_result()'.
+
+    ## Return:
+        - count (int): number of new objects written, the ones already
+        in the directory are shared.
+    '''
+    directory                   = Path(directory)
+    manifest:       dict        = _read_manifest(directory)
+    count:          int         = 0
+
+    for key, result in results:
+        content:    bytes       = json.dumps(result, separators=(',', ':'), sort_keys=True).encode()
+        digest:     str         = hashlib.sha256(content).hexdigest()
+        path:       Path        = _object_path(directory, digest)
+
+        if not path.exists():
+            _write_atomic(path, content)
+            count              += 1
+        manifest[key]           = digest
+
+    _write_atomic(directory / MANIFEST_NAME, json.dumps(manifest, indent=1, sort_keys=True).encode())
+
+    return count
+
+
+# Stored result of a cache key
+# ---------------------------------------------------------------------
+def read_artifact(key: str)->dict|None:
+    '''
+    Return the result stored for the 'ut_cache' 'key' in the
+    ECT_ARTIFACTS_DIR directory, or None if there is none.
+    '''
+    directory:      Path|None   = artifacts_dir()
+
+    if directory is None:
+        return None
+
+    manifest_path:  Path        = directory / MANIFEST_NAME
+
+    try:
+        modified:   float       = manifest_path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+    if _manifest.get('version') != (manifest_path, modified):
+        _manifest.update(version = (manifest_path, modified), entries = _read_manifest(directory))
+
+    digest:         str|None    = _manifest['entries'].get(key)
+
+    if digest is None:
+        return None
+
+    return json.loads(_object_path(directory, digest).read_bytes())
+
+
+# Manifest of an artifact directory
+# ---------------------------------------------------------------------
+def _read_manifest(directory: Path)->dict[str, str]:
+    '''
+    Return the cache key to digest entries of the 'directory' manifest,
+    empty if it has none.
+    '''
+    try:
+        return json.loads((directory / MANIFEST_NAME).read_bytes())
+    except FileNotFoundError:
+        return {}
+
+
+# Path of an artifact object
+# ---------------------------------------------------------------------
+def _object_path(directory: Path,
+                 digest:    str)->Path:
+    '''
+    Return the file of the 'digest' object, in a subdirectory named by
+    its first 2 characters.
+    '''
+    return directory / OBJECTS_DIR / digest[:2] / f"{digest}.json"
+
+
+# Write a file atomically
+# ---------------------------------------------------------------------
+def _write_atomic(path:     Path,
+                  content:  bytes):
+    '''
+    Write 'content' to a temporary file next to 'path' and rename it, so
+    a running server never reads a half written file.
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary   = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+
+    with os.fdopen(descriptor, 'wb') as file:
+        file.write(content)
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, path)
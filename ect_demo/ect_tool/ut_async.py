@@ -0,0 +1,192 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) survival analyses for the async views.
+#
+# - The survival pipeline is CPU bound (pandas, Kaplan-Meier, plotly
+#   serialization), so the async views must not run it in the event
+#   loop of the ASGI server. This file contains the functions that
+#   compute the analyses missing from the 'survival' cache in a bounded
+#   pool of worker processes:
+#
+#   - executor(): process pool shared by all the requests.
+#   - shutdown(): stop the process pool.
+#   - get_result(): cached or computed result of an analysis.
+#
+# - Concurrent requests for the same analysis share one computation
+#   (single-flight), and when ECT_ASYNC_QUEUE_LIMIT different analyses
+#   are being computed the new ones are refused with 'queue.Full', which
+#   the views answer with a 503 status.
+#
+# - Other modules used are:
+#
+#   - ut_cache
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    concurrent.futures  import  Future, ProcessPoolExecutor
+from    concurrent.futures.process  import  BrokenProcessPool
+from    django.conf         import  settings
+from    queue               import  Full
+import  asyncio
+import  django
+import  threading
+from    .                   import  ut_cache        as  cache
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Default number of analyses computed or waiting for a worker:
+QUEUE_LIMIT:        int                         = 16
+
+# Seconds a refused client is asked to wait, 'Retry-After' header:
+RETRY_AFTER:        int                         = 5
+
+# Process pool, created on first use:
+_executor:          ProcessPoolExecutor|None    = None
+
+# Analyses being computed, by cache key:
+_in_flight:         dict[str, Future]           = {}
+_lock:              threading.RLock             = threading.RLock()
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Process pool of the async views
+# ---------------------------------------------------------------------
+def executor()->ProcessPoolExecutor:
+    '''
+    Return the process pool computing the analyses, with
+    ECT_ASYNC_WORKERS processes (default: one per CPU). Each worker
+    reads the survival dataset once, with 'ut_cache.current_survival()'.
+    '''
+    global _executor
+
+    with _lock:
+        if _executor is None:
+            _executor   = ProcessPoolExecutor(max_workers = getattr(settings, 'ECT_ASYNC_WORKERS', None),
+                                              initializer = _init_worker)
+
+    return _executor
+
+
+# Worker process initializer
+# ---------------------------------------------------------------------
+def _init_worker():
+    '''
+    Set up Django in the worker process and read the survival dataset
+    before its first analysis. A worker started with the 'spawn' or
+    'forkserver' methods (macOS, Windows) does not inherit the apps and
+    cache backends of the server process, only its environment.
+    '''
+    django.setup()
+    cache.current_survival()
+
+
+# Stop the process pool
+# ---------------------------------------------------------------------
+def shutdown():
+    '''
+    Stop the worker processes, waiting for the running analyses. The
+    next 'executor()' call starts a new pool.
+    '''
+    global _executor
+
+    with _lock:
+        pool, _executor     = _executor, None
+
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+# Cached or computed survival analysis
+# ---------------------------------------------------------------------
+async def get_result(kind:          str,
+                     mode:          str,
+                     clinical_cat:  str,
+                     facet:         str|None    = None,
+                     cohort:        str|None    = None)->dict:
+    '''
+    Return the 'kind' result ('context' or 'payload') of the 'mode',
+    'clinical_cat', 'facet' and 'cohort' analysis from the 'survival'
+    cache. On a miss it is computed by a worker process and stored in
+    the cache, while the event loop keeps serving other requests.
+
+    ## Parameters:
+        - kind (str): 'context' or 'payload'.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - clinical_cat (str): category to be analyzed.
+        - facet (str|None): Optional parameter. Category splitting the
+        analysis.
+        - cohort (str|None): Optional parameter. Canonical cohort filter
+        of the patients to analyze, see 'ut_cohort'.
+
+    ## Return:
+        - result (dict): survival analysis, must not be modified.
+
+    A missing analysis raises 'queue.Full' when ECT_ASYNC_QUEUE_LIMIT
+    other analyses are being computed.
+    '''
+    key, result                     = cache.cached_result(kind, mode, clinical_cat, facet, cohort)
+
+    if result is not None:
+        return result
+
+    with _lock:
+        future:     Future|None     = _in_flight.get(key)
+
+        if future is None:
+            if len(_in_flight) >= getattr(settings, 'ECT_ASYNC_QUEUE_LIMIT', QUEUE_LIMIT):
+                raise Full(f"{len(_in_flight)} survival analyses are being computed")
+
+            future                  = _submit(key, kind, mode, clinical_cat, facet, cohort)
+
+    # A cancelled request must not cancel the analysis other requests
+    # are waiting for:
+    _, result                       = await asyncio.shield(asyncio.wrap_future(future))
+
+    return result
+
+
+# Compute an analysis in the process pool
+# ---------------------------------------------------------------------
+def _submit(key:            str,
+            kind:           str,
+            mode:           str,
+            clinical_cat:   str,
+            facet:          str|None,
+            cohort:         str|None)->Future:
+    '''
+    Submit the analysis to the process pool and register it in
+    '_in_flight' until it is done. A broken pool is replaced by a new
+    one. Must be called holding '_lock'.
+    '''
+    global _executor
+
+    try:
+        future:     Future          = executor().submit(cache.compute_result, kind, mode, clinical_cat, facet, cohort)
+    except BrokenProcessPool:
+        # A worker died (out of memory, killed), so the pool takes no
+        # more work. It is replaced once by a new one:
+        broken, _executor           = _executor, None
+        broken.shutdown(wait=False)
+        future:     Future          = executor().submit(cache.compute_result, kind, mode, clinical_cat, facet, cohort)
+    _in_flight[key]                 = future
+
+    def done(future: Future):
+        # Stored before leaving '_in_flight', so a new request either
+        # waits for the computation or finds its result in the cache:
+        try:
+            if not (future.cancelled() or future.exception()):
+                cache.store_result(*future.result())
+        finally:
+            with _lock:
+                _in_flight.pop(key, None)
+
+    future.add_done_callback(done)
+
+    return future
@@ -0,0 +1,348 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) survival request path benchmarks.
+#
+# - This file contains the benchmarks of every stage of the survival
+#   request path, for every (mode, clinical category) pair of the TCGA
+#   dataset and of larger scaled cohorts:
+#
+#   - scaled_cohort(): synthetic cohort of any size.
+#   - benchmark_cases(): timed functions of every stage and analysis.
+#   - measure(): best time of a function.
+#   - run_benchmarks(): measure the benchmark cases.
+#   - save_baseline(): write the results as a JSON baseline.
+#   - load_baseline(): read a JSON baseline.
+#   - compare_to_baseline(): find the cases slower than the baseline.
+#   - missing_from_baseline(): find the cases without a baseline time.
+#
+# - The stages are the ones listed in 'STAGES'. 'plot_serialization' is
+#   the 'plotly.offline.plot' output of the survival figure, kept as the
+#   reference of the 'figure_div' output used by the views. The
+#   'ect_view' stages run the whole 'views.ect' POST with the Django test
+#   client, so they are only measured for the TCGA dataset.
+#
+# - Other modules used are:
+#
+#   - plotly_survival_plots
+#   - tcga_read_csv
+#   - ut_cache
+#   - ut_constants
+#   - ut_kaplan_meier
+#   - ut_stats
+#   - ut_synthetic
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    datetime                import  datetime, timezone
+from    pathlib                 import  Path
+from    django.conf             import  settings
+from    django.test             import  Client
+from    plotly.offline          import  plot
+import  fnmatch
+import  json
+import  platform
+import  time
+import  numpy                   as      np
+import  pandas                  as      pd
+from    .                       import  plotly_survival_plots   as  sp
+from    .                       import  tcga_read_csv           as  tcga
+from    .                       import  ut_cache                as  cache
+from    .                       import  ut_constants            as  cns
+from    .                       import  ut_kaplan_meier         as  km
+from    .                       import  ut_stats                as  stats
+from    .                       import  ut_synthetic            as  syn
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Default JSON baseline file:
+BASELINE_PATH:          Path    = Path(settings.BASE_DIR)/"benchmarks"/"survival_baseline.json"
+
+# Patients of the scaled cohorts:
+SCALED_COHORT_SIZES:    tuple   = (10_000, 100_000, 1_000_000)
+
+# A case is slower than its baseline when its time grows more than this
+# fraction and more than MIN_REGRESSION_SECONDS:
+REGRESSION_THRESHOLD:   float   = 0.25
+MIN_REGRESSION_SECONDS: float   = 0.001
+
+# Stages measured for every (mode, clinical category) pair:
+STAGES:                 tuple   = ('multi_logrank_p', 'kaplan_meier_fitter', 'at_risk_table', 'survival_figure',
+                                   'plot_serialization', 'figure_div', 'ect_view', 'ect_view_cached')
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Scaled cohort
+# ---------------------------------------------------------------------
+def scaled_cohort(patients: int,
+                  seed:     int     = 0)->pd.DataFrame:
+    '''
+    Create a synthetic cohort of 'patients' with the survival dataset
+    schema and vocabularies, see 'ut_synthetic'.
+
+    ## Parameters:
+        - patients (int): number of patients of the cohort.
+        - seed (int): random generator seed.
+
+    ## Return:
+        - cohort (pd.DataFrame): synthetic DataFrame.
+    '''
+    return syn.synthetic_cohort(patients, seed)
+
+
+# Survival figure of an analysis
+# ---------------------------------------------------------------------
+def _survival_figure(df:            pd.DataFrame,
+                     mode:          str,
+                     clinical_cat:  str):
+    '''
+    Build the survival figure like 'plotly_survival()' does, and return
+    the arguments of 'survival_figure_generator()' and the figure.
+    '''
+    estimates:      dict            = sp.km_survival_estimates(df, mode, clinical_cat, cns.SURVIVAL_GROUPS[clinical_cat])
+    arguments:      tuple           = (estimates['groups_km_dict'], clinical_cat, stats.format_p_value(estimates['logrank']['p_value']))
+
+    return (arguments, sp.survival_figure_generator(*arguments))
+
+
+# Timed function of a stage
+# ---------------------------------------------------------------------
+def _stage_case(stage:          str,
+                df:             pd.DataFrame,
+                mode:           str,
+                clinical_cat:   str)->callable:
+    '''
+    Prepare the inputs of the 'stage' for the 'mode' and 'clinical_cat'
+    analysis of 'df', and return the function to time.
+    '''
+    months:     str     = f"{mode}_months"
+    status:     str     = f"{mode}_status"
+
+    if stage == 'multi_logrank_p':
+        return lambda: stats.calculate_formatted_multi_logrank_p(df[months], df[clinical_cat], df[status])
+
+    if stage == 'kaplan_meier_fitter':
+        groups: list    = [(group, df.loc[df[clinical_cat] == group]) for group in cns.SURVIVAL_GROUPS[clinical_cat]]
+        return lambda: [sp.kaplan_meier_fitter_generator(group_df, group, mode) for group, group_df in groups if len(group_df)]
+
+    if stage == 'at_risk_table':
+        codes, labels   = sp.category_codes(df[clinical_cat])
+        event_table     = km.build_event_table(df[months].to_numpy(), df[status].to_numpy(), codes, labels = labels)
+        return lambda: sp.at_risk_table_generator(cns.SURVIVAL_GROUPS[clinical_cat], event_table, mode)
+
+    if stage == 'survival_figure':
+        arguments, _    = _survival_figure(df, mode, clinical_cat)
+        return lambda: sp.survival_figure_generator(*arguments)
+
+    if stage == 'plot_serialization':
+        figure          = _survival_figure(df, mode, clinical_cat)[1]
+        return lambda: plot(figure, output_type="div", config=cns.TOOLBAR_CONFIG, include_plotlyjs=False)
+
+    if stage == 'figure_div':
+        figure          = _survival_figure(df, mode, clinical_cat)[1]
+        return lambda: sp.figure_div(figure)
+
+    if stage in ('ect_view', 'ect_view_cached'):
+        client          = Client(SERVER_NAME='localhost')
+        data:   dict    = {'survival_type': mode, 'clinical_category': clinical_cat}
+        if stage == 'ect_view_cached':
+            return lambda: client.post('/ect_tool/ect/', data)
+
+        def cold_post():
+            # Only this analysis, the cache can be shared with the server:
+            cache.forget_result('context', mode, clinical_cat)
+            return client.post('/ect_tool/ect/', data)
+        return cold_post
+
+    raise ValueError(f"Unknown benchmark stage: {stage}")
+
+
+# Benchmark cases
+# ---------------------------------------------------------------------
+def benchmark_cases(sizes:      list[int]|None  = None,
+                    pattern:    str             = '*',
+                    seed:       int             = 0):
+    '''
+    Generate the benchmark cases of the TCGA dataset and of the scaled
+    cohorts of 'sizes' patients, as (name, function) pairs. The case
+    names are 'stage/cohort/mode/category', and only the ones matching
+    the 'pattern' are prepared.
+
+    ## Parameters:
+        - sizes (list[int]|None): Optional parameter. Patients of the
+        scaled cohorts. By default, only the TCGA dataset is used.
+        - pattern (str): 'fnmatch' pattern of the case names.
+        - seed (int): random generator seed of the scaled cohorts.
+
+    ## Yield:
+        - case (tuple[str, callable]): case name and function to time.
+    '''
+    if fnmatch.fnmatchcase('read_survival_file/tcga', pattern):
+        yield ('read_survival_file/tcga', lambda: tcga.read_survival_file(cns.SURVIVAL_SCHEMA))
+
+    cohorts:    list    = [('tcga', None)] + [(f"n{size}", size) for size in (sizes or [])]
+
+    for cohort, size in cohorts:
+        df:     pd.DataFrame|None   = None
+        for mode in cns.SURVIVAL_MODES:
+            for clinical_cat in cns.CATEGORIES:
+                for stage in STAGES:
+                    name:   str     = f"{stage}/{cohort}/{mode}/{clinical_cat}"
+                    if (size is not None and stage.startswith('ect_view')) or not fnmatch.fnmatchcase(name, pattern):
+                        continue
+                    # The cohort is only built when one of its cases is measured:
+                    if df is None:
+                        df          = cns.get_survival() if size is None else scaled_cohort(size, seed)
+                    yield (name, _stage_case(stage, df, mode, clinical_cat))
+
+
+# Best time of a function
+# ---------------------------------------------------------------------
+def measure(function:   callable,
+            repeat:     int     = 3)->float:
+    '''
+    Call 'function' 'repeat' times and return the best time, which is
+    the least disturbed by the rest of the machine.
+
+    ## Parameters:
+        - function (callable): function without arguments.
+        - repeat (int): number of calls.
+
+    ## Return:
+        - seconds (float): shortest call time.
+    '''
+    times:      list[float]     = []
+
+    for _ in range(repeat):
+        start:  float           = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+# Run the benchmarks
+# ---------------------------------------------------------------------
+def run_benchmarks(cases,
+                   repeat:      int         = 3,
+                   callback:    callable    = None)->dict[str:float]:
+    '''
+    Measure every benchmark case.
+
+    ## Parameters:
+        - cases (iterable): (name, function) pairs, like the ones from
+        'benchmark_cases()'.
+        - repeat (int): number of calls of each case.
+        - callback (callable): Optional parameter. Called with the name
+        and the seconds of each case when it is measured.
+
+    ## Return:
+        - results (dict[str:float]): case name as key, and its best time
+        in seconds as value.
+    '''
+    results:    dict    = {}
+
+    for name, function in cases:
+        results[name]   = measure(function, repeat)
+        if callback is not None:
+            callback(name, results[name])
+
+    return results
+
+
+# Save a JSON baseline
+# ---------------------------------------------------------------------
+def save_baseline(results:  dict[str:float],
+                  path:     Path|None   = None)->Path:
+    '''
+    Write the benchmark results and the environment they were measured
+    in as a JSON baseline. Cases of an existing baseline that were not
+    measured again are kept.
+
+    ## Parameters:
+        - results (dict[str:float]): results from 'run_benchmarks()'.
+        - path (Path|None): baseline file. By default, 'BASELINE_PATH'.
+
+    ## Return:
+        - path (Path): written baseline file.
+    '''
+    path                    = Path(path or BASELINE_PATH)
+    previous:   dict        = load_baseline(path) if path.is_file() else {}
+    baseline:   dict        = { 'created':      datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                                'environment':  {   'python':   platform.python_version(),
+                                                    'machine':  platform.machine(),
+                                                    'numpy':    np.__version__,
+                                                    'pandas':   pd.__version__},
+                                'results':      {**previous.get('results', {}), **results}}
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(baseline, indent=1, sort_keys=True))
+
+    return path
+
+
+# Load a JSON baseline
+# ---------------------------------------------------------------------
+def load_baseline(path: Path|None = None)->dict:
+    '''
+    Read a JSON baseline written by 'save_baseline()'.
+
+    ## Parameters:
+        - path (Path|None): baseline file. By default, 'BASELINE_PATH'.
+
+    ## Return:
+        - baseline (dict): dictionary with the 'created', 'environment'
+        and 'results' keys.
+    '''
+    return json.loads(Path(path or BASELINE_PATH).read_text())
+
+
+# Compare to a baseline
+# ---------------------------------------------------------------------
+def compare_to_baseline(results:    dict[str:float],
+                        baseline:   dict,
+                        threshold:  float   = REGRESSION_THRESHOLD)->list[dict]:
+    '''
+    Find the cases that are slower than in the baseline by more than the
+    'threshold' fraction and more than 'MIN_REGRESSION_SECONDS'. Cases
+    missing from the baseline are not compared, see
+    'missing_from_baseline()'.
+
+    ## Parameters:
+        - results (dict[str:float]): results from 'run_benchmarks()'.
+        - baseline (dict): baseline from 'load_baseline()'.
+        - threshold (float): allowed slowdown, 0.25 is 25% slower.
+
+    ## Return:
+        - regressions (list[dict]): one dictionary for each slower case,
+        with its 'name', 'baseline' and 'current' seconds and 'ratio'.
+    '''
+    regressions:    list    = []
+
+    for name, seconds in results.items():
+        reference:  float|None  = baseline['results'].get(name)
+        if reference is None:
+            continue
+        if seconds > reference * (1 + threshold) and seconds - reference > MIN_REGRESSION_SECONDS:
+            regressions.append({'name':     name,
+                                'baseline': reference,
+                                'current':  seconds,
+                                'ratio':    seconds / reference})
+
+    return regressions
+
+
+# Cases without a baseline
+# ---------------------------------------------------------------------
+def missing_from_baseline(results:  dict[str:float],
+                          baseline: dict)->list[str]:
+    '''
+    Return the names of the 'results' cases that have no time in the
+    'baseline', so they can't be compared.
+    '''
+    return [name for name in results if name not in baseline['results']]
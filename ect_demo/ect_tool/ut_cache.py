@@ -0,0 +1,667 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) survival results cache.
+#
+# - The survival dataset is fixed and the ECT form only offers 2 modes
+#   and 7 clinical categories, so every analysis result can be computed
+#   once and reused. This file contains the functions to get the
+#   template context for a (mode, clinical category) pair from the
+#   'survival' Django cache:
+#
+#   - current_survival(): survival DataFrame and its fingerprint.
+#   - compute_category_context(): run the whole survival pipeline.
+#   - get_category_context(): cached version of the pipeline.
+#   - is_valid_analysis(): check the parameters of an analysis.
+#   - cohort_id(): short identifier of a cohort filter.
+#   - compute_category_payload(): survival analysis for the JSON API.
+#   - get_category_payload(): cached version of the JSON analysis.
+#   - cached_result(): cache key and cached result of an analysis.
+#   - compute_result(): compute an analysis, in a worker process.
+#   - store_result(): store a computed analysis in the cache.
+#   - forget_result(): remove an analysis from the cache.
+#   - get_batch(): cached results of many analyses, computing the
+#     missing ones together.
+#   - category_etag(): HTTP ETag of a cached analysis.
+#   - batch_etag(): HTTP ETag of many cached analyses.
+#   - warm_cache(): precompute every (mode, clinical category) pair.
+#   - is_valid_cox_analysis(): check the parameters of a Cox analysis.
+#   - compute_cox_payload(): hazard ratios of clinical categories.
+#   - get_cox_payload(): cached version of the hazard ratios.
+#   - cox_etag(): HTTP ETag of a cached Cox analysis.
+#
+# - The cache keys contain the 'survival.csv' fingerprint, so when the
+#   file changes the dataset is reloaded and the old entries are never
+#   read again.
+#
+# - With the ECT_ARTIFACTS_DIR setting, the results missing from the
+#   cache are read from the 'precompute_survival' artifacts before being
+#   computed.
+#
+# - Other modules used are:
+#
+#   - tcga_read_csv
+#   - ut_artifacts
+#   - ut_cohort
+#   - ut_constants
+#   - ut_cox
+#   - ut_survival
+#   - ut_timing
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    django.core.cache   import  caches
+import  hashlib
+import  threading
+import  numpy               as      np
+import  pandas              as      pd
+from    .                   import  tcga_read_csv   as  tcga
+from    .                   import  ut_artifacts    as  artifacts
+from    .                   import  ut_cohort       as  coh
+from    .                   import  ut_constants    as  cns
+from    .                   import  ut_cox          as  cox
+from    .                   import  ut_survival     as  surv
+from    .                   import  ut_timing       as  timing
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Django cache alias used for the survival results:
+CACHE_ALIAS:    str             = 'survival'
+
+# Version of the cached results format, part of the keys and ETags:
+RESULTS_VERSION:    int         = 3
+
+# Survival DataFrame currently loaded and its fingerprint:
+_dataset:       dict            = {}
+_dataset_lock:  threading.Lock  = threading.Lock()
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Survival DataFrame matching the 'survival.csv' file on disk
+# ---------------------------------------------------------------------
+def current_survival()->tuple[str, pd.DataFrame]:
+    '''
+    Return the survival DataFrame and the fingerprint of the file it
+    was read from. When 'survival.csv' changes the DataFrame is read
+    again with 'ut_constants.reload_survival()'.
+
+    ## Return a tuple of:
+        - fingerprint (str): dataset fingerprint.
+        - df (pd.DataFrame): survival DataFrame.
+    '''
+    fingerprint:    str     = tcga.survival_file_fingerprint()
+
+    if _dataset.get('fingerprint') != fingerprint:
+        with _dataset_lock:
+            if not _dataset:
+                _dataset.update(fingerprint = fingerprint, df = cns.get_survival())
+            elif _dataset['fingerprint'] != fingerprint:
+                _dataset.update(fingerprint = fingerprint, df = cns.reload_survival())
+
+    return (_dataset['fingerprint'], _dataset['df'])
+
+
+# Survival analysis for a mode and clinical category
+# ---------------------------------------------------------------------
+def compute_category_context(df:            pd.DataFrame,
+                             mode:          str,
+                             clinical_cat:  str,
+                             facet:         str|None    = None,
+                             cohort:        str|None    = None)->dict:
+    '''
+    Run the survival pipeline for the 'clinical_cat' category and
+    return the context dictionary made by 'km_category_survival_helper'.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Survival Dataframe to be analyzed.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - clinical_cat (str): category to be analyzed.
+        - facet (str|None): Optional parameter. Category splitting the
+        analysis.
+        - cohort (str|None): Optional parameter. Cohort filter of the
+        patients to analyze, see 'ut_cohort'. All of them by default.
+
+    ## Return:
+        - context (dict): Dictionary with the data to fill up the Django
+        template.
+    '''
+    # Sorting the survival dataframe by the months of the 'mode':
+    with timing.stage('sort'):
+        sorted_df:  pd.DataFrame    = df.sort_values(by=f'{mode}_months', ascending=True)
+
+    # Cohort rows, resolved over the dataset bitmaps, in the sorted order:
+    with timing.stage('cohort'):
+        rows:       np.ndarray|None = (coh.cohort_mask(df, cohort)[df.index.get_indexer(sorted_df.index)]
+                                       if cohort else None)
+
+    context:        dict            = surv.km_category_survival_helper( sorted_df,
+                                                                        mode,
+                                                                        clinical_cat,
+                                                                        cns.CATEGORIES_DICT[clinical_cat],
+                                                                        cns.SURVIVAL_GROUPS[clinical_cat],
+                                                                        facet_name = facet,
+                                                                        rows       = rows)
+    context['cohort']               = cohort
+
+    return context
+
+
+# Survival analysis data for a mode and clinical category
+# ---------------------------------------------------------------------
+def compute_category_payload(df:            pd.DataFrame,
+                             mode:          str,
+                             clinical_cat:  str,
+                             facet:         str|None    = None,
+                             cohort:        str|None    = None)->dict:
+    '''
+    Run the survival analysis for the 'clinical_cat' category and return
+    the JSON serializable data made by 'km_category_survival_data'.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Survival Dataframe to be analyzed.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - clinical_cat (str): category to be analyzed.
+        - facet (str|None): Optional parameter. Category splitting the
+        analysis.
+        - cohort (str|None): Optional parameter. Cohort filter of the
+        patients to analyze, see 'ut_cohort'. All of them by default.
+
+    ## Return:
+        - payload (dict): JSON serializable survival analysis.
+    '''
+    with timing.stage('cohort'):
+        rows:       np.ndarray|None = coh.cohort_mask(df, cohort) if cohort else None
+
+    payload:        dict            = surv.km_category_survival_data(   df,
+                                                                        mode,
+                                                                        clinical_cat,
+                                                                        cns.SURVIVAL_GROUPS[clinical_cat],
+                                                                        facet_name = facet,
+                                                                        rows       = rows)
+    if cohort:
+        payload['cohort']           = cohort
+
+    return payload
+
+
+# Cached result of a survival analysis
+# ---------------------------------------------------------------------
+def _get_or_compute(kind:           str,
+                    mode:           str,
+                    clinical_cat:   str,
+                    compute:        callable,
+                    facet:          str|None    = None,
+                    cohort:         str|None    = None)->dict:
+    '''
+    Return the 'kind' result for the 'mode', 'clinical_cat', 'facet' and
+    'cohort' analysis from the 'survival' cache, reading it from the
+    artifacts or calling 'compute(df, mode, clinical_cat, facet, cohort)'
+    and storing its result on a miss.
+    '''
+    # Unknown values must fail before touching the cache:
+    if not is_valid_analysis(mode, clinical_cat, facet):
+        raise KeyError(f"Unknown survival analysis: ({mode}, {clinical_cat}, {facet})")
+
+    key:                    str             = _result_key(kind, tcga.survival_file_fingerprint(), mode, clinical_cat, facet, cohort)
+    result:                 dict|None       = caches[CACHE_ALIAS].get(key)
+
+    if result is not None:
+        return result
+
+    result                                  = artifacts.read_artifact(key)
+
+    if result is None:
+        # The dataset is only read when something must be computed:
+        fingerprint, df                     = current_survival()
+        key                                 = _result_key(kind, fingerprint, mode, clinical_cat, facet, cohort)
+        result                              = compute(df, mode, clinical_cat, facet, cohort)
+
+    store_result(key, result)
+
+    return result
+
+
+# Cache key of a survival analysis result
+# ---------------------------------------------------------------------
+def _result_key(kind:           str,
+                fingerprint:    str,
+                mode:           str,
+                clinical_cat:   str,
+                facet:          str|None    = None,
+                cohort:         str|None    = None)->str:
+    '''
+    Return the 'survival' cache key of the 'kind' result for the 'mode',
+    'clinical_cat', 'facet' and 'cohort' analysis of the 'fingerprint'
+    dataset.
+    '''
+    key:        str     = f"ect:{kind}:v{RESULTS_VERSION}:{fingerprint}:{mode}:{clinical_cat}"
+    key                 = f"{key}:{facet}" if facet else key
+
+    return f"{key}:cohort-{cohort_id(cohort)}" if cohort else key
+
+
+# Check the parameters of an analysis
+# ---------------------------------------------------------------------
+def is_valid_analysis(mode:         str|None,
+                      clinical_cat: str|None,
+                      facet:        str|None    = None)->bool:
+    '''
+    Return True if 'mode' is a survival mode, 'clinical_cat' a clinical
+    category, and 'facet' is None or another clinical category.
+    '''
+    return ((mode in cns.SURVIVAL_MODES) and (clinical_cat in cns.SURVIVAL_GROUPS)
+            and (facet is None or (facet in cns.SURVIVAL_GROUPS and facet != clinical_cat)))
+
+
+# Identifier of a cohort filter
+# ---------------------------------------------------------------------
+def cohort_id(cohort: str)->str:
+    '''
+    Return a short digest of the 'cohort' filter text, usable in cache
+    keys and ETags, which can't have its spaces and symbols. Give the
+    'ut_cohort.cohort_text()' canonical text, so equivalent filters
+    share their results.
+    '''
+    return hashlib.sha256(cohort.encode()).hexdigest()[:16]
+
+
+# Cached survival analysis for a mode and clinical category
+# ---------------------------------------------------------------------
+def get_category_context(mode:          str,
+                         clinical_cat:  str,
+                         facet:         str|None    = None,
+                         cohort:        str|None    = None)->dict:
+    '''
+    Return the template context for the 'mode' and 'clinical_cat' pair,
+    computing and storing it in the 'survival' cache on a miss.
+
+    ## Parameters:
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - clinical_cat (str): category to be analyzed.
+        - facet (str|None): Optional parameter. Category splitting the
+        analysis.
+        - cohort (str|None): Optional parameter. Canonical cohort filter
+        of the patients to analyze, see 'ut_cohort'.
+
+    ## Return:
+        - context (dict): new dictionary the caller can modify.
+    '''
+    return dict(_get_or_compute('context', mode, clinical_cat, compute_category_context, facet, cohort))
+
+
+# Cached survival analysis data for a mode and clinical category
+# ---------------------------------------------------------------------
+def get_category_payload(mode:          str,
+                         clinical_cat:  str,
+                         facet:         str|None    = None,
+                         cohort:        str|None    = None)->dict:
+    '''
+    Return the JSON serializable survival analysis for the 'mode' and
+    'clinical_cat' pair, computing and storing it in the 'survival' cache
+    on a miss.
+
+    ## Parameters:
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - clinical_cat (str): category to be analyzed.
+        - facet (str|None): Optional parameter. Category splitting the
+        analysis.
+        - cohort (str|None): Optional parameter. Canonical cohort filter
+        of the patients to analyze, see 'ut_cohort'.
+
+    ## Return:
+        - payload (dict): survival analysis data, must not be modified.
+    '''
+    return _get_or_compute('payload', mode, clinical_cat, compute_category_payload, facet, cohort)
+
+
+# Functions computing each kind of cached result:
+COMPUTE_FUNCTIONS:  dict    = { 'context':  compute_category_context,
+                                'payload':  compute_category_payload}
+
+
+# Cache key and cached result of a survival analysis
+# ---------------------------------------------------------------------
+def cached_result(kind:         str,
+                  mode:         str,
+                  clinical_cat: str,
+                  facet:        str|None    = None,
+                  cohort:       str|None    = None)->tuple[str, dict|None]:
+    '''
+    Look up the 'kind' result ('context' or 'payload') of the 'mode',
+    'clinical_cat', 'facet' and 'cohort' analysis in the 'survival'
+    cache, or in the artifacts, without computing it on a miss.
+
+    ## Parameters:
+        - kind (str): 'context' or 'payload'.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - clinical_cat (str): category to be analyzed.
+        - facet (str|None): Optional parameter. Category splitting the
+        analysis.
+        - cohort (str|None): Optional parameter. Canonical cohort filter
+        of the patients to analyze, see 'ut_cohort'.
+
+    ## Return a tuple of:
+        - key (str): cache key of the result.
+        - result (dict|None): cached result, or None on a miss. Must not
+        be modified.
+    '''
+    if kind not in COMPUTE_FUNCTIONS:
+        raise ValueError(f"Invalid result kind: {kind}")
+    if not is_valid_analysis(mode, clinical_cat, facet):
+        raise KeyError(f"Unknown survival analysis: ({mode}, {clinical_cat}, {facet})")
+
+    key:        str         = _result_key(kind, tcga.survival_file_fingerprint(), mode, clinical_cat, facet, cohort)
+    result:     dict|None   = caches[CACHE_ALIAS].get(key)
+
+    if result is None:
+        result              = artifacts.read_artifact(key)
+        if result is not None:
+            store_result(key, result)
+
+    return (key, result)
+
+
+# Compute a survival analysis result
+# ---------------------------------------------------------------------
+def compute_result(kind:            str,
+                   mode:            str,
+                   clinical_cat:    str,
+                   facet:           str|None    = None,
+                   cohort:          str|None    = None)->tuple[str, dict]:
+    '''
+    Compute the 'kind' result of the 'mode', 'clinical_cat', 'facet' and
+    'cohort' analysis without reading nor writing the cache, so it can run in a
+    worker process. The key belongs to the dataset the worker has read,
+    so a result is never stored for another version of 'survival.csv'.
+
+    ## Return a tuple of:
+        - key (str): cache key of the result.
+        - result (dict): computed result.
+    '''
+    fingerprint, df                 = current_survival()
+    result:         dict            = COMPUTE_FUNCTIONS[kind](df, mode, clinical_cat, facet, cohort)
+
+    return (_result_key(kind, fingerprint, mode, clinical_cat, facet, cohort), result)
+
+
+# Store a survival analysis result
+# ---------------------------------------------------------------------
+def store_result(key:       str,
+                 result:    dict):
+    '''
+    Store a result of 'compute_result()' in the 'survival' cache.
+    '''
+    caches[CACHE_ALIAS].set(key, result, timeout=None)
+
+
+# Remove a survival analysis result
+# ---------------------------------------------------------------------
+def forget_result(kind:         str,
+                  mode:         str,
+                  clinical_cat: str,
+                  facet:        str|None    = None,
+                  cohort:       str|None    = None):
+    '''
+    Delete the 'kind' result of the 'mode', 'clinical_cat', 'facet' and
+    'cohort' analysis from the 'survival' cache, leaving the other
+    results in it. The artifacts are not changed.
+    '''
+    caches[CACHE_ALIAS].delete(_result_key(kind, tcga.survival_file_fingerprint(), mode, clinical_cat, facet, cohort))
+
+
+# Cached results of many survival analyses
+# ---------------------------------------------------------------------
+def get_batch(specs:        list[tuple[str, str]],
+              kind:         str         = 'payload',
+              processes:    int|None    = None)->list[dict]:
+    '''
+    Return the 'kind' result ('context' or 'payload') of every (mode,
+    clinical category) pair in 'specs'. The results missing from the
+    'survival' cache are computed together with
+    'ut_survival.km_batch_survival_helper()', sorting the dataset once
+    per mode, and stored in the cache.
+
+    ## Parameters:
+        - specs (list[tuple[str, str]]): list of (mode, clinical category)
+        pairs.
+        - kind (str): 'context' for the template contexts or 'payload'
+        for the JSON serializable data.
+        - processes (int|None): Optional parameter. Number of processes
+        to compute the missing results with.
+
+    ## Return:
+        - results (list[dict]): one result for each pair of 'specs', in
+        the same order. Must not be modified.
+    '''
+    if kind not in ('context', 'payload'):
+        raise ValueError(f"Invalid result kind: {kind}")
+    for mode, clinical_cat in specs:
+        if not is_valid_analysis(mode, clinical_cat):
+            raise KeyError(f"Unknown survival analysis: ({mode}, {clinical_cat})")
+
+    fingerprint, df                         = current_survival()
+    keys:                   list[str]       = [_result_key(kind, fingerprint, mode, clinical_cat)
+                                               for mode, clinical_cat in specs]
+    found:                  dict            = caches[CACHE_ALIAS].get_many(keys)
+
+    # Each missing analysis is computed once, even if repeated in 'specs':
+    missing:                dict            = {key: spec for key, spec in zip(keys, specs) if key not in found}
+
+    if missing:
+        output:             str             = 'context' if kind == 'context' else 'data'
+        computed:           list[dict]      = surv.km_batch_survival_helper(df, list(missing.values()), output, processes)
+        new_results:        dict            = dict(zip(missing.keys(), computed))
+        caches[CACHE_ALIAS].set_many(new_results, timeout=None)
+        found.update(new_results)
+
+    return [found[key] for key in keys]
+
+
+# ETag of a survival analysis
+# ---------------------------------------------------------------------
+def category_etag(mode:         str,
+                  clinical_cat: str,
+                  facet:        str|None    = None,
+                  cohort:       str|None    = None)->str:
+    '''
+    Return a weak HTTP ETag for the 'mode' and 'clinical_cat' analysis.
+    It only depends on the dataset fingerprint, so it is known without
+    computing nor reading the cached result.
+
+    ## Parameters:
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - clinical_cat (str): category to be analyzed.
+        - facet (str|None): Optional parameter. Category splitting the
+        analysis.
+        - cohort (str|None): Optional parameter. Canonical cohort filter
+        of the patients to analyze, see 'ut_cohort'.
+
+    ## Return:
+        - etag (str): quoted weak ETag.
+    '''
+    analysis:   str     = f"{mode}-{clinical_cat}-{facet}" if facet else f"{mode}-{clinical_cat}"
+    analysis            = f"{analysis}-cohort-{cohort_id(cohort)}" if cohort else analysis
+
+    return f'W/"{tcga.survival_file_fingerprint()}-v{RESULTS_VERSION}-{analysis}"'
+
+
+# ETag of many survival analyses
+# ---------------------------------------------------------------------
+def batch_etag(specs: list[tuple[str, str]])->str:
+    '''
+    Return a weak HTTP ETag for the 'specs' analyses, in their order.
+
+    ## Parameters:
+        - specs (list[tuple[str, str]]): list of (mode, clinical category)
+        pairs.
+
+    ## Return:
+        - etag (str): quoted weak ETag.
+    '''
+    analyses:   str     = ",".join(f"{mode}:{clinical_cat}" for mode, clinical_cat in specs)
+    digest:     str     = hashlib.sha256(analyses.encode()).hexdigest()[:16]
+
+    return f'W/"{tcga.survival_file_fingerprint()}-v{RESULTS_VERSION}-batch-{digest}"'
+
+
+# Precompute all the analyses
+# ---------------------------------------------------------------------
+def warm_cache(modes:       list[str]|None  = None,
+               categories:  list[str]|None  = None,
+               processes:   int|None        = None)->int:
+    '''
+    Fill the 'survival' cache for every combination of 'modes' and
+    'categories'. By default all the survival modes and categories
+    from 'ut_constants' are used.
+
+    ## Parameters:
+        - modes (list[str]|None): survival modes to precompute.
+        - categories (list[str]|None): clinical categories to precompute.
+        - processes (int|None): Optional parameter. Number of processes
+        to compute the analyses with.
+
+    ## Return:
+        - count (int): number of analyses stored in the cache.
+    '''
+    modes                   = modes         or list(cns.SURVIVAL_MODES.keys())
+    categories              = categories    or cns.CATEGORIES
+
+    specs:      list[tuple]     = [(mode, clinical_cat) for mode in modes for clinical_cat in categories]
+
+    get_batch(specs, 'context', processes)
+
+    return len(specs)
+
+
+# =====================================================================
+# COX PROPORTIONAL HAZARDS ANALYSIS
+# =====================================================================
+
+# Check the parameters of a Cox analysis
+# ---------------------------------------------------------------------
+def is_valid_cox_analysis(mode:         str|None,
+                          categories:   list[str],
+                          model:        str|None)->bool:
+    '''
+    Return True if 'mode' is a survival mode, 'categories' a non empty
+    list of different clinical categories, and 'model' a 'ut_cox.MODELS'
+    one.
+    '''
+    return ((mode in cns.SURVIVAL_MODES) and (model in cox.MODELS) and bool(categories)
+            and all(clinical_cat in cns.SURVIVAL_GROUPS for clinical_cat in categories)
+            and len(set(categories)) == len(categories))
+
+
+# Hazard ratios of clinical categories
+# ---------------------------------------------------------------------
+def compute_cox_payload(df:             pd.DataFrame,
+                        mode:           str,
+                        categories:     list[str],
+                        model:          str         = 'univariate',
+                        cohort:         str|None    = None)->dict:
+    '''
+    Fit the Cox models of the 'categories' and return the JSON
+    serializable data made by 'ut_survival.cox_survival_data'.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Survival Dataframe to be analyzed, the
+        one of 'current_survival()' so its design matrix is reused.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - categories (list[str]): clinical categories to analyze.
+        - model (str): 'univariate' or 'multivariable'.
+        - cohort (str|None): Optional parameter. Cohort filter of the
+        patients to analyze, see 'ut_cohort'. All of them by default.
+
+    ## Return:
+        - payload (dict): JSON serializable Cox analysis.
+    '''
+    with timing.stage('cohort'):
+        rows:       np.ndarray|None = coh.cohort_mask(df, cohort) if cohort else None
+
+    payload:        dict            = surv.cox_survival_data(df, mode, categories, model, rows)
+    if cohort:
+        payload['cohort']           = cohort
+
+    return payload
+
+
+# Cached hazard ratios of clinical categories
+# ---------------------------------------------------------------------
+def get_cox_payload(mode:           str,
+                    categories:     list[str],
+                    model:          str         = 'univariate',
+                    cohort:         str|None    = None)->dict:
+    '''
+    Return the Cox analysis of the 'categories', computing and storing
+    it in the 'survival' cache on a miss.
+
+    ## Parameters:
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - categories (list[str]): clinical categories to analyze, in the
+        order of the table and forest plot rows.
+        - model (str): 'univariate' or 'multivariable'.
+        - cohort (str|None): Optional parameter. Canonical cohort filter
+        of the patients to analyze, see 'ut_cohort'.
+
+    ## Return:
+        - payload (dict): Cox analysis data, must not be modified.
+    '''
+    # Unknown values must fail before touching the cache:
+    if not is_valid_cox_analysis(mode, categories, model):
+        raise KeyError(f"Unknown Cox analysis: ({mode}, {categories}, {model})")
+
+    key:            str             = _cox_key(tcga.survival_file_fingerprint(), mode, categories, model, cohort)
+    result:         dict|None       = caches[CACHE_ALIAS].get(key)
+
+    if result is None:
+        fingerprint, df             = current_survival()
+        key                         = _cox_key(fingerprint, mode, categories, model, cohort)
+        result                      = compute_cox_payload(df, mode, categories, model, cohort)
+        store_result(key, result)
+
+    return result
+
+
+# Cache key of a Cox analysis result
+# ---------------------------------------------------------------------
+def _cox_key(fingerprint:   str,
+             mode:          str,
+             categories:    list[str],
+             model:         str,
+             cohort:        str|None    = None)->str:
+    '''
+    Return the 'survival' cache key of the Cox analysis of the
+    'fingerprint' dataset.
+    '''
+    key:        str     = f"ect:cox:v{RESULTS_VERSION}:{fingerprint}:{mode}:{model}:{'+'.join(categories)}"
+
+    return f"{key}:cohort-{cohort_id(cohort)}" if cohort else key
+
+
+# ETag of a Cox analysis
+# ---------------------------------------------------------------------
+def cox_etag(mode:          str,
+             categories:    list[str],
+             model:         str,
+             cohort:        str|None    = None)->str:
+    '''
+    Return a weak HTTP ETag for the Cox analysis of the 'categories'.
+    Like 'category_etag()', it only depends on the dataset fingerprint.
+    '''
+    analysis:   str     = f"cox-{mode}-{model}-{'+'.join(categories)}"
+    analysis            = f"{analysis}-cohort-{cohort_id(cohort)}" if cohort else analysis
+
+    return f'W/"{tcga.survival_file_fingerprint()}-v{RESULTS_VERSION}-{analysis}"'
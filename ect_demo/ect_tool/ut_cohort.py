@@ -0,0 +1,168 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) cohort filters over the clinical categories.
+#
+# - A cohort is the set of patients matching a filter like "Stage III or
+#   IV, G3, older than 70 and without radiotherapy". The survival
+#   analyses and population bars of a cohort only count its patients.
+#   This file contains the functions to select them:
+#
+#   - parse_cohort(): cohort filter from its text.
+#   - cohort_text(): canonical text of a cohort filter.
+#   - build_bitmaps(): packed bitmap of each clinical category value.
+#   - get_bitmaps(): bitmaps of a DataFrame, built once.
+#   - cohort_mask(): patients of a cohort filter.
+#
+# - A filter is written as comma separated clauses, all of them must
+#   match (AND). Each clause is a '|' separated list of 'category:value'
+#   terms, one of them must match (OR), and a '!' before a term negates
+#   it (NOT):
+#
+#       stage:Stage III|stage:Stage IV,grade:G3,age_group:>70,!radiotherapy:Yes
+#
+#   Any AND/OR/NOT combination can be written this way.
+#
+# - The bitmaps are 'np.packbits' arrays of one bit per patient, so a
+#   filter is resolved with bitwise operations over n/8 bytes, and the
+#   DataFrame is never filtered nor copied: the mask is applied to the
+#   group codes of 'ut_kaplan_meier.build_event_table()'.
+#
+# - Other modules used are:
+#
+#   - ut_constants
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    .                   import  ut_constants    as  cns
+import  numpy               as      np
+import  pandas              as      pd
+import  weakref
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Separators of the cohort filter text:
+CLAUSE_SEPARATOR:   str     = ','
+TERM_SEPARATOR:     str     = '|'
+VALUE_SEPARATOR:    str     = ':'
+NOT_PREFIX:         str     = '!'
+
+# Bitmaps of the last DataFrame, kept while it exists:
+_bitmaps:           dict    = {}
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Cohort filter from its text
+# ---------------------------------------------------------------------
+def parse_cohort(text: str)->tuple[tuple[tuple[bool, str, str], ...], ...]:
+    '''
+    Parse a cohort filter, see the file header for its syntax.
+
+    ## Parameters:
+        - text (str): cohort filter text.
+
+    ## Return:
+        - clauses (tuple): AND of clauses, each of them an OR of
+        (negated, category, value) terms. Sorted and without repeated
+        items, so equivalent texts give the same clauses.
+
+    Unknown categories or values raise a ValueError.
+    '''
+    clauses:        set         = set()
+
+    for clause_text in text.split(CLAUSE_SEPARATOR):
+        terms:      set         = set()
+        for term_text in clause_text.split(TERM_SEPARATOR):
+            term_text           = term_text.strip()
+            negated:    bool    = term_text.startswith(NOT_PREFIX)
+            category, _, value  = term_text.removeprefix(NOT_PREFIX).partition(VALUE_SEPARATOR)
+            category, value     = category.strip(), value.strip()
+
+            if value not in cns.CAT_AND_SUBCAT.get(category, {}):
+                raise ValueError(f"Unknown cohort filter term: '{term_text}'")
+            terms.add((negated, category, value))
+        clauses.add(tuple(sorted(terms)))
+
+    return tuple(sorted(clauses))
+
+
+# Canonical text of a cohort filter
+# ---------------------------------------------------------------------
+def cohort_text(clauses: tuple)->str:
+    '''
+    Return the text of the 'parse_cohort()' clauses. Equivalent filters
+    have the same text, which is used in the cache keys.
+    '''
+    return CLAUSE_SEPARATOR.join(TERM_SEPARATOR.join(f"{NOT_PREFIX if negated else ''}{category}{VALUE_SEPARATOR}{value}"
+                                                     for negated, category, value in clause)
+                                 for clause in clauses)
+
+
+# Packed bitmap of each clinical category value
+# ---------------------------------------------------------------------
+def build_bitmaps(df: pd.DataFrame)->dict[tuple[str, str], np.ndarray]:
+    '''
+    Build the bitmap of the patients of each value in
+    'ut_constants.CAT_AND_SUBCAT', in the 'df' row order.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Survival Dataframe.
+
+    ## Return:
+        - bitmaps (dict): 'np.packbits' array by (category, value).
+    '''
+    bitmaps:        dict        = {}
+
+    for category, values in cns.CAT_AND_SUBCAT.items():
+        column:     pd.Series   = df[category]
+        for value in values:
+            bitmaps[(category, value)] = np.packbits((column == value).to_numpy())
+
+    return bitmaps
+
+
+# Bitmaps of a DataFrame
+# ---------------------------------------------------------------------
+def get_bitmaps(df: pd.DataFrame)->dict[tuple[str, str], np.ndarray]:
+    '''
+    Return 'build_bitmaps(df)', built once while the same 'df' is used,
+    like the survival DataFrame of 'ut_cache.current_survival()'.
+    '''
+    reference:      weakref.ref|None    = _bitmaps.get('df')
+
+    if reference is None or reference() is not df:
+        _bitmaps.update(df = weakref.ref(df), bitmaps = build_bitmaps(df))
+
+    return _bitmaps['bitmaps']
+
+
+# Patients of a cohort filter
+# ---------------------------------------------------------------------
+def cohort_mask(df:     pd.DataFrame,
+                cohort: str)->np.ndarray:
+    '''
+    Resolve the 'cohort' filter over the 'df' bitmaps.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Survival Dataframe.
+        - cohort (str): cohort filter text.
+
+    ## Return:
+        - mask (np.ndarray): True for the 'df' rows in the cohort.
+    '''
+    bitmaps:        dict            = get_bitmaps(df)
+    packed:         np.ndarray      = np.full((len(df) + 7) // 8, 0xFF, dtype=np.uint8)
+
+    for clause in parse_cohort(cohort):
+        matches:    np.ndarray      = np.zeros_like(packed)
+        for negated, category, value in clause:
+            bitmap: np.ndarray      = bitmaps[(category, value)]
+            matches                |= ~bitmap if negated else bitmap
+        packed                     &= matches
+
+    return np.unpackbits(packed, count=len(df)).view(bool)
@@ -6,12 +6,16 @@
 #   that can be reused in all the ECT (Demo). the fields of these
 #   variables are:
 #
-#   - Load dataframe.
 #   - Survival dataset columns names and its values.
+#   - Survival dataset schema and lazily loaded dataframe.
 #   - Survival method names translation dictionary.
 #   - Clinical categories name translation dictionary.
 #   - Plotly toolbar configuration.
 #
+# - The survival dataframe is read on the first call to 'get_survival()'
+#   (or first access to 'SURVIVAL'), so importing this file does not
+#   import pandas nor read the dataset.
+#
 # - Other modules used:
 #   
 #   - tcga_read_csv
@@ -20,16 +24,16 @@
 # IMPORTS
 # =====================================================================
 
-import              pandas          as  pd
-from    .  import   tcga_read_csv   as  tcga
+from    typing      import  TYPE_CHECKING
+import  threading
+
+if TYPE_CHECKING:
+    import  pandas  as  pd
 
 # =====================================================================
 # GLOBAL CONSTANTS VARIABLES
 # =====================================================================
 
-# DataFrames
-SURVIVAL:               pd.DataFrame    = tcga.read_survival_file()
-
 # About categories
 CATEGORIES:             list[str]       = [ 'grade',
                                             'tumor_type',
@@ -60,6 +64,16 @@ SURVIVAL_GROUPS:        dict            = { 'grade':        ["G1", "G2", "G3"],
                                             'stage':        ["Stage I", "Stage II", "Stage III", "Stage IV"],
                                             'bmi_status':   ["Healthy Weight", "Overweight", "Obesity"]}
 
+# Survival dataset column types: clinical categories as ordered 
+# 'pd.Categorical' in the 'SURVIVAL_GROUPS' order, and downcasted numbers.
+SURVIVAL_SCHEMA:        dict            = { 'categories':   {**SURVIVAL_GROUPS, 'subtype': []},
+                                            'dtypes':       {'pfs_status':   'int8',
+                                                             'os_status':    'int8',
+                                                             'age':          'float32',
+                                                             'height':       'int16',
+                                                             'weight':       'int16',
+                                                             'bmi':          'float32'}}
+
 CATEGORIES_DICT:        dict            = { 'grade':        'Grade',
                                             'tumor_type':   'Histologic Type',
                                             'mol_subtype':  'Molecular Subtype',
@@ -71,6 +85,9 @@ CATEGORIES_DICT:        dict            = { 'grade':        'Grade',
 SURVIVAL_MODES:         dict            = { 'os':           'Overall Survival',
                                             'pfs':          'Progression-Free Survival'}
 
+# Months of the at risk by time table:
+AT_RISK_TIME_GRID:      tuple           = (0, 10, 20, 30, 40, 50, 60)
+
 
 # Plotly plots toolbar configuration
 TOOLBAR_CONFIG:         dict            = { 'toImageButtonOptions':  {  'format':   'svg', # one of png, svg, jpeg, webp
@@ -96,3 +113,56 @@ TOOLBAR_CONFIG_L:       dict            = { 'toImageButtonOptions':  {  'format'
                                                                         'scale':    1 # Multiply title/legend/axis/canvas sizes by this factor
                                                                     }}
 
+
+# =====================================================================
+# SURVIVAL DATAFRAME
+# =====================================================================
+
+# Loaded survival dataframe:
+_survival:              dict            = {}
+_survival_lock:         threading.Lock  = threading.Lock()
+
+# Lazy survival dataframe accessor
+# ---------------------------------------------------------------------
+def get_survival()->'pd.DataFrame':
+    '''
+    Return the survival dataframe, reading it with the 'SURVIVAL_SCHEMA'
+    on the first call.
+
+    ## Return:
+        - df (pd.DataFrame): survival dataframe.
+    '''
+    if 'df' not in _survival:
+        with _survival_lock:
+            if 'df' not in _survival:
+                from . import tcga_read_csv as tcga
+                _survival['df']         = tcga.read_survival_file(SURVIVAL_SCHEMA)
+
+    return _survival['df']
+
+
+# Read the survival dataframe again
+# ---------------------------------------------------------------------
+def reload_survival()->'pd.DataFrame':
+    '''
+    Read the survival dataset again, for example after 'survival.csv'
+    changes, and return the new dataframe.
+
+    ## Return:
+        - df (pd.DataFrame): survival dataframe.
+    '''
+    from . import tcga_read_csv as tcga
+
+    df:                     'pd.DataFrame'  = tcga.read_survival_file(SURVIVAL_SCHEMA)
+    with _survival_lock:
+        _survival['df']                     = df
+
+    return df
+
+
+# 'SURVIVAL' constant, read on first access
+# ---------------------------------------------------------------------
+def __getattr__(name: str):
+    if name == 'SURVIVAL':
+        return get_survival()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
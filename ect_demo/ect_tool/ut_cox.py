@@ -0,0 +1,394 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) Cox proportional hazards models.
+#
+# - The Kaplan-Meier curves and the logrank test compare the groups of
+#   one clinical category. The Cox proportional hazards model gives the
+#   hazard ratio of each group against a reference one, alone
+#   (univariate) or adjusted by other categories (multivariable). This
+#   file contains the functions to fit them:
+#
+#   - build_design(): one-hot design matrix of the clinical categories.
+#   - get_design(): design matrix of a DataFrame and mode, built once.
+#   - cox_fit(): Cox model fit by Newton-Raphson, with Efron ties.
+#   - cox_model(): hazard ratios of some categories.
+#   - cox_analysis(): univariate or multivariable models.
+#
+# - The design matrix has a 0/1 column for every group in
+#   'ut_constants.SURVIVAL_GROUPS', with the rows sorted by the months
+#   of the mode. It is built once per survival DataFrame and mode, and
+#   every model selects its columns and rows from it.
+#
+# - The fit is vectorized over the rows: each Newton-Raphson iteration
+#   is a few cumulative sums by distinct time and one 'X.T @ X' product,
+#   so no (rows x columns x columns) array is created. The results are
+#   the same as the lifelines 'CoxPHFitter' (Efron ties, no penalizer).
+#
+# - Other modules used are:
+#
+#   - ut_constants
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    .                   import  ut_constants    as  cns
+from    scipy.special       import  chdtrc, ndtr
+import  numpy               as      np
+import  pandas              as      pd
+import  threading
+import  weakref
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Newton-Raphson iterations and convergence of the step size:
+MAX_ITERATIONS:     int             = 50
+TOLERANCE:          float           = 1e-9
+
+# Normal quantile of the 95% confidence intervals:
+Z_95:               float           = 1.959963984540054
+
+# Survival analysis models:
+MODELS:             tuple           = ('univariate', 'multivariable')
+
+# Design matrices of the last DataFrame, by mode:
+_designs:           dict            = {}
+_designs_lock:      threading.Lock  = threading.Lock()
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# One-hot design matrix of the clinical categories
+# ---------------------------------------------------------------------
+def build_design(df:    pd.DataFrame,
+                 mode:  str)->dict:
+    '''
+    Build the one-hot design matrix of all the clinical categories, with
+    the 'df' rows sorted by the months of the 'mode'.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Survival Dataframe.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+
+    ## Return:
+        - design (dict): dictionary with the next keys:
+            - 'order' (np.ndarray): 'df' row of each sorted row.
+            - 'durations' (np.ndarray): sorted months.
+            - 'events' (np.ndarray): 1 for an event, 0 for censoring.
+            - 'codes' (dict[str:np.ndarray]): group position in
+            'SURVIVAL_GROUPS' of each row, by category, -1 if missing.
+            - 'matrix' (np.ndarray): rows x groups 0/1 matrix.
+            - 'columns' (dict[str:slice]): columns of each category.
+    '''
+    durations:      np.ndarray      = df[f'{mode}_months'].to_numpy(dtype=float)
+    order:          np.ndarray      = np.argsort(durations, kind='stable')
+    codes:          dict            = {category: pd.Categorical(df[category], categories=cns.SURVIVAL_GROUPS[category]
+                                                                ).codes[order].astype(np.int16)
+                                       for category in cns.CATEGORIES}
+    columns:        dict            = {}
+    start:          int             = 0
+
+    for category in cns.CATEGORIES:
+        columns[category]           = slice(start, start + len(cns.SURVIVAL_GROUPS[category]))
+        start                      += len(cns.SURVIVAL_GROUPS[category])
+
+    matrix:         np.ndarray      = np.zeros((len(df), start))
+    for category, category_codes in codes.items():
+        known:      np.ndarray      = category_codes >= 0
+        matrix[np.flatnonzero(known), columns[category].start + category_codes[known]] = 1.0
+
+    return {'order':        order,
+            'durations':    durations[order],
+            'events':       df[f'{mode}_status'].to_numpy(dtype=float)[order],
+            'codes':        codes,
+            'matrix':       matrix,
+            'columns':      columns}
+
+
+# Design matrix of a DataFrame and mode
+# ---------------------------------------------------------------------
+def get_design(df:      pd.DataFrame,
+               mode:    str)->dict:
+    '''
+    Return 'build_design(df, mode)', built once while the same 'df' is
+    used, like the survival DataFrame of 'ut_cache.current_survival()'.
+    '''
+    with _designs_lock:
+        reference:  weakref.ref|None    = _designs.get('df')
+
+        if reference is None or reference() is not df:
+            _designs.clear()
+            _designs.update(df = weakref.ref(df), modes = {})
+
+        if mode not in _designs['modes']:
+            _designs['modes'][mode]     = build_design(df, mode)
+
+        return _designs['modes'][mode]
+
+
+# Cox proportional hazards model fit
+# ---------------------------------------------------------------------
+def cox_fit(matrix:     np.ndarray,
+            durations:  np.ndarray,
+            events:     np.ndarray)->dict:
+    '''
+    Fit a Cox proportional hazards model by Newton-Raphson, with the
+    Efron method for tied times.
+
+    ## Parameters:
+        - matrix (np.ndarray): rows x covariates matrix.
+        - durations (np.ndarray): months to event or censoring, sorted
+        ascending.
+        - events (np.ndarray): 1 for an observed event, 0 for censoring.
+
+    ## Return:
+        - fit (dict): dictionary with the next keys:
+            - 'coef' (np.ndarray): log hazard ratio of each covariate.
+            - 'se' (np.ndarray): standard error of each coefficient.
+            - 'log_likelihood' (float): partial log-likelihood.
+            - 'null_log_likelihood' (float): log-likelihood of the
+            model without covariates.
+            - 'iterations' (int): Newton-Raphson iterations.
+            - 'converged' (bool): False if the maximum of iterations was
+            reached, like for groups without events.
+
+    Collinear covariates raise a numpy 'LinAlgError', and the standard
+    errors of a fit that did not converge can be NaN.
+    '''
+    # Centered columns: the same coefficients, without overflows:
+    matrix                          = matrix - matrix.mean(axis=0)
+    events                          = np.asarray(events, dtype=float)
+
+    # Distinct times, as groups of consecutive sorted rows:
+    starts:         np.ndarray      = np.flatnonzero(np.r_[True, durations[1:] != durations[:-1]])
+    row_groups:     np.ndarray      = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(durations)]))
+    deaths:         np.ndarray      = np.add.reduceat(events, starts)
+
+    # One Efron term for each death: its time and its position in the tie:
+    death_groups:   np.ndarray      = np.repeat(np.arange(len(starts)), deaths.astype(int))
+    tie_fraction:   np.ndarray      = ((np.arange(len(death_groups)) - np.repeat(np.cumsum(deaths) - deaths, deaths.astype(int)))
+                                       / deaths[death_groups])
+
+    def partial_likelihood(coef: np.ndarray)->tuple[float, np.ndarray, np.ndarray]:
+        risk:       np.ndarray      = np.exp(matrix @ coef)
+        risk_x:     np.ndarray      = risk[:, None] * matrix
+        death_risk: np.ndarray      = risk * events
+
+        # Risk sets: every row with a time equal or greater:
+        s0:         np.ndarray      = np.cumsum(np.add.reduceat(risk, starts)[::-1])[::-1]
+        s1:         np.ndarray      = np.cumsum(np.add.reduceat(risk_x, starts, axis=0)[::-1], axis=0)[::-1]
+        t0:         np.ndarray      = np.add.reduceat(death_risk, starts)
+        t1:         np.ndarray      = np.add.reduceat(death_risk[:, None] * matrix, starts, axis=0)
+
+        phi0:       np.ndarray      = s0[death_groups] - tie_fraction * t0[death_groups]
+        phi1:       np.ndarray      = s1[death_groups] - tie_fraction[:, None] * t1[death_groups]
+        mean_x:     np.ndarray      = phi1 / phi0[:, None]
+
+        # Second moments, weighted by row: sum over the deaths at or
+        # before each row time, minus its own tie share:
+        weight:     np.ndarray      = np.bincount(death_groups, weights = 1 / phi0, minlength = len(starts))
+        tie_weight: np.ndarray      = np.bincount(death_groups, weights = tie_fraction / phi0, minlength = len(starts))
+        row_weight: np.ndarray      = risk * np.cumsum(weight)[row_groups] - death_risk * tie_weight[row_groups]
+
+        log_likelihood: float       = float(events @ (matrix @ coef) - np.log(phi0).sum())
+        gradient:   np.ndarray      = events @ matrix - mean_x.sum(axis=0)
+        information: np.ndarray     = matrix.T @ (row_weight[:, None] * matrix) - mean_x.T @ mean_x
+
+        return (log_likelihood, gradient, information)
+
+    coef:           np.ndarray      = np.zeros(matrix.shape[1])
+    log_likelihood, gradient, information   = partial_likelihood(coef)
+    null_log_likelihood:    float   = log_likelihood
+    converged:      bool            = False
+
+    for iteration in range(1, MAX_ITERATIONS + 1):
+        step:       np.ndarray      = np.linalg.solve(information, gradient)
+        new_coef:   np.ndarray      = coef + step
+        new_values: tuple           = partial_likelihood(new_coef)
+
+        # Half steps while the log-likelihood decreases:
+        while new_values[0] < log_likelihood - 1e-12 and np.abs(step).max() > TOLERANCE:
+            step                   /= 2
+            new_coef                = coef + step
+            new_values              = partial_likelihood(new_coef)
+
+        coef                                    = new_coef
+        log_likelihood, gradient, information   = new_values
+        if np.abs(step).max() < TOLERANCE:
+            converged               = True
+            break
+
+    # Not positive definite if the fit diverged, with NaN errors then:
+    with np.errstate(invalid='ignore'):
+        se:         np.ndarray      = np.sqrt(np.diag(np.linalg.inv(information)))
+
+    return {'coef':                 coef,
+            'se':                   se,
+            'log_likelihood':       log_likelihood,
+            'null_log_likelihood':  null_log_likelihood,
+            'iterations':           iteration,
+            'converged':            converged}
+
+
+# Hazard ratios of some categories
+# ---------------------------------------------------------------------
+def cox_model(df:           pd.DataFrame,
+              mode:         str,
+              categories:   list[str],
+              rows:         np.ndarray|None = None)->dict:
+    '''
+    Fit a Cox model of the 'categories' groups, all of them together,
+    from the cached design matrix of 'df'. The reference group of each
+    category is its first one with events in 'SURVIVAL_GROUPS' order.
+    The patients without a group in a category and the groups without
+    events are left out of the fit.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Survival Dataframe.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - categories (list[str]): clinical categories of the model.
+        - rows (np.ndarray|None): Optional parameter. True for the 'df'
+        rows of the analyzed cohort, see 'ut_cohort.cohort_mask()'.
+
+    ## Return:
+        - model (dict): JSON serializable model, with the patients and
+        events, the likelihood ratio test and a coefficient for each
+        group of the 'categories'. The reference and the groups without
+        events have no standard error nor pvalue. If the fit does not
+        converge, or its groups are collinear, the model and its
+        coefficients are not 'estimable' and have no estimates.
+    '''
+    design:         dict            = get_design(df, mode)
+    events:         np.ndarray      = design['events']
+    selected:       np.ndarray      = np.ones(len(events), dtype=bool) if rows is None else rows[design['order']]
+
+    for category in categories:
+        selected                   &= design['codes'][category] >= 0
+
+    # Patients of groups without events carry no information, and leaving
+    # them out can leave other groups without events, until none is left:
+    pruned:         bool            = True
+    while pruned:
+        kept:       int             = int(selected.sum())
+        for category in categories:
+            codes:  np.ndarray      = design['codes'][category]
+            deaths: np.ndarray      = np.bincount(codes[selected], weights=events[selected],
+                                                  minlength=len(cns.SURVIVAL_GROUPS[category]))
+            selected               &= deaths[codes] > 0
+        pruned                      = int(selected.sum()) < kept
+
+    groups:         dict            = {}
+    for category in categories:
+        codes:      np.ndarray      = design['codes'][category]
+        size:       int             = len(cns.SURVIVAL_GROUPS[category])
+        patients:   np.ndarray      = np.bincount(codes[selected], minlength=size)
+        deaths:     np.ndarray      = np.bincount(codes[selected], weights=events[selected], minlength=size).astype(int)
+        groups[category]            = (patients, deaths)
+
+    columns:        list[int]       = []
+    coefficients:   list[dict]      = []
+
+    for category in categories:
+        patients, deaths            = groups[category]
+        with_events:    list[int]   = [position for position in range(len(deaths)) if deaths[position] > 0]
+        for position, group in enumerate(cns.SURVIVAL_GROUPS[category]):
+            is_reference:   bool    = bool(with_events) and position == with_events[0]
+            if position in with_events and not is_reference:
+                columns.append(design['columns'][category].start + position)
+            coefficients.append({'category':   category,
+                                 'group':      group,
+                                 'patients':   int(patients[position]),
+                                 'events':     int(deaths[position]),
+                                 'reference':  is_reference})
+
+    model:          dict            = { 'categories':   list(categories),
+                                        'patients':     int(selected.sum()),
+                                        'events':       int(events[selected].sum())}
+
+    try:
+        fit:        dict|None       = cox_fit(design['matrix'][np.ix_(selected, columns)],
+                                              design['durations'][selected],
+                                              events[selected]) if columns else None
+    except np.linalg.LinAlgError:
+        # Collinear groups, e.g. the same patients in two categories:
+        fit:        dict|None       = {'converged': False}
+
+    fitted:         list[dict]      = [coefficient for coefficient in coefficients
+                                       if coefficient['events'] > 0 and not coefficient['reference']]
+    for coefficient in coefficients:
+        coefficient.update(estimable = coefficient['reference'], coef = None, se = None,
+                           hazard_ratio = 1.0 if coefficient['reference'] else None,
+                           ci_lower = None, ci_upper = None, p_value = None)
+
+    estimates:      list[dict]      = []
+    if fit is not None and fit['converged']:
+        with np.errstate(invalid='ignore', over='ignore'):
+            for coef, se in zip(fit['coef'], fit['se']):
+                estimates.append({  'coef':         float(coef),
+                                    'se':           float(se),
+                                    'hazard_ratio': float(np.exp(coef)),
+                                    'ci_lower':     float(np.exp(coef - Z_95 * se)),
+                                    'ci_upper':     float(np.exp(coef + Z_95 * se)),
+                                    'p_value':      float(2 * ndtr(-abs(coef / se)))})
+
+    # A model that diverges, like the ones of groups whose patients all
+    # have the events first, has no estimate of any coefficient:
+    estimable:      bool            = fit is None or (len(estimates) == len(fitted) and
+                                                      all(np.isfinite(list(estimate.values())).all() and estimate['se'] > 0
+                                                          for estimate in estimates))
+    if estimable:
+        for coefficient, estimate in zip(fitted, estimates):
+            coefficient.update(estimable = True, **estimate)
+
+    test_statistic: float|None      = (max(2 * (fit['log_likelihood'] - fit['null_log_likelihood']), 0.0)
+                                       if fit is not None and estimable else None)
+    model.update(converged          = fit is None or fit['converged'],
+                 estimable          = estimable,
+                 log_likelihood     = fit['log_likelihood'] if fit is not None and estimable else None,
+                 likelihood_ratio   = {'test_statistic':        test_statistic,
+                                       'degrees_of_freedom':    len(columns),
+                                       'p_value':               None if test_statistic is None
+                                                                else float(chdtrc(len(columns), test_statistic))},
+                 coefficients       = coefficients)
+
+    return model
+
+
+# Univariate or multivariable Cox models
+# ---------------------------------------------------------------------
+def cox_analysis(df:            pd.DataFrame,
+                 mode:          str,
+                 categories:    list[str],
+                 model:         str             = 'univariate',
+                 rows:          np.ndarray|None = None)->dict:
+    '''
+    Fit a Cox model for each one of the 'categories' (univariate), or
+    one for all of them (multivariable).
+
+    ## Parameters:
+        - df (pd.Dataframe): The Survival Dataframe.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - categories (list[str]): clinical categories to analyze.
+        - model (str): 'univariate' or 'multivariable'.
+        - rows (np.ndarray|None): Optional parameter. True for the 'df'
+        rows of the analyzed cohort.
+
+    ## Return:
+        - analysis (dict): JSON serializable analysis, with the 'mode',
+        'model', 'categories' and the 'cox_model()' results as 'models'.
+    '''
+    if model not in MODELS:
+        raise ValueError(f"Invalid Cox model: {model}")
+
+    specs:          list[list[str]] = [[category] for category in categories] if model == 'univariate' else [list(categories)]
+
+    return {'mode':         mode,
+            'model':        model,
+            'categories':   list(categories),
+            'models':       [cox_model(df, mode, spec, rows) for spec in specs]}
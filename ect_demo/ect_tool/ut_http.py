@@ -0,0 +1,116 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) HTTP helpers.
+#
+# - This file contains the helpers for the ECT (Demo) API views:
+#
+#   - compact_json_response(): JSON response without blank spaces.
+#   - compress_response(): view decorator compressing the response
+#     with brotli or gzip, depending on the 'Accept-Encoding' header.
+#
+# - brotli is optional: when the 'brotli' package is not installed the
+#   responses are only compressed with gzip.
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    functools           import  wraps
+from    django.http         import  HttpRequest, HttpResponse, JsonResponse
+from    django.utils.cache  import  patch_vary_headers
+from    django.utils.text   import  compress_string
+import  re
+
+try:
+    import  brotli
+except ImportError:
+    brotli = None
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Responses shorter than this are not worth compressing:
+MIN_COMPRESS_LENGTH:    int         = 200
+
+BROTLI_RE:              re.Pattern  = re.compile(r"\bbr\b")
+GZIP_RE:                re.Pattern  = re.compile(r"\bgzip\b")
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Compact JSON response
+# ---------------------------------------------------------------------
+def compact_json_response(payload:  dict|list,
+                          status:   int         = 200)->JsonResponse:
+    '''
+    Create a JSON response without blank spaces between items.
+
+    ## Parameters:
+        - payload (dict|list): JSON serializable data.
+        - status (int): HTTP status code.
+
+    ## Return:
+        - response (JsonResponse): the JSON response.
+    '''
+    return JsonResponse(payload,
+                        status              = status,
+                        safe                = False,
+                        json_dumps_params   = {'separators': (',', ':')})
+
+
+# Compress a response
+# ---------------------------------------------------------------------
+def compress(request:   HttpRequest,
+             response:  HttpResponse)->HttpResponse:
+    '''
+    Compress the 'response' content with brotli or gzip when the client
+    accepts it, like Django 'GZipMiddleware' does for gzip.
+
+    ## Parameters:
+        - request (HttpRequest): the request.
+        - response (HttpResponse): the response to compress.
+
+    ## Return:
+        - response (HttpResponse): the same response, compressed if
+        possible.
+    '''
+    patch_vary_headers(response, ("Accept-Encoding",))
+
+    if (response.streaming or response.has_header("Content-Encoding")
+            or len(response.content) < MIN_COMPRESS_LENGTH):
+        return response
+
+    accept_encoding:    str     = request.META.get("HTTP_ACCEPT_ENCODING", "")
+
+    if brotli is not None and BROTLI_RE.search(accept_encoding):
+        content:        bytes   = brotli.compress(response.content)
+        encoding:       str     = "br"
+    elif GZIP_RE.search(accept_encoding):
+        content:        bytes   = compress_string(response.content)
+        encoding:       str     = "gzip"
+    else:
+        return response
+
+    if len(content) >= len(response.content):
+        return response
+
+    response.content                = content
+    response["Content-Length"]      = str(len(content))
+    response["Content-Encoding"]    = encoding
+
+    return response
+
+
+# Compress response decorator
+# ---------------------------------------------------------------------
+def compress_response(view_func: callable)->callable:
+    '''
+    View decorator that compresses the view response with 'compress()'.
+    '''
+    @wraps(view_func)
+    def wrapped_view(request, *args, **kwargs):
+        return compress(request, view_func(request, *args, **kwargs))
+
+    return wrapped_view
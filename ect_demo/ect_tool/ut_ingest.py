@@ -0,0 +1,267 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) streaming ingestion of survival files.
+#
+# - 'tcga_read_csv.read_survival_file()' reads the whole dataset into
+#   memory, which is not possible for registry extracts of many GB. The
+#   Kaplan-Meier estimate and the logrank test only need the events and
+#   the patients removed at each (group, time), so a file can be read in
+#   chunks and each chunk reduced to these counts. This file contains
+#   the functions to do it:
+#
+#   - survival_columns(): columns read from a survival file.
+#   - reduce_chunk(): event and removed counts of a chunk of rows.
+#   - merge_aggregates(): add the counts of two aggregates.
+#   - ingest_survival(): counts of a whole file, read in chunks.
+#   - aggregate_event_table(): event table of a category from the counts.
+#   - aggregate_survival_estimates(): Kaplan-Meier estimate and logrank
+#     test of a category from the counts.
+#
+# - Only the chunk being read and the aggregate, one row per distinct
+#   (group, months) pair of each mode and category, are in memory. The
+#   event tables are the same as the ones of the whole DataFrame, so
+#   the plots of 'plotly_survival_plots' can be drawn from them.
+#
+# - The values are checked against the 'ut_constants' vocabularies: the
+#   category values outside 'SURVIVAL_GROUPS' are counted as unknown,
+#   and kept as extra groups after the known ones, like
+#   'tcga_read_csv.apply_survival_schema()' does. The rows with missing
+#   or negative months, or a status other than 0 or 1, are counted as
+#   invalid and left out of their mode.
+#
+# - Other modules used are:
+#
+#   - tcga_read_csv
+#   - ut_constants
+#   - ut_kaplan_meier
+#   - ut_stats
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    pathlib             import  Path
+import  numpy               as      np
+import  pandas              as      pd
+from    .                   import  tcga_read_csv   as  tcga
+from    .                   import  ut_constants    as  cns
+from    .                   import  ut_kaplan_meier as  km
+from    .                   import  ut_stats        as  stats
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Rows read at once:
+CHUNK_ROWS:         int     = 100_000
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Columns of a survival file
+# ---------------------------------------------------------------------
+def survival_columns(modes:         list[str],
+                     categories:    list[str])->list[str]:
+    '''
+    Return the months and status columns of the 'modes', and the
+    'categories' columns, the only ones read by 'ingest_survival()'.
+    '''
+    return [f"{mode}_{column}" for mode in modes for column in ('months', 'status')] + list(categories)
+
+
+# Counts of a chunk of rows
+# ---------------------------------------------------------------------
+def reduce_chunk(chunk:         pd.DataFrame,
+                 modes:         list[str],
+                 categories:    list[str])->dict:
+    '''
+    Reduce a chunk of survival rows to the events and removed patients
+    (events plus censored) of each (group, months) pair, for every mode
+    and category.
+
+    ## Parameters:
+        - chunk (pd.DataFrame): rows with the 'survival_columns()'.
+        - modes (list[str]): survival modes to count.
+        - categories (list[str]): clinical categories to count.
+
+    ## Return:
+        - aggregate (dict): dictionary with the next keys:
+            - 'rows' (int): rows read.
+            - 'invalid' (dict[str:int]): rows left out of each mode.
+            - 'unknown' (dict[str:dict]): rows of each category value
+            outside 'SURVIVAL_GROUPS', by category.
+            - 'counts' (dict[str:dict]): by mode and category, DataFrame
+            with the 'events' and 'removed' of each (group, months)
+            index pair.
+    '''
+    aggregate:      dict            = { 'rows':     len(chunk),
+                                        'invalid':  {},
+                                        'unknown':  {},
+                                        'counts':   {mode: {} for mode in modes}}
+    columns:        dict            = {}
+
+    for category in categories:
+        columns[category]           = chunk[category].astype('category')
+        counts:     pd.Series       = columns[category].value_counts()
+        aggregate['unknown'][category]  = {str(value): int(count) for value, count in counts.items()
+                                           if count > 0 and value not in cns.SURVIVAL_GROUPS[category]}
+
+    for mode in modes:
+        months:     np.ndarray      = pd.to_numeric(chunk[f"{mode}_months"], errors='coerce').to_numpy(dtype=float)
+        status:     np.ndarray      = pd.to_numeric(chunk[f"{mode}_status"], errors='coerce').to_numpy(dtype=float)
+        valid:      np.ndarray      = (months >= 0) & np.isin(status, (0, 1))
+        aggregate['invalid'][mode]  = int((~valid).sum())
+
+        for category in categories:
+            codes:  np.ndarray      = columns[category].cat.codes.to_numpy()
+            rows:   np.ndarray      = valid & (codes >= 0)
+            counts: pd.DataFrame    = pd.DataFrame({'group':    codes[rows],
+                                                    'months':   months[rows],
+                                                    'events':   status[rows],
+                                                    'removed':  np.ones(int(rows.sum()))}).groupby(['group', 'months']).sum()
+
+            # Group labels instead of the codes of this chunk:
+            labels: np.ndarray      = columns[category].cat.categories.astype(str).to_numpy(dtype=object)
+            counts.index            = counts.index.set_levels(labels[counts.index.levels[0]], level='group',
+                                                              verify_integrity=False)
+            aggregate['counts'][mode][category] = counts
+
+    return aggregate
+
+
+# Add two aggregates
+# ---------------------------------------------------------------------
+def merge_aggregates(aggregate: dict,
+                     other:     dict)->dict:
+    '''
+    Add the counts of 'other' to the ones of 'aggregate', as if their
+    rows were reduced together. Both must have the same modes and
+    categories. 'aggregate' is updated and returned.
+    '''
+    aggregate['rows']              += other['rows']
+
+    for mode, invalid in other['invalid'].items():
+        aggregate['invalid'][mode]  = aggregate['invalid'].get(mode, 0) + invalid
+
+    for category, values in other['unknown'].items():
+        unknown:    dict            = aggregate['unknown'].setdefault(category, {})
+        for value, count in values.items():
+            unknown[value]          = unknown.get(value, 0) + count
+
+    for mode, categories in other['counts'].items():
+        for category, counts in categories.items():
+            merged: pd.DataFrame    = aggregate['counts'][mode][category].add(counts, fill_value=0)
+            aggregate['counts'][mode][category] = merged
+
+    return aggregate
+
+
+# Counts of a survival file
+# ---------------------------------------------------------------------
+def ingest_survival(source:     Path|None       = None,
+                    modes:      list[str]|None  = None,
+                    categories: list[str]|None  = None,
+                    chunk_rows: int             = CHUNK_ROWS)->dict:
+    '''
+    Read a survival CSV file in chunks of 'chunk_rows' rows, only its
+    'survival_columns()', and merge the 'reduce_chunk()' counts of every
+    chunk, so the file is never in memory.
+
+    ## Parameters:
+        - source (Path|None): CSV file. By default, 'survival.csv'.
+        - modes (list[str]|None): survival modes to count. By default,
+        all of them.
+        - categories (list[str]|None): clinical categories to count. By
+        default, all of them.
+        - chunk_rows (int): rows read at once.
+
+    ## Return:
+        - aggregate (dict): counts of the whole file, see
+        'reduce_chunk()'.
+
+    A file without some of the 'survival_columns()' raises a ValueError.
+    '''
+    source                          = Path(source or tcga.CSV_FILES_PATH/"survival.csv")
+    modes                           = modes         or list(cns.SURVIVAL_MODES.keys())
+    categories                      = categories    or cns.CATEGORIES
+    columns:        list[str]       = survival_columns(modes, categories)
+
+    missing:        list[str]       = sorted(set(columns) - set(pd.read_csv(source, nrows=0).columns))
+    if missing:
+        raise ValueError(f"Missing survival columns in {source.name}: {missing}")
+
+    aggregate:      dict            = reduce_chunk(pd.DataFrame(columns=columns), modes, categories)
+
+    with pd.read_csv(source,
+                     usecols    = columns,
+                     dtype      = {category: 'category' for category in categories},
+                     chunksize  = chunk_rows) as reader:
+        for chunk in reader:
+            merge_aggregates(aggregate, reduce_chunk(chunk, modes, categories))
+
+    return aggregate
+
+
+# Event table of a category from the counts
+# ---------------------------------------------------------------------
+def aggregate_event_table(aggregate:    dict,
+                          mode:         str,
+                          category:     str)->dict:
+    '''
+    Build the 'ut_kaplan_meier.build_event_table()' table of a category
+    from the aggregate counts, the same as the one of all the rows.
+
+    ## Parameters:
+        - aggregate (dict): result of 'ingest_survival()'.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - category (str): clinical category.
+
+    ## Return:
+        - event_table (dict): deaths and patients at risk by time and
+        group, of the groups with patients.
+    '''
+    counts:         pd.DataFrame    = aggregate['counts'][mode][category]
+    groups:         pd.Index        = counts.index.get_level_values('group')
+
+    # 'SURVIVAL_GROUPS' order, and the unknown values after them, sorted:
+    labels:         list[str]       = (cns.SURVIVAL_GROUPS[category]
+                                       + sorted(set(groups) - set(cns.SURVIVAL_GROUPS[category])))
+
+    return km.build_event_table(counts.index.get_level_values('months').to_numpy(dtype=float),
+                                counts['events'].to_numpy(),
+                                pd.Categorical(groups, categories=labels).codes,
+                                counts  = counts['removed'].to_numpy(),
+                                labels  = labels)
+
+
+# Kaplan-Meier estimate and logrank test from the counts
+# ---------------------------------------------------------------------
+def aggregate_survival_estimates(aggregate: dict,
+                                 mode:      str,
+                                 category:  str)->dict:
+    '''
+    Calculate the multivariate logrank test and the Kaplan-Meier
+    estimate of each group of a category from the aggregate counts.
+
+    ## Parameters:
+        - aggregate (dict): result of 'ingest_survival()'.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - category (str): clinical category.
+
+    ## Return:
+        - survival_estimates (dict): dictionary with the 'logrank',
+        'groups_km_dict' and 'event_table' keys, like the one of
+        'plotly_survival_plots.km_survival_estimates()'.
+    '''
+    event_table:        dict            = aggregate_event_table(aggregate, mode, category)
+    all_groups_km_dict: dict[str:dict]  = km.kaplan_meier_groups(event_table)
+
+    survival_estimates: dict            = { 'logrank':          stats.multi_logrank_test_from_table(event_table),
+                                            'groups_km_dict':   {group: group_km for group, group_km in all_groups_km_dict.items()
+                                                                 if group_km['size'] > 2},
+                                            'event_table':      event_table}
+
+    return survival_estimates
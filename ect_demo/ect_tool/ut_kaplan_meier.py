@@ -0,0 +1,324 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) vectorized Kaplan-Meier estimator.
+#
+# - This file contains a NumPy implementation of the Kaplan-Meier
+#   estimator that fits all the groups of a clinical category at once,
+#   instead of one lifelines 'KaplanMeierFitter' per group:
+#
+#   - build_event_table(): deaths, removed and at risk counts for each
+#     distinct time and group, in one sorted pass.
+#   - build_faceted_event_table(): event tables of every facet (subgroup
+#     of a second category), in the same single pass.
+#   - facet_event_table(): event table of one facet.
+#   - kaplan_meier_curves(): survival probability and exponential
+#     Greenwood confidence intervals for every group.
+#   - kaplan_meier_groups(): per group survival curves and event
+#     tables, as used by the survival plots.
+#   - at_risk_at_times(): patients at risk of every group at any grid
+#     of times.
+#
+# - The results are the same as the lifelines 'KaplanMeierFitter'
+#   'survival_function_', 'confidence_interval_' and 'event_table'.
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    statistics  import  NormalDist
+import  numpy       as      np
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Event table for all the groups
+# ---------------------------------------------------------------------
+def build_event_table(durations:    np.ndarray,
+                      events:       np.ndarray,
+                      groups:       np.ndarray,
+                      counts:       np.ndarray|None = None,
+                      labels:       list|None       = None,
+                      time_index:   tuple|None      = None)->dict:
+    '''
+    Tabulate the deaths, removed and at risk patients for each distinct
+    time and group. Every row is placed into its (time, group) cell with
+    a single 'np.bincount', so the data is sorted only once by 'np.unique'.
+
+    ## Parameters:
+        - durations (np.ndarray): months to event or censoring.
+        - events (np.ndarray): 1 for an observed event, 0 for a censored
+        patient. If 'counts' is given, number of events in the row.
+        - groups (np.ndarray): group label of each row.
+        - counts (np.ndarray|None): Optional parameter. Number of patients
+        in each row, for already aggregated data. One by default.
+        - labels (list|None): Optional parameter. If given, 'groups' are
+        integer codes of these labels, like 'pd.Categorical' codes, and
+        are used without sorting them. Negative codes are skipped.
+        - time_index (tuple|None): Optional parameter. The result of
+        'np.unique(durations, return_inverse=True)', to share the sort
+        of the durations between several tables of the same rows.
+
+    ## Return:
+        - event_table (dict): dictionary with the next keys:
+            - 'timeline' (np.ndarray): sorted distinct times (T).
+            - 'groups' (np.ndarray): distinct group labels (G), sorted or
+            in the 'labels' order. Groups without patients are removed.
+            - 'observed' (np.ndarray): deaths by time and group (T x G).
+            - 'removed' (np.ndarray): deaths plus censored (T x G).
+            - 'at_risk' (np.ndarray): patients with a duration equal or
+            greater than the time (T x G).
+    '''
+    durations               = np.asarray(durations, dtype=float)
+    events                  = np.asarray(events)
+
+    if labels is None:
+        group_labels, codes = np.unique(np.asarray(groups), return_inverse=True)
+    else:
+        codes               = np.asarray(groups)
+        group_labels        = np.asarray(labels, dtype=object)
+
+    if time_index is None:
+        timeline, time_codes = np.unique(durations, return_inverse=True)
+    else:
+        timeline, time_codes = time_index
+
+    # Rows with a missing group are skipped:
+    if labels is not None and (codes < 0).any():
+        known               = codes >= 0
+        events, codes       = events[known], codes[known]
+        time_codes          = time_codes[known]
+        counts              = None if counts is None else np.asarray(counts)[known]
+    n_times:    int         = len(timeline)
+    n_groups:   int         = len(group_labels)
+
+    # Flat (time, group) cell of every row:
+    cells:      np.ndarray  = time_codes * n_groups + codes
+    removed:    np.ndarray  = np.bincount(cells, weights = counts, minlength = n_times * n_groups)
+    observed:   np.ndarray  = np.bincount(cells, weights = events, minlength = n_times * n_groups)
+    removed                 = removed.reshape(n_times, n_groups)
+    observed                = observed.reshape(n_times, n_groups)
+
+    # Patients still at risk: removed at this time or later.
+    at_risk:    np.ndarray  = removed[::-1].cumsum(axis = 0)[::-1]
+
+    # Labels without patients are not groups of the analysis:
+    if labels is not None and n_times > 0:
+        present:    np.ndarray  = at_risk[0] > 0
+        group_labels            = group_labels[present]
+        removed, observed, at_risk = removed[:, present], observed[:, present], at_risk[:, present]
+
+    event_table:    dict    = { 'timeline': timeline,
+                                'groups':   group_labels,
+                                'observed': observed,
+                                'removed':  removed,
+                                'at_risk':  at_risk}
+
+    return event_table
+
+
+# Event tables for all the groups of every facet
+# ---------------------------------------------------------------------
+def build_faceted_event_table(durations:    np.ndarray,
+                              events:       np.ndarray,
+                              groups:       np.ndarray,
+                              facets:       np.ndarray,
+                              labels:       list,
+                              facet_labels: list,
+                              time_index:   tuple|None  = None)->dict:
+    '''
+    Tabulate the deaths, removed and at risk patients for each distinct
+    time, facet and group. Every (facet, group) pair is a column of one
+    'build_event_table()' call, so all the facets share the same sort
+    and 'np.bincount' pass instead of filtering the data once per facet.
+
+    ## Parameters:
+        - durations (np.ndarray): months to event or censoring.
+        - events (np.ndarray): 1 for an observed event, 0 for a censored
+        patient.
+        - groups (np.ndarray): integer code of the group of each row, in
+        'labels'. Negative codes are skipped.
+        - facets (np.ndarray): integer code of the facet of each row, in
+        'facet_labels'. Negative codes are skipped.
+        - labels (list): group labels.
+        - facet_labels (list): facet labels.
+        - time_index (tuple|None): Optional parameter. The result of
+        'np.unique(durations, return_inverse=True)'.
+
+    ## Return:
+        - faceted_table (dict): dictionary with the 'timeline' (T),
+        'groups' (G) and 'facets' (F) labels, and the 'observed',
+        'removed' and 'at_risk' counts by facet, time and group
+        (F x T x G). Groups and facets without patients are kept.
+    '''
+    codes:      np.ndarray  = np.asarray(groups)
+    facet_codes: np.ndarray = np.asarray(facets)
+    n_groups:   int         = len(labels)
+    n_facets:   int         = len(facet_labels)
+
+    # One column for each (facet, group) pair, -1 when any is missing:
+    cells:      np.ndarray  = np.where((codes >= 0) & (facet_codes >= 0), facet_codes * n_groups + codes, -1)
+    table:      dict        = build_event_table(durations, events, cells,
+                                                labels      = np.arange(n_facets * n_groups),
+                                                time_index  = time_index)
+    columns:    np.ndarray  = table['groups'].astype(int)
+    shape:      tuple       = (len(table['timeline']), n_facets * n_groups)
+
+    faceted_table:  dict    = { 'timeline': table['timeline'],
+                                'groups':   np.asarray(labels, dtype=object),
+                                'facets':   np.asarray(facet_labels, dtype=object)}
+
+    for key in ('observed', 'removed', 'at_risk'):
+        values:     np.ndarray  = np.zeros(shape)
+        values[:, columns]      = table[key]
+        faceted_table[key]      = values.reshape(shape[0], n_facets, n_groups).transpose(1, 0, 2)
+
+    return faceted_table
+
+
+# Event table of a facet
+# ---------------------------------------------------------------------
+def facet_event_table(faceted_table:    dict,
+                      index:            int)->dict:
+    '''
+    Return the event table of the 'index' facet of a faceted table, as
+    created by 'build_event_table()': groups without patients in the
+    facet are removed.
+
+    ## Parameters:
+        - faceted_table (dict): table created by
+        'build_faceted_event_table()'.
+        - index (int): facet position.
+
+    ## Return:
+        - event_table (dict): event table of the facet.
+    '''
+    at_risk:    np.ndarray  = faceted_table['at_risk'][index]
+    present:    np.ndarray  = at_risk[0] > 0 if len(at_risk) else np.zeros(at_risk.shape[1], dtype=bool)
+
+    event_table:    dict    = { 'timeline': faceted_table['timeline'],
+                                'groups':   faceted_table['groups'][present],
+                                'observed': faceted_table['observed'][index][:, present],
+                                'removed':  faceted_table['removed'][index][:, present],
+                                'at_risk':  at_risk[:, present]}
+
+    return event_table
+
+
+# Kaplan-Meier estimate for all the groups
+# ---------------------------------------------------------------------
+def kaplan_meier_curves(event_table:    dict,
+                        alpha:          float   = 0.05)->dict:
+    '''
+    Calculate the Kaplan-Meier survival probability and its exponential
+    Greenwood confidence interval for every time and group of the
+    'event_table'. Times where a group has no patients removed keep the
+    previous value of that group.
+
+    ## Parameters:
+        - event_table (dict): table created by 'build_event_table()'.
+        - alpha (float): confidence interval level is (1 - alpha).
+
+    ## Return:
+        - curves (dict): dictionary with 'survival', 'ci_lower' and
+        'ci_upper' matrices (T x G).
+    '''
+    deaths:     np.ndarray  = event_table['observed']
+    at_risk:    np.ndarray  = event_table['at_risk']
+    z:          float       = NormalDist().inv_cdf(1 - alpha / 2)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        # Product limit as a sum of logarithms, 0 where nobody dies:
+        log_terms:  np.ndarray  = np.where(deaths > 0, np.log(at_risk - deaths) - np.log(at_risk), 0.0)
+        var_terms:  np.ndarray  = np.where(deaths > 0, deaths / (at_risk * (at_risk - deaths)), 0.0)
+        var_terms               = np.where(np.isinf(var_terms), 0.0, var_terms)
+
+        log_survival:   np.ndarray  = np.cumsum(log_terms, axis = 0)
+        greenwood:      np.ndarray  = np.sqrt(np.cumsum(var_terms, axis = 0))
+
+        # Exponential Greenwood (log-log) confidence interval:
+        log_minus_log:  np.ndarray  = np.log(-log_survival)
+        ci_lower:       np.ndarray  = np.exp(-np.exp(log_minus_log - z * greenwood / log_survival))
+        ci_upper:       np.ndarray  = np.exp(-np.exp(log_minus_log + z * greenwood / log_survival))
+
+    curves:     dict        = { 'survival': np.exp(log_survival),
+                                'ci_lower': np.nan_to_num(ci_lower, nan = 1.0),
+                                'ci_upper': np.nan_to_num(ci_upper, nan = 1.0)}
+
+    return curves
+
+
+# Kaplan-Meier survival curves by group
+# ---------------------------------------------------------------------
+def kaplan_meier_groups(event_table:    dict,
+                        alpha:          float   = 0.05)->dict[str:dict]:
+    '''
+    Split the Kaplan-Meier estimate of all the groups into one
+    dictionary by group, keeping only the times where the group has
+    patients removed plus the time 0, like lifelines does.
+
+    ## Parameters:
+        - event_table (dict): table created by 'build_event_table()'.
+        - alpha (float): confidence interval level is (1 - alpha).
+
+    ## Return:
+        - groups_km_dict (dict[str:dict]): dictionary with the group
+        label as key, and a dictionary with the next numpy arrays as
+        value: 'timeline', 'survival', 'ci_lower', 'ci_upper',
+        'at_risk', 'observed' and 'censored'. The 'size' key contains
+        the number of patients in the group.
+    '''
+    curves:         dict        = kaplan_meier_curves(event_table, alpha)
+    timeline:       np.ndarray  = event_table['timeline']
+    groups_km_dict: dict        = {}
+
+    for index, group in enumerate(event_table['groups']):
+        removed:    np.ndarray  = event_table['removed'][:, index]
+        rows:       np.ndarray  = np.flatnonzero(removed > 0)
+        size:       int         = int(event_table['at_risk'][0, index])
+
+        group_km:   dict        = { 'timeline': timeline[rows],
+                                    'survival': curves['survival'][rows, index],
+                                    'ci_lower': curves['ci_lower'][rows, index],
+                                    'ci_upper': curves['ci_upper'][rows, index],
+                                    'at_risk':  event_table['at_risk'][rows, index],
+                                    'observed': event_table['observed'][rows, index],
+                                    'censored': removed[rows] - event_table['observed'][rows, index]}
+
+        # The curve always starts at time 0 with all the patients at risk:
+        if len(rows) == 0 or group_km['timeline'][0] > 0:
+            start:  dict        = { 'timeline': 0.0, 'survival': 1.0, 'ci_lower': 1.0, 'ci_upper': 1.0,
+                                    'at_risk':  size, 'observed': 0.0, 'censored': 0.0}
+            group_km            = {key: np.insert(values, 0, start[key]) for key, values in group_km.items()}
+
+        group_km['size']        = size
+        groups_km_dict[str(group)] = group_km
+
+    return groups_km_dict
+
+
+# Patients at risk at a grid of times
+# ---------------------------------------------------------------------
+def at_risk_at_times(event_table:   dict,
+                     times:         list|np.ndarray)->np.ndarray:
+    '''
+    Count the patients at risk of every group at each of the 'times',
+    that is, the patients with a duration equal or greater than the
+    time. All the times are located in the event table timeline with a
+    single 'np.searchsorted', so finer grids have no extra cost.
+
+    ## Parameters:
+        - event_table (dict): table created by 'build_event_table()'.
+        - times (list|np.ndarray): times to count the patients at risk.
+
+    ## Return:
+        - at_risk (np.ndarray): patients at risk by time and group
+        (len(times) x G).
+    '''
+    at_risk:    np.ndarray  = event_table['at_risk']
+
+    # Times after the last one have nobody at risk:
+    padded:     np.ndarray  = np.concatenate([at_risk, np.zeros((1,) + at_risk.shape[1:])], axis = 0)
+    rows:       np.ndarray  = np.searchsorted(event_table['timeline'], np.asarray(times, dtype=float), side = 'left')
+
+    return padded[rows].astype(int)
@@ -0,0 +1,329 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) resampling statistics.
+#
+# - The logrank pvalue and the Greenwood confidence intervals are
+#   asymptotic, and not reliable for small groups like 'Serous' or
+#   'POLE'. This file contains their resampling versions:
+#
+#   - permutation_logrank_test(): logrank test pvalue from permutations
+#     of the group labels.
+#   - bootstrap_survival_bands(): Kaplan-Meier percentile confidence
+#     bands from bootstrap resamples of each group.
+#
+# - The rows are sorted once into a shared time axis, and a batch of
+#   resamples is tabulated with a single 'np.bincount' into a
+#   (resamples x times x groups) event table, so the logrank statistics
+#   of the whole batch come from one 'ut_stats.logrank_components()'
+#   call and the survival curves from one cumulative sum.
+#
+# - The resamples are split in shards of SHARD_SIZE, each one with its
+#   own 'np.random.SeedSequence' child of the 'seed'. The shards don't
+#   depend on the number of processes, so a seed gives the same result
+#   computed in this process or by a pool of any size.
+#
+# - Other modules used are:
+#
+#   - ut_kaplan_meier
+#   - ut_stats
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    concurrent.futures      import  ProcessPoolExecutor
+import  numpy                   as      np
+import  pandas                  as      pd
+from    .                       import  ut_kaplan_meier as km
+from    .                       import  ut_stats        as stats
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Resamples tabulated together, and by each task of the process pool:
+SHARD_SIZE:         int     = 100
+
+# Default number of permutations and bootstrap resamples:
+PERMUTATIONS:       int     = 10000
+RESAMPLES:          int     = 2000
+
+# Rows of the worker processes, sent once per worker:
+_worker_rows:       dict    = {}
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Shards of a resampling
+# ---------------------------------------------------------------------
+def resampling_shards(total:    int,
+                      seed:     int|None)->list[tuple[np.random.SeedSequence, int]]:
+    '''
+    Split 'total' resamples in shards of SHARD_SIZE, each one with its
+    own independent seed.
+
+    ## Parameters:
+        - total (int): number of resamples.
+        - seed (int|None): seed of the resampling, None for a random one.
+
+    ## Return:
+        - shards (list[tuple]): (seed sequence, number of resamples) of
+        each shard.
+    '''
+    sizes:      list[int]   = [SHARD_SIZE] * (total // SHARD_SIZE) + ([total % SHARD_SIZE] if total % SHARD_SIZE else [])
+
+    return list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+
+
+# Sorted rows of a resampling
+# ---------------------------------------------------------------------
+def _resampling_rows(months:    list|pd.Series,
+                     groups:    list|pd.Series,
+                     status:    list|pd.Series)->dict:
+    '''
+    Index the rows with a group on their distinct times and group codes.
+    '''
+    months                      = np.asarray(months, dtype=float)
+    groups                      = np.asarray(groups)
+    known:      np.ndarray      = pd.notna(groups)
+    group_labels, codes         = np.unique(groups[known], return_inverse=True)
+    timeline, time_codes        = np.unique(months[known], return_inverse=True)
+
+    return {'timeline':     timeline,
+            'groups':       group_labels,
+            'time_codes':   time_codes,
+            'codes':        codes,
+            'events':       np.asarray(status, dtype=float)[known]}
+
+
+# Event tables of a batch of resamples
+# ---------------------------------------------------------------------
+def _batch_event_table(rows:        dict,
+                       time_codes:  np.ndarray,
+                       codes:       np.ndarray,
+                       events:      np.ndarray)->tuple[np.ndarray, np.ndarray]:
+    '''
+    Tabulate a batch of resamples, one per row of the (B x N) arrays,
+    into deaths and at risk patients by resample, time and group
+    (B x T x G), with a single 'np.bincount' each.
+    '''
+    shape:      tuple           = (len(codes), len(rows['timeline']), len(rows['groups']))
+    cells:      np.ndarray      = ((np.arange(shape[0])[:, None] * shape[1] + time_codes) * shape[2] + codes).ravel()
+    removed:    np.ndarray      = np.bincount(cells, minlength = np.prod(shape)).reshape(shape)
+    observed:   np.ndarray      = np.bincount(cells, weights = events.ravel(), minlength = np.prod(shape)).reshape(shape)
+
+    return (observed, removed[:, ::-1].cumsum(axis = 1)[:, ::-1].astype(float))
+
+
+# Process pool initializer
+# ---------------------------------------------------------------------
+def _init_worker(rows: dict):
+    '''
+    Keep the resampled rows in the worker process, so they are sent once
+    per worker instead of once per shard.
+    '''
+    _worker_rows.clear()
+    _worker_rows.update(rows)
+
+
+# Run the shards of a resampling
+# ---------------------------------------------------------------------
+def _run_shards(shard_function: callable,
+                rows:           dict,
+                shards:         list[tuple],
+                processes:      int|None,
+                *args)->list[np.ndarray]:
+    '''
+    Call 'shard_function(rows, seed, size, *args)' for each shard, in
+    this process or in a pool of 'processes' processes, and return the
+    results in the shards order.
+    '''
+    if processes:
+        with ProcessPoolExecutor(max_workers = processes,
+                                 initializer = _init_worker,
+                                 initargs    = (rows,)) as executor:
+            futures:    list    = [executor.submit(_worker_shard, shard_function, seed, size, *args)
+                                   for seed, size in shards]
+            return [future.result() for future in futures]
+
+    return [shard_function(rows, seed, size, *args) for seed, size in shards]
+
+
+# ---------------------------------------------------------------------
+def _worker_shard(shard_function:   callable,
+                  seed:             np.random.SeedSequence,
+                  size:             int,
+                  *args)->np.ndarray:
+    '''
+    Run one shard in a worker process, with the worker rows.
+    '''
+    return shard_function(_worker_rows, seed, size, *args)
+
+
+# Logrank statistics of a shard of permutations
+# ---------------------------------------------------------------------
+def _permutation_shard(rows:    dict,
+                       seed:    np.random.SeedSequence,
+                       size:    int)->np.ndarray:
+    '''
+    Return the logrank statistic of 'size' random permutations of the
+    group labels, keeping the times and events of the rows.
+    '''
+    generator:  np.random.Generator = np.random.default_rng(seed)
+    codes:      np.ndarray          = generator.permuted(np.broadcast_to(rows['codes'], (size, len(rows['codes']))), axis = 1)
+    observed, at_risk               = _batch_event_table(rows,
+                                                         np.broadcast_to(rows['time_codes'], codes.shape),
+                                                         codes,
+                                                         np.broadcast_to(rows['events'], codes.shape))
+
+    o_minus_e, covariance, _        = stats.logrank_components(observed, at_risk, np.ones(observed.shape[:-1]))
+
+    return stats.logrank_chi_squared(o_minus_e, covariance)[0]
+
+
+# Permutation logrank test
+# ---------------------------------------------------------------------
+def permutation_logrank_test(months:        list|pd.Series,
+                             groups:        list|pd.Series,
+                             status:        list|pd.Series,
+                             permutations:  int         = PERMUTATIONS,
+                             seed:          int|None    = 0,
+                             processes:     int|None    = None)->dict:
+    '''
+    Calculate the multivariate logrank test pvalue as the fraction of
+    random permutations of the group labels with a statistic equal or
+    greater than the observed one. It does not rely on the chi-squared
+    approximation, so it is valid for small groups.
+
+    ## Parameters:
+        - months (list|pd.Series): array of months.
+        - groups (list|pd.Series): array of groups, rows without a group
+        are left out.
+        - status (list|pd.Series): array of status.
+        - permutations (int): number of random permutations.
+        - seed (int|None): seed of the permutations, None for a random
+        one.
+        - processes (int|None): Optional parameter. If given, the shards
+        of permutations are computed by a pool of this number of
+        processes.
+
+    ## Return:
+        - result (dict): dictionary with the 'test_statistic',
+        'degrees_of_freedom', the permutation 'p_value', the chi-squared
+        'asymptotic_p_value', the number of 'permutations' and the
+        'groups'. With fewer than 2 groups the 'p_value' is NaN.
+    '''
+    rows:           dict            = _resampling_rows(months, groups, status)
+    logrank:        dict            = stats.multi_logrank_test_from_table(
+                                            km.build_event_table(rows['timeline'][rows['time_codes']], rows['events'],
+                                                                 rows['codes'], labels = list(rows['groups']),
+                                                                 time_index = (rows['timeline'], rows['time_codes'])))
+
+    # With fewer than 2 groups there is no test to permute:
+    if logrank['degrees_of_freedom'] == 0 or not np.isfinite(logrank['test_statistic']):
+        p_value:    float           = np.nan
+    else:
+        statistics: np.ndarray      = np.concatenate(_run_shards(_permutation_shard, rows,
+                                                                 resampling_shards(permutations, seed), processes))
+
+        # Equal statistics, up to the rounding of another summation
+        # order, count as extreme:
+        extreme:    int             = int((statistics >= logrank['test_statistic'] * (1 - 1e-9) - 1e-12).sum())
+        p_value:    float           = (extreme + 1) / (permutations + 1)
+
+    result:         dict            = { 'test_statistic':       logrank['test_statistic'],
+                                        'degrees_of_freedom':   logrank['degrees_of_freedom'],
+                                        'p_value':              p_value,
+                                        'asymptotic_p_value':   logrank['p_value'],
+                                        'permutations':         permutations,
+                                        'groups':               rows['groups']}
+
+    return result
+
+
+# Survival curves of a shard of bootstrap resamples
+# ---------------------------------------------------------------------
+def _bootstrap_shard(rows:          dict,
+                     seed:          np.random.SeedSequence,
+                     size:          int,
+                     grid_codes:    np.ndarray)->np.ndarray:
+    '''
+    Return the Kaplan-Meier estimate of each group at the 'grid_codes'
+    times for 'size' bootstrap resamples (size x times x groups). Each
+    group is resampled with replacement from its own rows, so every
+    resample keeps the group sizes.
+    '''
+    generator:  np.random.Generator = np.random.default_rng(seed)
+    members:    list[np.ndarray]    = [np.flatnonzero(rows['codes'] == code) for code in range(len(rows['groups']))]
+    samples:    np.ndarray          = np.concatenate([group_rows[generator.integers(0, len(group_rows), (size, len(group_rows)))]
+                                                      for group_rows in members], axis = 1)
+    observed, at_risk               = _batch_event_table(rows, rows['time_codes'][samples], rows['codes'][samples],
+                                                         rows['events'][samples])
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        log_terms:  np.ndarray      = np.where(observed > 0, np.log(at_risk - observed) - np.log(at_risk), 0.0)
+
+    return np.exp(np.cumsum(log_terms, axis = 1)[:, grid_codes])
+
+
+# Bootstrap Kaplan-Meier confidence bands
+# ---------------------------------------------------------------------
+def bootstrap_survival_bands(months:    list|pd.Series,
+                             groups:    list|pd.Series,
+                             status:    list|pd.Series,
+                             resamples: int                 = RESAMPLES,
+                             alpha:     float               = 0.05,
+                             seed:      int|None            = 0,
+                             processes: int|None            = None,
+                             times:     np.ndarray|None     = None)->dict:
+    '''
+    Calculate the Kaplan-Meier estimate of every group with percentile
+    confidence bands from bootstrap resamples, instead of the Greenwood
+    ones of 'ut_kaplan_meier.kaplan_meier_curves()'.
+
+    ## Parameters:
+        - months (list|pd.Series): array of months.
+        - groups (list|pd.Series): array of groups, rows without a group
+        are left out.
+        - status (list|pd.Series): array of status.
+        - resamples (int): number of bootstrap resamples.
+        - alpha (float): confidence band level is (1 - alpha).
+        - seed (int|None): seed of the resamples, None for a random one.
+        - processes (int|None): Optional parameter. If given, the shards
+        of resamples are computed by a pool of this number of processes.
+        - times (np.ndarray|None): Optional parameter. Months of the
+        bands, by default every distinct month. A short grid keeps the
+        memory low for large datasets.
+
+    ## Return:
+        - bands (dict): dictionary with the 'timeline' (T), 'groups' (G),
+        and the 'survival', 'ci_lower' and 'ci_upper' matrices (T x G).
+    '''
+    rows:           dict            = _resampling_rows(months, groups, status)
+    timeline:       np.ndarray      = rows['timeline'] if times is None else np.asarray(times, dtype=float)
+
+    # Estimate at a time: the one of the last distinct month before it:
+    grid_codes:     np.ndarray      = np.searchsorted(rows['timeline'], timeline, side = 'right') - 1
+    before:         np.ndarray      = grid_codes < 0
+    grid_codes                      = np.maximum(grid_codes, 0)
+
+    event_table:    dict            = km.build_event_table(rows['timeline'][rows['time_codes']], rows['events'], rows['codes'],
+                                                           labels = list(rows['groups']),
+                                                           time_index = (rows['timeline'], rows['time_codes']))
+    survival:       np.ndarray      = km.kaplan_meier_curves(event_table, alpha)['survival'][grid_codes]
+    curves:         np.ndarray      = np.concatenate(_run_shards(_bootstrap_shard, rows, resampling_shards(resamples, seed),
+                                                                 processes, grid_codes))
+    ci_lower, ci_upper              = np.quantile(curves, [alpha / 2, 1 - alpha / 2], axis = 0)
+
+    # Everybody is alive before the first month:
+    for matrix in (survival, ci_lower, ci_upper):
+        matrix[before]              = 1.0
+
+    bands:          dict            = { 'timeline': timeline,
+                                        'groups':   rows['groups'],
+                                        'survival': survival,
+                                        'ci_lower': ci_lower,
+                                        'ci_upper': ci_upper}
+
+    return bands
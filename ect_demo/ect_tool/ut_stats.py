@@ -2,18 +2,327 @@
 #   Author:     Xavier Llobet Navàs.
 #   Content:    ECT (Demo) statistics.
 #
-# - This file contains a function for statistical analysis. The
-#   function is:
+# - This file contains the functions for statistical analysis. The
+#   functions are:
 #
-#   - calculate_formatted_multi_logrank_p(): calculate and format 
+#   - logrank_components(): observed minus expected vector and its
+#     covariance matrix from an event table.
+#   - multi_logrank_test_from_table(): multivariate logrank test (and
+#     Fleming-Harrington weighted variant) from an event table.
+#   - stratified_logrank_test(): multivariate logrank test by strata.
+#   - faceted_logrank_tests(): multivariate logrank test of each facet.
+#   - format_p_value(): format a pvalue for the plots.
+#   - calculate_formatted_multi_logrank_p(): calculate and format
 #     multivariate logrank test pvalue.
+#   - calculate_formatted_permutation_logrank_p(): calculate and format
+#     the permutation logrank test pvalue, for small groups.
+#
+# - The event tables are the ones created by 'ut_kaplan_meier', so the
+#   logrank test shares the sorted pass with the Kaplan-Meier estimate.
+#   The results are the same as the lifelines 'multivariate_logrank_test'.
+#
+# - Other modules used are:
+#
+#   - ut_kaplan_meier
+#   - ut_resampling
 #
 # =====================================================================
 # IMPORTS
 # =====================================================================
 
+import  numpy                   as      np
 import  pandas                  as      pd
-from    lifelines.statistics    import  multivariate_logrank_test
+from    scipy.special           import  chdtrc
+from    .                       import  ut_kaplan_meier as km
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Logrank test weights
+# ---------------------------------------------------------------------
+def logrank_weights(observed:   np.ndarray,
+                    at_risk:    np.ndarray,
+                    weightings: str|None    = None,
+                    p:          float       = 0.0,
+                    q:          float       = 0.0)->np.ndarray:
+    '''
+    Calculate the weight of each time of an event table for the logrank
+    test family.
+
+    ## Parameters:
+        - observed (np.ndarray): deaths by time and group (... x T x G).
+        - at_risk (np.ndarray): patients at risk by time and group
+        (... x T x G).
+        - weightings (str|None): None for the logrank test, or
+        'fleming-harrington' for the G(p, q) weights S(t-)^p (1-S(t-))^q,
+        where S is the pooled Kaplan-Meier estimate.
+        - p (float): Fleming-Harrington 'p' exponent.
+        - q (float): Fleming-Harrington 'q' exponent.
+
+    ## Return:
+        - weights (np.ndarray): weight of each time (... x T).
+    '''
+    if weightings is None:
+        return np.ones(observed.shape[:-1])
+
+    if weightings != 'fleming-harrington':
+        raise ValueError(f"Invalid value for weightings: {weightings}")
+    if p < 0 or q < 0:
+        raise ValueError("Fleming-Harrington 'p' and 'q' must be non-negative.")
+
+    deaths:         np.ndarray  = observed.sum(axis = -1)
+    population:     np.ndarray  = at_risk.sum(axis = -1)
+
+    # Left-continuous pooled Kaplan-Meier estimate:
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        survival:   np.ndarray  = np.cumprod(np.where(population > 0, 1.0 - deaths / population, 1.0), axis = -1)
+    survival_left:  np.ndarray  = np.concatenate([np.ones(survival.shape[:-1] + (1,)), survival[..., :-1]], axis = -1)
+
+    return np.power(survival_left, p) * np.power(1.0 - survival_left, q)
+
+
+# Observed minus expected and covariance
+# ---------------------------------------------------------------------
+def logrank_components(observed:    np.ndarray,
+                       at_risk:     np.ndarray,
+                       weights:     np.ndarray)->tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Calculate the weighted observed minus expected deaths of each group
+    and its covariance matrix. The time axis is the second to last one
+    and the group axis the last one, so the same function works for
+    strata or batches of tables stacked in the leading axes.
+
+    ## Parameters:
+        - observed (np.ndarray): deaths by time and group (... x T x G).
+        - at_risk (np.ndarray): patients at risk by time and group
+        (... x T x G).
+        - weights (np.ndarray): weight of each time (... x T).
+
+    ## Returns a tuple of:
+        - o_minus_e (np.ndarray): observed minus expected (... x G).
+        - covariance (np.ndarray): covariance matrix (... x G x G).
+        - expected (np.ndarray): weighted expected deaths (... x G).
+    '''
+    deaths:         np.ndarray  = observed.sum(axis = -1)
+    population:     np.ndarray  = at_risk.sum(axis = -1)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        rate:       np.ndarray  = np.where(population > 0, deaths / population, 0.0)
+        ties:       np.ndarray  = np.where(population > 1, (population - deaths) / (population - 1), 1.0)
+        factor:     np.ndarray  = np.where(population > 0, ties * deaths / population ** 2, 0.0)
+
+    expected:       np.ndarray  = (weights * rate)[..., None] * at_risk
+    o_minus_e:      np.ndarray  = (weights[..., None] * observed - expected).sum(axis = -2)
+    expected                    = expected.sum(axis = -2)
+
+    # V_gh = sum_t w^2 f (n_t n_tg delta_gh - n_tg n_th)
+    scaled:         np.ndarray  = (weights ** 2 * factor)[..., None] * at_risk
+    covariance:     np.ndarray  = -np.einsum('...tg,...th->...gh', scaled, at_risk)
+    diagonal:       np.ndarray  = (scaled * population[..., None]).sum(axis = -2)
+    index:          np.ndarray  = np.arange(at_risk.shape[-1])
+    covariance[..., index, index] += diagonal
+
+    return (o_minus_e, covariance, expected)
+
+
+# Chi-squared statistic and pvalue
+# ---------------------------------------------------------------------
+def logrank_chi_squared(o_minus_e:  np.ndarray,
+                        covariance: np.ndarray)->tuple[np.ndarray, int, np.ndarray]:
+    '''
+    Calculate the logrank chi-squared statistic with the first G-1
+    groups, its degrees of freedom and its pvalue.
+
+    ## Parameters:
+        - o_minus_e (np.ndarray): observed minus expected (... x G).
+        - covariance (np.ndarray): covariance matrix (... x G x G).
+
+    ## Returns a tuple of:
+        - test_statistic (np.ndarray): chi-squared statistic (...).
+        - degrees_of_freedom (int): number of groups minus 1.
+        - p_value (np.ndarray): pvalue (...).
+
+    With fewer than 2 groups there is no test: the degrees of freedom
+    are 0, and the statistic and pvalue NaN.
+    '''
+    degrees_of_freedom: int         = max(o_minus_e.shape[-1] - 1, 0)
+    if degrees_of_freedom == 0:
+        no_test:        np.ndarray  = np.full(o_minus_e.shape[:-1], np.nan)
+        return (no_test, degrees_of_freedom, no_test)
+
+    z:                  np.ndarray  = o_minus_e[..., :-1]
+    inverse:            np.ndarray  = np.linalg.pinv(covariance[..., :-1, :-1])
+    test_statistic:     np.ndarray  = np.einsum('...g,...gh,...h->...', z, inverse, z)
+
+    return (test_statistic, degrees_of_freedom, chdtrc(degrees_of_freedom, test_statistic))
+
+
+# Multivariate logrank test from an event table
+# ---------------------------------------------------------------------
+def multi_logrank_test_from_table(event_table:  dict,
+                                  weightings:   str|None    = None,
+                                  p:            float       = 0.0,
+                                  q:            float       = 0.0)->dict:
+    '''
+    Calculate the multivariate logrank test for all the groups of an
+    'ut_kaplan_meier' event table, without sorting the data again.
+
+    ## Parameters:
+        - event_table (dict): table created by
+        'ut_kaplan_meier.build_event_table()'.
+        - weightings (str|None): None for the logrank test, or
+        'fleming-harrington' for the weighted variant.
+        - p (float): Fleming-Harrington 'p' exponent.
+        - q (float): Fleming-Harrington 'q' exponent.
+
+    ## Return:
+        - result (dict): dictionary with the 'test_statistic',
+        'degrees_of_freedom', 'p_value', and the 'groups', 'observed'
+        and 'expected' deaths by group.
+    '''
+    observed:   np.ndarray  = event_table['observed']
+    at_risk:    np.ndarray  = event_table['at_risk']
+    weights:    np.ndarray  = logrank_weights(observed, at_risk, weightings, p, q)
+
+    o_minus_e, covariance, expected         = logrank_components(observed, at_risk, weights)
+    test_statistic, degrees, p_value        = logrank_chi_squared(o_minus_e, covariance)
+
+    result:     dict        = { 'test_statistic':       float(test_statistic),
+                                'degrees_of_freedom':   degrees,
+                                'p_value':              float(p_value),
+                                'groups':               event_table['groups'],
+                                'observed':             (weights[:, None] * observed).sum(axis = 0),
+                                'expected':             expected}
+
+    return result
+
+
+# Stratified multivariate logrank test
+# ---------------------------------------------------------------------
+def stratified_logrank_test(months:     list|pd.Series,
+                            groups:     list|pd.Series,
+                            status:     list|pd.Series,
+                            strata:     list|pd.Series,
+                            weightings: str|None    = None,
+                            p:          float       = 0.0,
+                            q:          float       = 0.0)->dict:
+    '''
+    Calculate the multivariate logrank test for the 'groups' adjusted
+    by 'strata': the observed minus expected vectors and covariance
+    matrices of each stratum are added before the chi-squared test.
+    All the strata are tabulated together in a single event table.
+
+    ## Parameters:
+        - months (list|pd.Series): array of months.
+        - groups (list|pd.Series): array of groups.
+        - status (list|pd.Series): array of status.
+        - strata (list|pd.Series): array of strata.
+        - weightings (str|None): None for the logrank test, or
+        'fleming-harrington' for the weighted variant, with weights
+        from the pooled Kaplan-Meier estimate of each stratum.
+        - p (float): Fleming-Harrington 'p' exponent.
+        - q (float): Fleming-Harrington 'q' exponent.
+
+    ## Return:
+        - result (dict): dictionary with the 'test_statistic',
+        'degrees_of_freedom', 'p_value' and 'groups'.
+    '''
+    group_labels, group_codes   = np.unique(np.asarray(groups), return_inverse = True)
+    strata_labels, strata_codes = np.unique(np.asarray(strata), return_inverse = True)
+    n_groups:       int         = len(group_labels)
+    n_strata:       int         = len(strata_labels)
+
+    # One event table with a column for each (stratum, group) pair:
+    event_table:    dict        = km.build_event_table(months, status, strata_codes * n_groups + group_codes)
+    columns:        np.ndarray  = event_table['groups']
+    shape:          tuple       = (len(event_table['timeline']), n_strata * n_groups)
+    observed:       np.ndarray  = np.zeros(shape)
+    at_risk:        np.ndarray  = np.zeros(shape)
+    observed[:, columns]        = event_table['observed']
+    at_risk[:, columns]         = event_table['at_risk']
+
+    # Strata x Times x Groups:
+    observed                    = observed.reshape(shape[0], n_strata, n_groups).transpose(1, 0, 2)
+    at_risk                     = at_risk.reshape(shape[0], n_strata, n_groups).transpose(1, 0, 2)
+    weights:        np.ndarray  = logrank_weights(observed, at_risk, weightings, p, q)
+
+    o_minus_e, covariance, _    = logrank_components(observed, at_risk, weights)
+    test_statistic, degrees, p_value    = logrank_chi_squared(o_minus_e.sum(axis = 0), covariance.sum(axis = 0))
+
+    result:         dict        = { 'test_statistic':       float(test_statistic),
+                                    'degrees_of_freedom':   degrees,
+                                    'p_value':              float(p_value),
+                                    'groups':               group_labels}
+
+    return result
+
+
+# Multivariate logrank test of each facet
+# ---------------------------------------------------------------------
+def faceted_logrank_tests(faceted_table:    dict,
+                          weightings:       str|None    = None,
+                          p:                float       = 0.0,
+                          q:                float       = 0.0)->list[dict]:
+    '''
+    Calculate the multivariate logrank test of the groups inside each
+    facet of an 'ut_kaplan_meier.build_faceted_event_table()' table. The
+    observed minus expected vectors and covariance matrices of all the
+    facets are calculated at once along the leading facet axis. Only the
+    groups with patients in a facet take part in its test.
+
+    ## Parameters:
+        - faceted_table (dict): table created by
+        'ut_kaplan_meier.build_faceted_event_table()'.
+        - weightings (str|None): None for the logrank test, or
+        'fleming-harrington' for the weighted variant.
+        - p (float): Fleming-Harrington 'p' exponent.
+        - q (float): Fleming-Harrington 'q' exponent.
+
+    ## Return:
+        - results (list[dict]): one dictionary for each facet, in the
+        table order, with the 'facet', 'test_statistic',
+        'degrees_of_freedom', 'p_value' and 'groups'. The 'p_value' is
+        NaN when the facet has less than two groups.
+    '''
+    observed:       np.ndarray  = faceted_table['observed']
+    at_risk:        np.ndarray  = faceted_table['at_risk']
+    weights:        np.ndarray  = logrank_weights(observed, at_risk, weightings, p, q)
+
+    o_minus_e, covariance, _    = logrank_components(observed, at_risk, weights)
+    present:        np.ndarray  = at_risk[:, 0, :] > 0 if at_risk.shape[1] else np.zeros(o_minus_e.shape, dtype=bool)
+    results:        list[dict]  = []
+
+    for index, facet in enumerate(faceted_table['facets']):
+        groups:     np.ndarray  = present[index]
+        if groups.sum() < 2:
+            test_statistic, degrees, p_value    = (np.nan, max(int(groups.sum()) - 1, 0), np.nan)
+        else:
+            test_statistic, degrees, p_value    = logrank_chi_squared(o_minus_e[index][groups],
+                                                                      covariance[index][np.ix_(groups, groups)])
+        results.append({'facet':                facet,
+                        'test_statistic':       float(test_statistic),
+                        'degrees_of_freedom':   degrees,
+                        'p_value':              float(p_value),
+                        'groups':               faceted_table['groups'][groups]})
+
+    return results
+
+
+# Format pvalue
+# ---------------------------------------------------------------------
+def format_p_value(p_value: float)->str:
+    '''
+    Format a pvalue in scientific notation for the plots.
+
+    ## Parameters:
+        - p_value (float): pvalue.
+
+    ## Return:
+        - p_value (str): formatted pvalue.
+    '''
+    return "{:e}".format(p_value)
+
 
 # Caluclate multivariate logrank test pvalue.
 # ---------------------------------------------------------------------
@@ -22,26 +331,61 @@ def calculate_formatted_multi_logrank_p(months: list|pd.Series,
                                         status: list|pd.Series)->str:
     '''
     Calculate a logrank test p value for more than two populations.
-    This test is a generalization of the logrank_test: it can deal 
+    This test is a generalization of the logrank_test: it can deal
     with n>2 populations:
 
     ## Parameters:
         - months (list|pd.Series): array of months.
         - groups (list|pd.Series): array of groups.
         - status (list|pd.Series): array of status.
-        
+
     ## Return:
         - p_value (str): formatted pvalue.
     '''
 
-    # Calculate StatisticalResult object with properties 'p_value', 
-    # 'summary', 'test_statistic', 'print_summary':
-    logrank                     = multivariate_logrank_test(months, 
-                                                            groups, 
-                                                            status)
-    
+    # Tabulate the deaths and patients at risk by time and group:
+    event_table:        dict    = km.build_event_table(np.asarray(months),
+                                                       np.asarray(status),
+                                                       np.asarray(groups))
+    logrank:            dict    = multi_logrank_test_from_table(event_table)
+
     # Formatted pvalue.
-    logrank_p_value:    str     = "{:e}".format(logrank.p_value)
+    logrank_p_value:    str     = format_p_value(logrank['p_value'])
 
     return logrank_p_value
 
+
+# Calculate permutation logrank test pvalue.
+# ---------------------------------------------------------------------
+def calculate_formatted_permutation_logrank_p(months:       list|pd.Series,
+                                              groups:       list|pd.Series,
+                                              status:       list|pd.Series,
+                                              permutations: int         = 10000,
+                                              seed:         int|None    = 0,
+                                              processes:    int|None    = None)->str:
+    '''
+    Calculate the multivariate logrank test pvalue from random
+    permutations of the group labels, see
+    'ut_resampling.permutation_logrank_test()'. Unlike
+    'calculate_formatted_multi_logrank_p()', it is valid for small
+    groups.
+
+    ## Parameters:
+        - months (list|pd.Series): array of months.
+        - groups (list|pd.Series): array of groups.
+        - status (list|pd.Series): array of status.
+        - permutations (int): number of random permutations.
+        - seed (int|None): seed of the permutations, None for a random
+        one.
+        - processes (int|None): Optional parameter. Number of processes
+        to compute the permutations with.
+
+    ## Return:
+        - p_value (str): formatted pvalue.
+    '''
+    # Imported here, 'ut_resampling' uses the functions of this module:
+    from    .   import  ut_resampling   as  resampling
+
+    logrank:            dict    = resampling.permutation_logrank_test(months, groups, status, permutations, seed, processes)
+
+    return format_p_value(logrank['p_value'])
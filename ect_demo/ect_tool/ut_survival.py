@@ -6,20 +6,34 @@
 #   to do a survival analysis. Te functions are:
 #
 #   - km_category_survival_helper(): survival analysis by clinical category.
+#   - km_category_survival_data(): survival analysis by clinical category
+#     as plain data for the JSON API.
+#   - km_batch_survival_helper(): many survival analyses in one call.
+#   - cox_survival_data(): hazard ratios of clinical categories, with
+#     their forest plot and table.
 #
 # - Other modules used are:
 #
 #   - plotly_survival_plots
 #   - ut_constants
+#   - ut_cox
+#   - ut_timing
 #
 # =====================================================================
 # IMPORTS
 # =====================================================================
 
+from    concurrent.futures  import  ProcessPoolExecutor
 from    .           import  plotly_survival_plots    as  sp
 from    .           import  ut_constants             as  cns
+from    .           import  ut_cox                   as  cox
+from    .           import  ut_timing                as  timing
+import  numpy       as      np
 import  pandas      as      pd
 
+# Decimals kept in the JSON survival curves:
+JSON_DECIMALS:      int     = 6
+
 # =====================================================================
 # FUNCTIONS
 # =====================================================================
@@ -30,7 +44,10 @@ def km_category_survival_helper(df:                  pd.DataFrame,
                                 mode:                str,
                                 group_column_name:   str,
                                 main_category:       str,
-                                group_categories:    list[str])->dict:
+                                group_categories:    list[str],
+                                time_index:          tuple|None  = None,
+                                facet_name:          str|None    = None,
+                                rows:                np.ndarray|None = None)->dict:
     '''
     Handle survival and population bar plot generation for specific 
     clinical categories, save the plots into the database,
@@ -46,30 +63,44 @@ def km_category_survival_helper(df:                  pd.DataFrame,
         - main_category (str): main category name only for plot tile.
         - group_categories (list[str]): list of the categories included 
         in group_column_name.
-        - html_key (str): string as key for the Django template blocks.
+        - time_index (tuple|None): Optional parameter. Sorted distinct
+        months of the 'mode', shared by all the categories of a batch.
+        - facet_name (str|None): Optional parameter. Category splitting
+        the survival analysis, with a plot column for each subcategory.
+        - rows (np.ndarray|None): Optional parameter. True for the 'df'
+        rows of the analyzed cohort, see 'ut_cohort.cohort_mask()'. All
+        the patients by default.
 
     ## Returns:
         - context (dict): Dictionary with the data to fill up the Django
         template.
     '''
+    # Title of the facets category:
+    facet_title:            str             = f" and <b style='color: green;'>{cns.CATEGORIES_DICT[facet_name]}</b>" if facet_name else ""
+
     # Create title depending on the 'mode':
     if mode == 'os':
-        survival_title:     str             = f"<b>EC Overall Survival</b><br><sup>by <b style='color: green;'>{main_category}</b></sup>"
+        survival_title:     str             = f"<b>EC Overall Survival</b><br><sup>by <b style='color: green;'>{main_category}</b>{facet_title}</sup>"
     if mode =='pfs':
-        survival_title:     str             = f"<b>EC Progression-Free Survival</b><br><sup>by <b style='color: green;'>{main_category}</b></sup>"    
+        survival_title:     str             = f"<b>EC Progression-Free Survival</b><br><sup>by <b style='color: green;'>{main_category}</b>{facet_title}</sup>"    
     # Create survival plot, and table for population at risk by time:
     survival_plot, table_plot               = sp.plotly_survival(   df, 
                                                                     mode, 
                                                                     survival_title, 
                                                                     group_column_name, 
-                                                                    group_categories)
-    # Create histogram plot for all population:
-    category_orders:        dict            = {group_column_name:group_categories}
-    bar_plot:               str             = sp.create_counting_bar_plot(df, 
+                                                                    group_categories,
+                                                                    facet_col_name      = facet_name,
+                                                                    facet_col_groups    = cns.SURVIVAL_GROUPS[facet_name] if facet_name else None,
+                                                                    time_index          = time_index,
+                                                                    rows                = rows)
+    # Create histogram plot for all population, ordered by the column categories:
+    with timing.stage('bar_plot'):
+        bar_plot:           str             = sp.create_counting_bar_plot(df, 
                                                                           group_column_name, 
                                                                           f"<b>EC Population</b><br><sup>by <b style='color: green;'>{main_category}</b>", 
-                                                                          category_orders,
-                                                                          main_category)    
+                                                                          None,
+                                                                          main_category,
+                                                                          rows)
 
     # Create context to return to the 'views.py':
     context:                dict            = { 'survival_plot':        survival_plot,
@@ -78,8 +109,269 @@ def km_category_survival_helper(df:                  pd.DataFrame,
                                                 'survival_mode':        mode,
                                                 'survival_mode_title':  cns.SURVIVAL_MODES[mode],
                                                 'category_title':       main_category,
-                                                'subcategories':        group_categories}
+                                                'subcategories':        group_categories,
+                                                'facet_title':          cns.CATEGORIES_DICT[facet_name] if facet_name else None}
     
     return context
 
 
+# Survival and PF.Survival data related to a clinical category
+# ---------------------------------------------------------------------
+def km_category_survival_data(df:                  pd.DataFrame,
+                              mode:                str,
+                              group_column_name:   str,
+                              group_categories:    list[str],
+                              time_index:          tuple|None  = None,
+                              time_grid:           list|None   = None,
+                              facet_name:          str|None    = None,
+                              rows:                np.ndarray|None = None)->dict:
+    '''
+    Calculate the same survival analysis as 'km_category_survival_helper'
+    but return the Kaplan-Meier step curves, confidence bands, logrank
+    test, at risk table and population counts as plain lists and numbers,
+    ready to be serialized as JSON.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Dataframe to be analyzed.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - group_column_name (str): main category that contain the 
+        group_categories.
+        - group_categories (list[str]): list of the categories included 
+        in group_column_name.
+        - time_index (tuple|None): Optional parameter. Sorted distinct
+        months of the 'mode', shared by all the categories of a batch.
+        - time_grid (list|None): Optional parameter. Months of the at risk
+        table, like every month for an export. By default,
+        'ut_constants.AT_RISK_TIME_GRID'.
+        - facet_name (str|None): Optional parameter. Category splitting
+        the survival analysis. If given, the 'logrank', 'groups' and
+        'at_risk_table' keys are replaced by a 'facets' list with them
+        for each subcategory of 'facet_name'.
+        - rows (np.ndarray|None): Optional parameter. True for the 'df'
+        rows of the analyzed cohort. All the patients by default.
+
+    ## Returns:
+        - payload (dict): JSON serializable survival analysis.
+    '''
+    population:             pd.Series       = sp.category_counts(df[group_column_name], rows)
+    payload:                dict            = { 'mode':             mode,
+                                                'category':         group_column_name}
+
+    if facet_name is None:
+        survival_estimates: dict            = sp.km_survival_estimates(df, mode, group_column_name, group_categories, time_index, rows)
+        payload.update(_estimates_data(survival_estimates, mode, time_grid))
+    else:
+        facets_estimates:   dict            = sp.km_faceted_survival_estimates( df, mode, group_column_name, group_categories,
+                                                                                facet_name, cns.SURVIVAL_GROUPS[facet_name],
+                                                                                time_index, rows)
+        payload['facet']                    = facet_name
+        payload['facets']                   = [{'name': facet, **_estimates_data(survival_estimates, mode, time_grid)}
+                                               for facet, survival_estimates in facets_estimates.items()]
+
+    payload['population']                   = {str(group): int(count) for group, count in population.items() if count > 0}
+
+    return payload
+
+
+# JSON data of a survival analysis
+# ---------------------------------------------------------------------
+def _estimates_data(survival_estimates: dict,
+                    mode:               str,
+                    time_grid:          list|None   = None)->dict:
+    '''
+    Convert the 'km_survival_estimates()' result to the 'logrank',
+    'groups' and 'at_risk_table' keys of the JSON survival analysis.
+    A pvalue that can't be calculated is None.
+    '''
+    logrank:                dict            = survival_estimates['logrank']
+    groups_km_dict:         dict            = survival_estimates['groups_km_dict']
+    p_value:                float|None      = None if np.isnan(logrank['p_value']) else logrank['p_value']
+    test_statistic:         float|None      = None if p_value is None else round(logrank['test_statistic'], JSON_DECIMALS)
+
+    data:                   dict            = { 'logrank':          {   'test_statistic':       test_statistic,
+                                                                        'degrees_of_freedom':   logrank['degrees_of_freedom'],
+                                                                        'p_value':              p_value},
+                                                'groups':           [{  'name':     group,
+                                                                        'size':     group_km['size'],
+                                                                        'timeline': np.round(group_km['timeline'], JSON_DECIMALS).tolist(),
+                                                                        'survival': np.round(group_km['survival'], JSON_DECIMALS).tolist(),
+                                                                        'ci_lower': np.round(group_km['ci_lower'], JSON_DECIMALS).tolist(),
+                                                                        'ci_upper': np.round(group_km['ci_upper'], JSON_DECIMALS).tolist()}
+                                                                     for group, group_km in groups_km_dict.items()],
+                                                'at_risk_table':    sp.at_risk_table_generator(list(groups_km_dict), survival_estimates['event_table'],
+                                                                                               mode, time_grid)}
+
+    return data
+
+
+# =====================================================================
+# BATCH SURVIVAL ANALYSIS
+# =====================================================================
+
+# Survival DataFrame of the batch worker processes:
+_batch_worker_df:   dict    = {}
+
+# Sorted survival DataFrame and shared months index of a mode
+# ---------------------------------------------------------------------
+def sort_by_mode(df:    pd.DataFrame,
+                 mode:  str)->tuple[pd.DataFrame, tuple]:
+    '''
+    Sort the survival DataFrame by the months of the 'mode' and find its
+    distinct months, to be shared by all the analyses of the mode.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Dataframe to be sorted.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+
+    ## Returns a tuple of:
+        - sorted_df (pd.DataFrame): sorted DataFrame.
+        - time_index (tuple): distinct months and the position of each
+        row in them.
+    '''
+    sorted_df:      pd.DataFrame    = df.sort_values(by=f'{mode}_months', ascending=True)
+    time_index:     tuple           = np.unique(sorted_df[f'{mode}_months'].to_numpy(dtype=float), return_inverse=True)
+
+    return (sorted_df, time_index)
+
+
+# One analysis of a batch
+# ---------------------------------------------------------------------
+def _batch_analysis(sorted_df:      pd.DataFrame,
+                    time_index:     tuple,
+                    mode:           str,
+                    clinical_cat:   str,
+                    output:         str)->dict:
+    '''
+    Run the 'output' analysis ('context' or 'data') of a batch.
+    '''
+    if output == 'context':
+        return km_category_survival_helper( sorted_df, mode, clinical_cat, cns.CATEGORIES_DICT[clinical_cat],
+                                            cns.SURVIVAL_GROUPS[clinical_cat], time_index = time_index)
+
+    return km_category_survival_data(sorted_df, mode, clinical_cat, cns.SURVIVAL_GROUPS[clinical_cat], time_index = time_index)
+
+
+# Batch worker process initializer
+# ---------------------------------------------------------------------
+def _init_batch_worker(df: pd.DataFrame):
+    '''
+    Keep the survival DataFrame in the worker process, so it is sent once
+    per worker instead of once per analysis.
+    '''
+    _batch_worker_df.clear()
+    _batch_worker_df['df'] = df
+
+
+# Batch worker process analysis
+# ---------------------------------------------------------------------
+def _batch_worker_analysis(mode:            str,
+                           clinical_cat:    str,
+                           output:          str)->dict:
+    '''
+    Run one analysis of a batch in a worker process, sorting the worker
+    DataFrame once per mode.
+    '''
+    if mode not in _batch_worker_df:
+        _batch_worker_df[mode] = sort_by_mode(_batch_worker_df['df'], mode)
+    sorted_df, time_index   = _batch_worker_df[mode]
+
+    return _batch_analysis(sorted_df, time_index, mode, clinical_cat, output)
+
+
+# Survival analysis for many (mode, clinical category) pairs
+# ---------------------------------------------------------------------
+def km_batch_survival_helper(df:        pd.DataFrame,
+                             specs:     list[tuple[str, str]],
+                             output:    str         = 'context',
+                             processes: int|None    = None)->list[dict]:
+    '''
+    Run the survival analysis of every (mode, clinical category) pair in
+    'specs'. The DataFrame is sorted and its months are indexed once per
+    mode, and every category of the mode reuses them.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Survival Dataframe to be analyzed.
+        - specs (list[tuple[str, str]]): list of (mode, clinical category)
+        pairs to analyze.
+        - output (str): 'context' for the 'km_category_survival_helper'
+        template contexts with the plots, 'data' for the
+        'km_category_survival_data' JSON serializable data.
+        - processes (int|None): Optional parameter. If given, the
+        analyses are computed by a pool of this number of processes,
+        which is useful for the plot serialization of 'context' outputs.
+
+    ## Returns:
+        - results (list[dict]): one result for each pair of 'specs', in
+        the same order.
+    '''
+    if output not in ('context', 'data'):
+        raise ValueError(f"Invalid batch output: {output}")
+    for mode, clinical_cat in specs:
+        if (mode not in cns.SURVIVAL_MODES) or (clinical_cat not in cns.SURVIVAL_GROUPS):
+            raise KeyError(f"Unknown survival analysis: ({mode}, {clinical_cat})")
+
+    if processes:
+        with ProcessPoolExecutor(max_workers = processes,
+                                 initializer = _init_batch_worker,
+                                 initargs    = (df,)) as executor:
+            futures:    list    = [executor.submit(_batch_worker_analysis, mode, clinical_cat, output)
+                                   for mode, clinical_cat in specs]
+            return [future.result() for future in futures]
+
+    results:        list[dict]      = [None] * len(specs)
+    modes:          dict            = {}
+
+    # Group the analyses by mode, keeping their position in 'specs':
+    for position, (mode, clinical_cat) in enumerate(specs):
+        modes.setdefault(mode, []).append((position, clinical_cat))
+
+    for mode, analyses in modes.items():
+        sorted_df, time_index       = sort_by_mode(df, mode)
+        for position, clinical_cat in analyses:
+            results[position]       = _batch_analysis(sorted_df, time_index, mode, clinical_cat, output)
+
+    return results
+
+
+# =====================================================================
+# COX PROPORTIONAL HAZARDS ANALYSIS
+# =====================================================================
+
+# Hazard ratios of clinical categories
+# ---------------------------------------------------------------------
+def cox_survival_data(df:           pd.DataFrame,
+                      mode:         str,
+                      categories:   list[str],
+                      model:        str                 = 'univariate',
+                      rows:         np.ndarray|None     = None)->dict:
+    '''
+    Fit the Cox proportional hazards models of the 'categories' and
+    return their hazard ratios with the forest plot and table.
+
+    ## Parameters:
+        - df (pd.Dataframe): The Survival Dataframe, the same object for
+        every call so its design matrix is built once.
+        - mode (str): Can be Overall (os) or Progression-Free Survival
+        (pfs).
+        - categories (list[str]): clinical categories to analyze.
+        - model (str): 'univariate', one model per category, or
+        'multivariable', one model adjusted by all the categories.
+        - rows (np.ndarray|None): Optional parameter. True for the 'df'
+        rows of the analyzed cohort. All the patients by default.
+
+    ## Returns:
+        - payload (dict): JSON serializable 'ut_cox.cox_analysis()'
+        result, with the 'hazard_ratio_table' rows and the forest plot
+        'figure' data.
+    '''
+    with timing.stage('cox'):
+        payload:            dict            = cox.cox_analysis(df, mode, categories, model, rows)
+
+    with timing.stage('forest_plot'):
+        plot_title:         str             = f"{cns.SURVIVAL_MODES[mode]} {model} hazard ratios"
+        payload['hazard_ratio_table']       = sp.hazard_ratio_table_generator(payload)
+        payload['figure']                   = sp.figure_json(sp.create_forest_plot(payload, plot_title))
+
+    return payload
@@ -0,0 +1,341 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) synthetic survival cohorts.
+#
+# - This file contains the functions to generate survival cohorts of
+#   any size with the same columns and category values as
+#   'survival.csv', for the scaling and load tests:
+#
+#   - synthetic_config(): generator parameters with custom values.
+#   - generate_chunk(): DataFrame of synthetic patients.
+#   - generate_cohort(): synthetic cohort as a stream of chunks.
+#   - synthetic_cohort(): whole synthetic cohort as one DataFrame.
+#   - write_cohort_csv(): stream a cohort to a CSV file.
+#   - write_cohort_columnar(): stream a cohort to columnar files.
+#
+# - Every patient gets a group of each clinical category, drawn with
+#   the 'frequencies' of the configuration. The death and progression
+#   times are exponential, with the baseline monthly hazards multiplied
+#   by the 'hazard_ratios' of the patient groups, and the progression
+#   free survival ends with the first of them. Each
+#   patient is censored at random with probability 'censoring_rate',
+#   and all of them at 'follow_up' months.
+#
+# - A cohort only depends on the seed, the number of patients and the
+#   chunk size: chunk i uses the i-th child of 'np.random.SeedSequence'
+#   of the seed, so the chunks can be generated in any order.
+#
+# - Other modules used are:
+#
+#   - ut_constants
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    pathlib     import  Path
+import  json
+import  numpy       as      np
+import  pandas      as      pd
+from    .           import  ut_constants    as  cns
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Columns of 'survival.csv', in its order:
+SURVIVAL_COLUMNS:       list[str]   = [ 'id', 'pfs_status', 'pfs_months', 'os_status', 'os_months', 'radiotherapy',
+                                        'subtype', 'grade', 'age', 'age_group', 'stage_raw', 'stage', 'tumor_type',
+                                        'height', 'weight', 'bmi', 'bmi_status', 'mol_subtype']
+
+# Default generator parameters. The frequencies are close to the TCGA
+# ones, and the hazard ratios are relative to the first group:
+SYNTHETIC_CONFIG:       dict        = { 'frequencies':      {   'grade':        [0.19, 0.23, 0.58],
+                                                                'tumor_type':   [0.24, 0.76],
+                                                                'mol_subtype':  [0.10, 0.29, 0.30, 0.31],
+                                                                'radiotherapy': [0.44, 0.56],
+                                                                'age_group':    [0.04, 0.06, 0.30, 0.33, 0.27],
+                                                                'stage':        [0.62, 0.10, 0.23, 0.05],
+                                                                'bmi_status':   [0.17, 0.22, 0.61]},
+                                        'hazard_ratios':    {   'grade':        [1.0, 1.3, 2.2],
+                                                                'tumor_type':   [1.8, 1.0],
+                                                                'mol_subtype':  [0.3, 0.8, 0.7, 2.0],
+                                                                'radiotherapy': [1.1, 1.0],
+                                                                'age_group':    [0.6, 0.8, 1.0, 1.2, 1.6],
+                                                                'stage':        [1.0, 1.5, 2.8, 6.0],
+                                                                'bmi_status':   [1.0, 1.0, 1.1]},
+                                        'os_hazard':            0.0012,
+                                        'progression_hazard':   0.0006,
+                                        'censoring_rate':       0.5,
+                                        'follow_up':            60.0}
+
+# Ages and BMI of each group, as [low, high) bounds:
+AGE_BOUNDS:             dict        = { '31-40': (31, 41), '41-50': (41, 51), '51-60': (51, 61), '61-70': (61, 71),
+                                        '>70': (71, 91)}
+BMI_BOUNDS:             dict        = { 'Healthy Weight': (18.5, 25.0), 'Overweight': (25.0, 30.0), 'Obesity': (30.0, 45.0)}
+
+# Patients generated at once:
+CHUNK_SIZE:             int         = 100_000
+
+# Identifier of the patient of each row number:
+ID_FORMAT:              str         = "SYN-{:09d}"
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Generator parameters
+# ---------------------------------------------------------------------
+def synthetic_config(**changes)->dict:
+    '''
+    Return a copy of 'SYNTHETIC_CONFIG' with the 'changes' applied. The
+    'frequencies' and 'hazard_ratios' changes only replace the given
+    categories.
+
+    ## Parameters:
+        - changes: 'SYNTHETIC_CONFIG' keys and their new values.
+
+    ## Return:
+        - config (dict): generator parameters.
+    '''
+    unknown:    set     = set(changes) - set(SYNTHETIC_CONFIG)
+    if unknown:
+        raise KeyError(f"Unknown synthetic cohort parameters: {sorted(unknown)}")
+
+    config:     dict    = {**SYNTHETIC_CONFIG, **changes}
+
+    for name in ('frequencies', 'hazard_ratios'):
+        config[name]    = {**SYNTHETIC_CONFIG[name], **changes.get(name, {})}
+        for clinical_cat, values in config[name].items():
+            if len(values) != len(cns.SURVIVAL_GROUPS[clinical_cat]):
+                raise ValueError(f"'{name}' of '{clinical_cat}' needs one value for each of "
+                                 f"{cns.SURVIVAL_GROUPS[clinical_cat]}")
+    if not 0 <= config['censoring_rate'] < 1:
+        raise ValueError("'censoring_rate' must be in [0, 1).")
+
+    return config
+
+
+# Synthetic patients
+# ---------------------------------------------------------------------
+def generate_chunk(patients:    int,
+                   rng:         np.random.Generator,
+                   config:      dict|None   = None,
+                   first_id:    int         = 0)->pd.DataFrame:
+    '''
+    Generate a DataFrame of synthetic patients with the 'survival.csv'
+    columns. The clinical categories are ordered 'pd.Categorical'
+    columns and the numbers have the 'ut_constants.SURVIVAL_SCHEMA'
+    types.
+
+    ## Parameters:
+        - patients (int): number of patients.
+        - rng (np.random.Generator): random generator.
+        - config (dict|None): Optional parameter. Generator parameters
+        from 'synthetic_config()'. By default, 'SYNTHETIC_CONFIG'.
+        - first_id (int): number of the first patient identifier.
+
+    ## Return:
+        - df (pd.DataFrame): synthetic patients.
+    '''
+    config                      = config or SYNTHETIC_CONFIG
+    codes:          dict        = {}
+    hazard:         np.ndarray  = np.ones(patients)
+
+    # Clinical groups and the hazard ratio of each patient:
+    for clinical_cat, groups in cns.SURVIVAL_GROUPS.items():
+        frequencies:    np.ndarray  = np.asarray(config['frequencies'][clinical_cat], dtype=float)
+        codes[clinical_cat]         = rng.choice(len(groups), size=patients, p=frequencies / frequencies.sum())
+        hazard                     *= np.asarray(config['hazard_ratios'][clinical_cat])[codes[clinical_cat]]
+
+    # Exponential event times, and censoring at random with probability
+    # 'censoring_rate' plus at the end of the follow up:
+    censoring_odds: float       = config['censoring_rate'] / (1 - config['censoring_rate'])
+    death:          np.ndarray  = rng.exponential(1 / (config['os_hazard'] * hazard))
+    progression:    np.ndarray  = np.minimum(rng.exponential(1 / (config['progression_hazard'] * hazard)), death)
+    censoring:      np.ndarray  = np.minimum(rng.exponential(1 / (config['os_hazard'] * hazard * censoring_odds))
+                                             if censoring_odds > 0 else np.inf,
+                                             config['follow_up'])
+
+    df:             pd.DataFrame    = pd.DataFrame({
+        'id':           [ID_FORMAT.format(number) for number in range(first_id, first_id + patients)],
+        'pfs_status':   (progression <= censoring).astype('int8'),
+        'pfs_months':   np.minimum(progression, censoring),
+        'os_status':    (death <= censoring).astype('int8'),
+        'os_months':    np.minimum(death, censoring)})
+
+    for clinical_cat, groups in cns.SURVIVAL_GROUPS.items():
+        df[clinical_cat]        = pd.Categorical.from_codes(codes[clinical_cat], categories=groups, ordered=True)
+
+    # Columns derived from the clinical groups:
+    age_bounds:     np.ndarray  = np.array([AGE_BOUNDS[group] for group in cns.SURVIVAL_GROUPS['age_group']])
+    bmi_bounds:     np.ndarray  = np.array([BMI_BOUNDS[group] for group in cns.SURVIVAL_GROUPS['bmi_status']])
+    height:         np.ndarray  = np.clip(np.round(rng.normal(161, 8, patients)), 135, 195)
+    bmi:            np.ndarray  = rng.uniform(*bmi_bounds[codes['bmi_status']].T)
+
+    df['age']                   = np.floor(rng.uniform(*age_bounds[codes['age_group']].T)).astype('float32')
+    df['subtype']               = pd.Categorical.from_codes(codes['mol_subtype'],
+                                                            categories=["UCEC_" + group.replace('-', '_')
+                                                                        for group in cns.SURVIVAL_GROUPS['mol_subtype']])
+    df['stage_raw']             = pd.Categorical.from_codes(codes['stage'], categories=cns.SURVIVAL_GROUPS['stage'])
+    df['height']                = height.astype('int16')
+    df['weight']                = np.round(bmi * (height / 100) ** 2).astype('int16')
+    df['bmi']                   = bmi.astype('float32')
+
+    return df[SURVIVAL_COLUMNS]
+
+
+# Synthetic cohort as a stream of chunks
+# ---------------------------------------------------------------------
+def generate_cohort(patients:   int,
+                    seed:       int         = 0,
+                    config:     dict|None   = None,
+                    chunk_size: int         = CHUNK_SIZE):
+    '''
+    Generate a synthetic cohort of 'patients' as DataFrames of at most
+    'chunk_size' patients, so cohorts bigger than the memory can be
+    written to disk.
+
+    ## Parameters:
+        - patients (int): number of patients of the cohort.
+        - seed (int): random generator seed.
+        - config (dict|None): Optional parameter. Generator parameters
+        from 'synthetic_config()'. By default, 'SYNTHETIC_CONFIG'.
+        - chunk_size (int): patients of each chunk.
+
+    ## Yield:
+        - chunk (pd.DataFrame): synthetic patients.
+    '''
+    if patients < 1 or chunk_size < 1:
+        raise ValueError("'patients' and 'chunk_size' must be positive.")
+
+    n_chunks:   int     = -(-patients // chunk_size)
+    seeds:      list    = np.random.SeedSequence(seed).spawn(n_chunks)
+
+    for index, chunk_seed in enumerate(seeds):
+        first:  int     = index * chunk_size
+        yield generate_chunk(min(chunk_size, patients - first), np.random.default_rng(chunk_seed), config, first)
+
+
+# Whole synthetic cohort
+# ---------------------------------------------------------------------
+def synthetic_cohort(patients:      int,
+                     seed:          int         = 0,
+                     config:        dict|None   = None,
+                     chunk_size:    int         = CHUNK_SIZE)->pd.DataFrame:
+    '''
+    Generate a synthetic cohort of 'patients' as one DataFrame, with the
+    same content as the chunks of 'generate_cohort()'.
+
+    ## Parameters:
+        - patients (int): number of patients of the cohort.
+        - seed (int): random generator seed.
+        - config (dict|None): Optional parameter. Generator parameters.
+        - chunk_size (int): patients of each chunk.
+
+    ## Return:
+        - df (pd.DataFrame): synthetic cohort.
+    '''
+    return pd.concat(generate_cohort(patients, seed, config, chunk_size), ignore_index=True)
+
+
+# Write a synthetic cohort as CSV
+# ---------------------------------------------------------------------
+def write_cohort_csv(path:          Path,
+                     patients:      int,
+                     seed:          int         = 0,
+                     config:        dict|None   = None,
+                     chunk_size:    int         = CHUNK_SIZE)->Path:
+    '''
+    Write a synthetic cohort to a CSV file with the 'survival.csv'
+    format, one chunk at a time.
+
+    ## Parameters:
+        - path (Path): CSV file.
+        - patients (int): number of patients of the cohort.
+        - seed (int): random generator seed.
+        - config (dict|None): Optional parameter. Generator parameters.
+        - chunk_size (int): patients of each chunk.
+
+    ## Return:
+        - path (Path): written CSV file.
+    '''
+    path                    = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, 'w', newline='') as csv_file:
+        for index, chunk in enumerate(generate_cohort(patients, seed, config, chunk_size)):
+            chunk.to_csv(csv_file, index=False, header=(index == 0))
+
+    return path
+
+
+# Write a synthetic cohort as columnar files
+# ---------------------------------------------------------------------
+def write_cohort_columnar(directory:    Path,
+                          patients:     int,
+                          seed:         int         = 0,
+                          config:       dict|None   = None,
+                          chunk_size:   int         = CHUNK_SIZE)->Path:
+    '''
+    Write a synthetic cohort with the columnar format of
+    'tcga_read_csv.write_columnar_survival()', one chunk at a time: each
+    column is a preallocated memory-mapped '.npy' file filled by slices,
+    and the identifiers are stored as their row numbers and 'ID_FORMAT'.
+    The dataset can be read with 'tcga_read_csv.read_columnar_survival()'.
+
+    ## Parameters:
+        - directory (Path): destination folder.
+        - patients (int): number of patients of the cohort.
+        - seed (int): random generator seed.
+        - config (dict|None): Optional parameter. Generator parameters.
+        - chunk_size (int): patients of each chunk.
+
+    ## Return:
+        - directory (Path): folder containing the columnar dataset.
+    '''
+    directory                   = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    files:          dict        = {}
+    columns:        list        = []
+    start:          int         = 0
+
+    for chunk in generate_cohort(patients, seed, config, chunk_size):
+        if not files:
+            for position, name in enumerate(SURVIVAL_COLUMNS):
+                filename:   str     = f"{position:03d}.npy"
+                entry:      dict    = {'name': name, 'file': filename, 'kind': 'numeric'}
+                dtype:      np.dtype = chunk[name].dtype
+                if isinstance(dtype, pd.CategoricalDtype):
+                    entry.update(kind = 'dictionary', values = [str(value) for value in dtype.categories],
+                                 ordered = bool(dtype.ordered))
+                    dtype       = np.min_scalar_type(-len(dtype.categories))
+                elif name == 'id':
+                    # The identifiers are the row numbers, formatted when read:
+                    entry.update(kind = 'pattern', format = ID_FORMAT)
+                    dtype       = np.min_scalar_type(patients)
+                files[name]     = np.lib.format.open_memmap(directory/filename, mode='w+', dtype=dtype,
+                                                            shape=(patients,))
+                columns.append(entry)
+
+        stop:       int         = start + len(chunk)
+        for entry in columns:
+            column: pd.Series   = chunk[entry['name']]
+            if entry['name'] == 'id':
+                files['id'][start:stop]         = np.arange(start, stop)
+            elif entry['kind'] == 'dictionary':
+                files[entry['name']][start:stop] = column.cat.codes.to_numpy()
+            else:
+                files[entry['name']][start:stop] = column.to_numpy()
+        start                   = stop
+
+    for values in files.values():
+        values.flush()
+
+    # A synthetic dataset never matches the 'survival.csv' fingerprint:
+    manifest:       dict        = { 'source_fingerprint':   f"synthetic-{seed}-{patients}-{chunk_size}",
+                                    'rows':                 patients,
+                                    'columns':              columns}
+    (directory/"manifest.json").write_text(json.dumps(manifest, indent=1))
+
+    return directory
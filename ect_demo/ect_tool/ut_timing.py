@@ -0,0 +1,202 @@
+#   App Name:   Endometrial Cancer Tool (Demo).
+#   Author:     Xavier Llobet Navàs.
+#   Content:    ECT (Demo) request stage timers.
+#
+# - This file contains the timers of the survival request stages (sort,
+#   logrank, Kaplan-Meier fit, figure, annotations, serialization,
+#   template rendering...) and the ways to report them:
+#
+#   - stage(): context manager timing a stage of the current request.
+#   - server_timing_middleware(): Django middleware that times each
+#     request, sends a 'Server-Timing' header and a log line, and
+#     records the metrics.
+#   - record_metrics(): add stage timings to the in-process histograms.
+#   - render_metrics(): histograms in Prometheus text format.
+#
+# - The timers only work when the ECT_STAGE_TIMING setting is True.
+#   Otherwise the middleware removes itself from the middleware chain
+#   and 'stage()' returns a shared do-nothing context manager. The
+#   histograms are also kept when the ECT_STAGE_METRICS setting is True.
+#
+# =====================================================================
+# IMPORTS
+# =====================================================================
+
+from    contextlib          import  contextmanager, nullcontext
+from    contextvars         import  ContextVar
+from    django.conf         import  settings
+from    django.core.exceptions  import  MiddlewareNotUsed
+import  json
+import  logging
+import  threading
+import  time
+
+# =====================================================================
+# GLOBAL VARIABLES
+# =====================================================================
+
+# Stage timings of the current request, None when not timing:
+_timings:           ContextVar      = ContextVar('ect_stage_timings', default=None)
+
+# Shared context manager of the stages that are not timed:
+_NOT_TIMED:         nullcontext     = nullcontext()
+
+logger:             logging.Logger  = logging.getLogger('ect_tool.timing')
+
+# Upper bounds, in seconds, of the histogram buckets:
+HISTOGRAM_BUCKETS:  tuple           = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_NAME:        str             = 'ect_stage_duration_seconds'
+
+# Histogram of each stage: bucket counts, sum and count.
+_histograms:        dict            = {}
+_histograms_lock:   threading.Lock  = threading.Lock()
+
+# =====================================================================
+# FUNCTIONS
+# =====================================================================
+
+# Time a stage
+# ---------------------------------------------------------------------
+@contextmanager
+def _timed_stage(name:      str,
+                 timings:   dict):
+    '''
+    Add the time spent in the 'with' block to the 'name' stage.
+    '''
+    start:      float   = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name]   = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+# ---------------------------------------------------------------------
+def stage(name: str):
+    '''
+    Context manager timing the 'name' stage of the current request. The
+    time of a stage entered more than once is added up.
+
+    ## Parameters:
+        - name (str): stage name, a token like 'km_fit'.
+
+    ## Return:
+        - context (contextmanager): stage timer, or a do-nothing context
+        manager when the request is not timed.
+    '''
+    timings:    dict|None   = _timings.get()
+
+    if timings is None:
+        return _NOT_TIMED
+
+    return _timed_stage(name, timings)
+
+
+# Server-Timing header
+# ---------------------------------------------------------------------
+def server_timing_header(timings: dict[str:float])->str:
+    '''
+    Format the stage timings as a 'Server-Timing' header value.
+
+    ## Parameters:
+        - timings (dict[str:float]): stage name as key, and its seconds as
+        value.
+
+    ## Return:
+        - header (str): like 'sort;dur=1.23, total;dur=45.60', in ms.
+    '''
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
+
+
+# Add timings to the histograms
+# ---------------------------------------------------------------------
+def record_metrics(timings: dict[str:float]):
+    '''
+    Add the stage timings to the in-process histograms.
+
+    ## Parameters:
+        - timings (dict[str:float]): stage name as key, and its seconds as
+        value.
+    '''
+    with _histograms_lock:
+        for name, seconds in timings.items():
+            histogram:  dict    = _histograms.setdefault(name, {'buckets':  [0] * len(HISTOGRAM_BUCKETS),
+                                                                'sum':      0.0,
+                                                                'count':    0})
+            for index, bound in enumerate(HISTOGRAM_BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['sum']   += seconds
+            histogram['count'] += 1
+
+
+# ---------------------------------------------------------------------
+def reset_metrics():
+    '''
+    Remove all the recorded histograms.
+    '''
+    with _histograms_lock:
+        _histograms.clear()
+
+
+# Prometheus text format
+# ---------------------------------------------------------------------
+def render_metrics()->str:
+    '''
+    Format the stage histograms in the Prometheus text exposition
+    format.
+
+    ## Return:
+        - metrics (str): text of the metrics endpoint.
+    '''
+    lines:      list[str]   = [ f"# HELP {METRIC_NAME} Time spent in each stage of the ECT requests.",
+                                f"# TYPE {METRIC_NAME} histogram"]
+
+    with _histograms_lock:
+        for name, histogram in sorted(_histograms.items()):
+            for bound, count in zip(HISTOGRAM_BUCKETS, histogram['buckets']):
+                lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{METRIC_NAME}_sum{{stage="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'{METRIC_NAME}_count{{stage="{name}"}} {histogram["count"]}')
+
+    return "\n".join(lines) + "\n"
+
+
+# Server-Timing middleware
+# ---------------------------------------------------------------------
+def server_timing_middleware(get_response):
+    '''
+    Django middleware timing the stages of every request. The timings,
+    plus the 'total' request time, are sent as a 'Server-Timing' header
+    and as a JSON log line of the 'ect_tool.timing' logger, and recorded
+    in the histograms when ECT_STAGE_METRICS is True.
+
+    Not used unless the ECT_STAGE_TIMING setting is True.
+    '''
+    if not getattr(settings, 'ECT_STAGE_TIMING', False):
+        raise MiddlewareNotUsed()
+
+    metrics:    bool    = getattr(settings, 'ECT_STAGE_METRICS', False)
+
+    def middleware(request):
+        timings:    dict    = {}
+        token               = _timings.set(timings)
+        start:      float   = time.perf_counter()
+        try:
+            response        = get_response(request)
+        finally:
+            _timings.reset(token)
+        timings['total']    = time.perf_counter() - start
+
+        response['Server-Timing']   = server_timing_header(timings)
+        logger.info(json.dumps({'path':     request.path,
+                                'method':   request.method,
+                                'status':   response.status_code,
+                                'stages':   {name: round(seconds * 1000, 3) for name, seconds in timings.items()}}))
+        if metrics:
+            record_metrics(timings)
+
+        return response
+
+    return middleware
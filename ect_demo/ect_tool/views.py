@@ -16,14 +16,30 @@
 # - EC Tool (Demo), can plot with no need of statistical knowledge, Progression-Free
 #   and Overall survival for some clinical categories.
 #
+# - Survival API, returns the same survival analysis as JSON data, for
+#   one or many (mode, clinical category) pairs.
+#
+# - Cox API, returns the hazard ratios of the clinical categories groups,
+#   with their table and forest plot.
+#
+# - Async views, the EC Tool and the single analysis API for ASGI
+#   servers, computing the missing analyses in worker processes. Used
+#   instead of the sync ones when ECT_ASYNC_VIEWS is True.
+#
+# - Metrics, stage timing histograms in Prometheus text format.
+#
 # =====================================================================
 # IMPORTS
 # =====================================================================
 
+from            django.conf                 import  settings
+from            django.http                 import  Http404, HttpResponse, HttpResponseNotAllowed
 from            django.shortcuts            import  render
-import          pandas                          as  pd
+from            django.utils.cache          import  get_conditional_response
+from            django.views.decorators.http    import  condition, require_GET
 from .  import  ut_constants                    as  cns
-from .  import  ut_survival                     as  surv
+from .  import  ut_http                         as  http
+from .  import  ut_timing                       as  timing
 
 
 # =====================================================================
@@ -66,37 +82,80 @@ def ect(request):
         context:    dict    = { 'title':    'Endometrial Cancer Tool (Demo)',
                                 'field':    'ect'}
 
+        # The browser draws the figures from the survival API data:
+        if getattr(settings, 'ECT_CLIENT_RENDERING', False):
+            from .  import  plotly_survival_plots   as  sp
+            context['client_settings']  = sp.client_figure_settings()
+
         return render(request, 'ect_tool/base_ect.html', context)
 
     # New
     if request.method == 'POST':
 
         # Get input values
-        mode:           str             = request.POST['survival_type']
-        clinical_cat:   str             = request.POST['clinical_category']
-
-        # Sorting the survival dataframe by the PFS
-        df:             pd.DataFrame    = cns.SURVIVAL
-        sorted_df:      pd.DataFrame    = df.sort_values(by=f'{mode}_months', ascending=True)
-
-        # Entire category name:
-        main_category:  str             = cns.CATEGORIES_DICT[clinical_cat]
-                    
-        # Molecular subtype categories:
-        subtype_catgs:  list[str]       = cns.SURVIVAL_GROUPS[clinical_cat]
-        
-        # Template context data
-        context:        dict            = surv.km_category_survival_helper( sorted_df, 
-                                                                            mode,
-                                                                            clinical_cat,
-                                                                            main_category,
-                                                                            subtype_catgs)
+        try:
+            mode, clinical_cat, facet, cohort   = ect_form_analysis(request)
+        except ValueError as error:
+            return cohort_error_response(request, error)
+
+        # Imported on first use, so the other views don't load the
+        # scientific libraries:
+        from .  import  ut_cache        as  cache
+
+        # Template context data, computed once per dataset version:
+        with timing.stage('cache'):
+            context:    dict            = cache.get_category_context(mode, clinical_cat, facet, cohort)
         
         context['title']                = 'Endometrial Cancer Tool (Demo)'
         context['field']                = 'ect'
 
-        return render(request, 'ect_tool/base_ect.html', context)
+        with timing.stage('render'):
+            return render(request, 'ect_tool/base_ect.html', context)
     
+# Analysis requested by the EC Tool form
+# ---------------------------------------------------------------------
+def ect_form_analysis(request)->tuple[str, str, str|None, str|None]:
+    '''
+    Return the mode, clinical category, facet and cohort filter sent by
+    the EC Tool form. The optional category splitting the analysis is
+    ignored if it is the analyzed one. An invalid cohort filter raises a
+    ValueError.
+    '''
+    mode:           str             = request.POST['survival_type']
+    clinical_cat:   str             = request.POST['clinical_category']
+    facet:          str|None        = request.POST.get('facet_category') or None
+    if facet == clinical_cat:
+        facet                       = None
+    cohort:         str|None        = cohort_parameter(request.POST.get('cohort'))
+
+    return (mode, clinical_cat, facet, cohort)
+
+# Cohort filter parameter
+# ---------------------------------------------------------------------
+def cohort_parameter(text: str|None)->str|None:
+    '''
+    Return the canonical text of a cohort filter parameter, see
+    'ut_cohort', or None if it is empty. An invalid filter raises a
+    ValueError.
+    '''
+    if not (text and text.strip()):
+        return None
+
+    from .  import  ut_cohort       as  coh
+
+    return coh.cohort_text(coh.parse_cohort(text))
+
+# ---------------------------------------------------------------------
+def cohort_error_response(request, error: ValueError):
+    '''
+    EC Tool page with the error of an invalid cohort filter.
+    '''
+    context:        dict            = { 'title':        'Endometrial Cancer Tool (Demo)',
+                                        'field':        'ect',
+                                        'cohort_error': str(error)}
+
+    return render(request, 'ect_tool/base_ect.html', context, status=400)
+
 # ---------------------------------------------------------------------
 def cite_us(request):
     '''
@@ -115,4 +174,317 @@ def cite_us(request):
         context:    dict    = { 'title':    'Endometrial Cancer Tool (Demo)',
                                 'field':    'cite_us'}
 
-        return render(request, 'ect_tool/base_cite_us.html', context)
\ No newline at end of file
+        return render(request, 'ect_tool/base_cite_us.html', context)
+
+
+# =====================================================================
+# SURVIVAL API VIEWS
+# =====================================================================
+
+# ETag of the requested survival analysis
+# ---------------------------------------------------------------------
+def survival_etag(request)->str|None:
+    '''
+    Return the ETag of the analysis requested to 'api_survival', or
+    None if the request parameters are not valid.
+    '''
+    mode:           str|None        = request.GET.get('mode')
+    clinical_cat:   str|None        = request.GET.get('category')
+    facet:          str|None        = request.GET.get('facet') or None
+
+    if (mode not in cns.SURVIVAL_MODES) or (clinical_cat not in cns.SURVIVAL_GROUPS):
+        return None
+    if (facet is not None) and (facet not in cns.SURVIVAL_GROUPS or facet == clinical_cat):
+        return None
+    try:
+        cohort:     str|None        = cohort_parameter(request.GET.get('cohort'))
+    except ValueError:
+        return None
+
+    from .  import  ut_cache        as  cache
+
+    return cache.category_etag(mode, clinical_cat, facet, cohort)
+
+# ---------------------------------------------------------------------
+@require_GET
+@condition(etag_func=survival_etag)
+@http.compress_response
+def api_survival(request):
+    '''
+    JSON view with the Kaplan-Meier curves, confidence bands, logrank
+    test, at risk table and population of a clinical category.
+
+    ## Query parameters:
+        - mode: Overall (os) or Progression-Free Survival (pfs).
+        - category: clinical category, one of 'ut_constants.CATEGORIES'.
+        - facet: Optional. Another clinical category splitting the
+        analysis, with one set of curves and logrank test per group.
+        - cohort: Optional. Filter of the patients to analyze, like
+        'stage:Stage III|stage:Stage IV,grade:G3,!radiotherapy:Yes'
+        (see 'ut_cohort').
+    '''
+
+    error:          HttpResponse|None   = survival_parameters_error(request)
+
+    if error is not None:
+        return error
+
+    from .  import  ut_cache        as  cache
+
+    return http.compact_json_response(cache.get_category_payload(request.GET['mode'],
+                                                                 request.GET['category'],
+                                                                 request.GET.get('facet') or None,
+                                                                 cohort_parameter(request.GET.get('cohort'))))
+
+# Errors of the survival API parameters
+# ---------------------------------------------------------------------
+def survival_parameters_error(request)->HttpResponse|None:
+    '''
+    Return the 400 response for the invalid parameters of a request to
+    'api_survival', or None if they are valid.
+    '''
+    mode:           str|None        = request.GET.get('mode')
+    clinical_cat:   str|None        = request.GET.get('category')
+    facet:          str|None        = request.GET.get('facet') or None
+
+    if mode not in cns.SURVIVAL_MODES:
+        return http.compact_json_response({'error': f"'mode' must be one of {list(cns.SURVIVAL_MODES)}"}, status=400)
+    if clinical_cat not in cns.SURVIVAL_GROUPS:
+        return http.compact_json_response({'error': f"'category' must be one of {cns.CATEGORIES}"}, status=400)
+    if (facet is not None) and (facet not in cns.SURVIVAL_GROUPS or facet == clinical_cat):
+        return http.compact_json_response({'error': f"'facet' must be one of {cns.CATEGORIES} other than 'category'"},
+                                          status=400)
+    try:
+        cohort_parameter(request.GET.get('cohort'))
+    except ValueError as error:
+        return http.compact_json_response({'error': f"'cohort' is not valid. {error}"}, status=400)
+    return None
+
+# Requested survival analyses of a batch
+# ---------------------------------------------------------------------
+def batch_specs(request)->list[tuple[str, str]]|None:
+    '''
+    Return the (mode, clinical category) pairs requested to
+    'api_survival_batch' as 'analysis=mode:category' parameters, all of
+    them when none is given, or None if any of them is not valid.
+    '''
+    analyses:       list[str]       = request.GET.getlist('analysis')
+
+    if not analyses:
+        return [(mode, clinical_cat) for mode in cns.SURVIVAL_MODES for clinical_cat in cns.CATEGORIES]
+
+    specs:          list[tuple]     = [tuple(analysis.split(':', 1)) for analysis in analyses]
+
+    for spec in specs:
+        if (len(spec) != 2) or (spec[0] not in cns.SURVIVAL_MODES) or (spec[1] not in cns.SURVIVAL_GROUPS):
+            return None
+
+    return specs
+
+# ---------------------------------------------------------------------
+def survival_batch_etag(request)->str|None:
+    '''
+    Return the ETag of the analyses requested to 'api_survival_batch',
+    or None if the request parameters are not valid.
+    '''
+    specs:          list|None       = batch_specs(request)
+
+    if specs is None:
+        return None
+
+    from .  import  ut_cache        as  cache
+
+    return cache.batch_etag(specs)
+
+# ---------------------------------------------------------------------
+@require_GET
+@condition(etag_func=survival_batch_etag)
+@http.compress_response
+def api_survival_batch(request):
+    '''
+    JSON view with a list of 'api_survival' results, computed together
+    sorting the dataset once per mode.
+
+    ## Query parameters:
+        - analysis: 'mode:category' pair, like 'os:grade'. Can be
+        repeated. Default: every mode and clinical category.
+    '''
+
+    specs:          list|None       = batch_specs(request)
+
+    if specs is None:
+        return http.compact_json_response({'error': "'analysis' must be 'mode:category' pairs, like 'os:grade'"},
+                                          status=400)
+
+    from .  import  ut_cache        as  cache
+
+    return http.compact_json_response(cache.get_batch(specs, 'payload'))
+
+
+# Requested Cox analysis
+# ---------------------------------------------------------------------
+def cox_analysis_parameters(request)->tuple[str|None, list[str], str]:
+    '''
+    Return the mode, clinical categories (all of them when none is
+    given) and model requested to 'api_cox'. They are not checked.
+    '''
+    return (request.GET.get('mode'),
+            request.GET.getlist('category') or cns.CATEGORIES,
+            request.GET.get('model') or 'univariate')
+
+# ---------------------------------------------------------------------
+def cox_etag(request)->str|None:
+    '''
+    Return the ETag of the analysis requested to 'api_cox', or None if
+    the request parameters are not valid.
+    '''
+    from .  import  ut_cache        as  cache
+
+    mode, categories, model         = cox_analysis_parameters(request)
+
+    if not cache.is_valid_cox_analysis(mode, categories, model):
+        return None
+    try:
+        cohort:     str|None        = cohort_parameter(request.GET.get('cohort'))
+    except ValueError:
+        return None
+
+    return cache.cox_etag(mode, categories, model, cohort)
+
+# ---------------------------------------------------------------------
+@require_GET
+@condition(etag_func=cox_etag)
+@http.compress_response
+def api_cox(request):
+    '''
+    JSON view with the Cox proportional hazards ratios, 95% confidence
+    intervals and pvalues of the groups of some clinical categories,
+    with their table and forest plot figure.
+
+    ## Query parameters:
+        - mode: Overall (os) or Progression-Free Survival (pfs).
+        - category: clinical category, one of 'ut_constants.CATEGORIES'.
+        Can be repeated. Default: all of them.
+        - model: Optional. 'univariate' (default), one model for each
+        category, or 'multivariable', one model adjusted by all of them.
+        - cohort: Optional. Filter of the patients to analyze (see
+        'ut_cohort').
+    '''
+    from .  import  ut_cache        as  cache
+
+    mode, categories, model         = cox_analysis_parameters(request)
+
+    if not cache.is_valid_cox_analysis(mode, categories, model):
+        return http.compact_json_response({'error': f"'mode' must be one of {list(cns.SURVIVAL_MODES)}, 'category' "
+                                                    f"different items of {cns.CATEGORIES} and 'model' "
+                                                    f"'univariate' or 'multivariable'"}, status=400)
+    try:
+        cohort:     str|None        = cohort_parameter(request.GET.get('cohort'))
+    except ValueError as error:
+        return http.compact_json_response({'error': f"'cohort' is not valid. {error}"}, status=400)
+
+    return http.compact_json_response(cache.get_cox_payload(mode, categories, model, cohort))
+
+# =====================================================================
+# ASYNC VIEWS
+# =====================================================================
+
+# EC Tool view for ASGI servers:
+# ---------------------------------------------------------------------
+async def ect_async(request):
+    '''
+    Async version of 'ect'. A missing analysis is computed by a worker
+    process of 'ut_async', so a slow analysis does not block the server.
+    '''
+
+    if request.method != 'POST':
+        return ect(request)
+
+    # Get input values
+    try:
+        mode, clinical_cat, facet, cohort   = ect_form_analysis(request)
+    except ValueError as error:
+        return cohort_error_response(request, error)
+
+    from .  import  ut_async        as  asyn
+
+    # Template context data, computed once per dataset version:
+    try:
+        with timing.stage('cache'):
+            context:    dict            = dict(await asyn.get_result('context', mode, clinical_cat, facet, cohort))
+    except asyn.Full:
+        return busy_response(HttpResponse("The server is busy, please try again later.", status=503))
+
+    context['title']                    = 'Endometrial Cancer Tool (Demo)'
+    context['field']                    = 'ect'
+
+    with timing.stage('render'):
+        return render(request, 'ect_tool/base_ect.html', context)
+
+# ---------------------------------------------------------------------
+async def api_survival_async(request):
+    '''
+    Async version of 'api_survival', with the same parameters, ETag and
+    compression. A missing analysis is computed by a worker process of
+    'ut_async'.
+    '''
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    etag:           str|None            = survival_etag(request)
+    not_modified:   HttpResponse|None   = get_conditional_response(request, etag=etag) if etag else None
+
+    if not_modified is not None:
+        return not_modified
+
+    error:          HttpResponse|None   = survival_parameters_error(request)
+
+    if error is not None:
+        return error
+
+    from .  import  ut_async        as  asyn
+
+    try:
+        payload:    dict                = await asyn.get_result('payload',
+                                                                request.GET['mode'],
+                                                                request.GET['category'],
+                                                                request.GET.get('facet') or None,
+                                                                cohort_parameter(request.GET.get('cohort')))
+    except asyn.Full:
+        return busy_response(http.compact_json_response({'error': "The server is busy, please try again later."},
+                                                        status=503))
+
+    response:       HttpResponse        = http.compact_json_response(payload)
+    response['ETag']                    = etag
+
+    return http.compress(request, response)
+
+# Server busy response
+# ---------------------------------------------------------------------
+def busy_response(response: HttpResponse)->HttpResponse:
+    '''
+    Add to a 503 'response' the seconds the client should wait before
+    trying again.
+    '''
+    from .  import  ut_async        as  asyn
+
+    response['Retry-After']             = str(asyn.RETRY_AFTER)
+
+    return response
+
+
+# =====================================================================
+# METRICS VIEW
+# =====================================================================
+
+# ---------------------------------------------------------------------
+@require_GET
+def metrics(request):
+    '''
+    Stage timing histograms in Prometheus text format. Only available
+    when the ECT_STAGE_TIMING and ECT_STAGE_METRICS settings are True.
+    '''
+    if not (getattr(settings, 'ECT_STAGE_TIMING', False) and getattr(settings, 'ECT_STAGE_METRICS', False)):
+        raise Http404("Stage metrics are disabled.")
+
+    return HttpResponse(timing.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')